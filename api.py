@@ -1,11 +1,23 @@
-from typing import Dict, List, Union
+import time
+
+# (start of the import time measurement, see _report_import_time below)
+API_IMPORT_START_TIME = time.perf_counter()
+
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Union
 
 from fastapi import FastAPI, BackgroundTasks
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
 from utils.localCORS import permitReactLocalhostClient
-from utils.ai import enable_llm_cache
-from utils.db import get_astra_db_client
+from utils.ai import enable_llm_cache, llm_cache_stats
+from utils.db import close_async_astra_db_client
 from utils.models import (
+    BulkReviewSubmitRequest,
+    BulkReviewSubmitResponse,
     CustomizedHotelDetails,
     Hotel,
     HotelDetailsRequest,
@@ -17,59 +29,212 @@ from utils.models import (
     UserProfile,
 )
 
-from utils.review_llm import summarize_reviews_for_hotel, summarize_reviews_for_user
+from utils.ingestion import (
+    review_ingestion_queue,
+    asubmit_review_for_hotel,
+    asubmit_reviews_bulk,
+)
+from utils.review_llm import asummarize_reviews_for_user, astream_summarize_reviews_for_user
+from utils.semantic_cache import semantic_summary_cache_stats
+from utils.review_vector_index import review_vector_index_stats
 from utils.reviews import (
-    select_general_hotel_reviews,
-    insert_review_for_hotel,
-    select_hotel_reviews_for_user,
-    select_review_count_by_hotel
+    aselect_general_hotel_reviews,
+    aselect_hotel_reviews_for_user,
 )
 from utils.users import (
-    read_user_profile,
-    write_user_profile,
-    update_user_travel_profile_summary,
+    aread_user_profile,
+    aread_user_profile_with_vector,
+    awrite_user_profile,
+    aupdate_user_travel_profile_summary,
+    aget_default_travel_profile_vector,
+    aembed_travel_profile_summary,
 )
-from utils.hotels import find_hotels_by_location, find_hotel_by_id
+from utils.hotels import afind_hotels_by_location, afind_hotel_by_id, hotel_cache_stats
+from utils.http_pool import http_pool_stats
+from utils.instrumentation import TimingMiddleware, register_gauges, render_metrics
+from utils.summaries import (
+    aread_base_hotel_summary,
+    agenerate_base_hotel_summary,
+    astream_generate_base_hotel_summary,
+    arefresh_base_hotel_summary,
+)
+from utils.stages import StageGraph
 from utils.strings import DEFAULT_TRAVEL_PROFILE_SUMMARY
+from utils.warmup import awarm_up, format_step_timings
+
+
+# startup
+
+# Importing this module sets up nothing but the app: the Astra DB clients, the LLM,
+# the embeddings (and LangChain itself) are created on first use. Besides:
+#   "lazy" (default): the LLM cache is enabled in the background right after startup
+#       (requests served before that are not cached), then the optional warm-up runs;
+#   "eager": the LLM cache and the full warm-up are done before the app starts serving
+#       (any failure, e.g. wrong credentials, then stops the startup).
+API_STARTUP_MODE = os.environ.get("API_STARTUP_MODE", "lazy")
+# "1": in lazy mode, warm up in the background after startup (connections, LLM, caches)
+API_WARMUP = os.environ.get("API_WARMUP", "0") == "1"
+# If set, importing this module beyond this many milliseconds prints a warning
+API_IMPORT_BUDGET_MS = float(os.environ.get("API_IMPORT_BUDGET_MS", "0"))
+
+startup_stats: Dict[str, float] = {}
+
+
+def _report_import_time():
+    import_ms = startup_stats["import_seconds"] * 1000
+    if "TERSE_LOGGING" not in os.environ:
+        print(f"[api.py] Imported in {import_ms:.0f}ms")
+    if API_IMPORT_BUDGET_MS and import_ms > API_IMPORT_BUDGET_MS:
+        print(
+            f"[api.py] WARNING: import took {import_ms:.0f}ms, beyond the {API_IMPORT_BUDGET_MS:.0f}ms budget "
+            "(see python -m benchmarks.cold_start)"
+        )
 
 
-# init
+async def _aprepare(warm_up: bool, raise_errors: bool):
+    prepare_start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, enable_llm_cache)
+    step_timings = await awarm_up(raise_errors=raise_errors) if warm_up else {}
+    startup_stats["prepare_seconds"] = time.perf_counter() - prepare_start
+    if "TERSE_LOGGING" not in os.environ:
+        print(
+            f"[api.py] LLM cache enabled{' and warm-up done' if warm_up else ''} "
+            f"in {startup_stats['prepare_seconds'] * 1000:.0f}ms ({format_step_timings(step_timings) or 'no warm-up'})"
+        )
 
 
-def init():
-    _ = get_astra_db_client()
-    enable_llm_cache()
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    startup_start = time.perf_counter()
+    review_ingestion_queue.start()
+    # (in the background in both modes: a database outage must not prevent the startup)
+    recovery = asyncio.ensure_future(review_ingestion_queue.arecover_pending())
+    if API_STARTUP_MODE == "eager":
+        await _aprepare(warm_up=True, raise_errors=True)
+        preparation = None
+    else:
+        preparation = asyncio.ensure_future(_aprepare(warm_up=API_WARMUP, raise_errors=False))
+    startup_stats["startup_seconds"] = time.perf_counter() - startup_start
+
+    yield
+
+    for background_task in (preparation, recovery):
+        if background_task is not None:
+            background_task.cancel()
+            await asyncio.gather(background_task, return_exceptions=True)
+    # pending reviews are written before the client goes away
+    await review_ingestion_queue.stop()
+    await close_async_astra_db_client()
 
 
 # app
 
-init()
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 permitReactLocalhostClient(app)
+# per-stage timings: Server-Timing response header and /metrics histograms
+app.add_middleware(TimingMiddleware, routed_app=app)
+register_gauges(
+    "hotels_app_startup",
+    "Import, startup and preparation (LLM cache, warm-up) durations in seconds.",
+    lambda: startup_stats,
+)
+register_gauges(
+    "hotels_app_hotel_cache",
+    "Hotel cache statistics.",
+    hotel_cache_stats,
+)
+register_gauges(
+    "hotels_app_http_pool",
+    "Data API connection pools: connections, requests and utilization, by client.",
+    http_pool_stats,
+)
+register_gauges(
+    "hotels_app_llm_cache_tiers",
+    "LLM cache statistics by tier (in-process, then Astra DB).",
+    llm_cache_stats,
+)
+register_gauges(
+    "hotels_app_semantic_summary_cache",
+    "Semantic cache of the personalized summaries (opt-in).",
+    semantic_summary_cache_stats,
+)
+register_gauges(
+    "hotels_app_review_vector_index",
+    "In-process vector index of the reviews, by hotel (opt-in).",
+    review_vector_index_stats,
+)
+register_gauges(
+    "hotels_app_review_ingestion",
+    "Review ingestion queue statistics (depth, lag, counters).",
+    review_ingestion_queue.stats,
+)
+
+
+# Metrics in the Prometheus text format: stage and request durations
+# (by endpoint), LLM cache hits/misses, hotel cache and ingestion queue statistics.
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def _report_stage_timings(endpoint_name: str, stage_graph: StageGraph):
+    if "TERSE_LOGGING" not in os.environ:
+        print(f"[{endpoint_name}] stage timings: {stage_graph.format_timings()}")
+
+
+# Server-Sent Events for the streaming endpoints. The events are:
+#   "reviews": the reviews (plus request_id or hotel name), first thing sent
+#   "bullet": one bullet point of the summary, as soon as it is available
+#   "done": end of the stream
+#   "error": something went wrong (the stream ends)
+def _sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+def _sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    async def _guarded_events():
+        try:
+            async for event in events:
+                yield event
+            yield _sse_event("done", {})
+        except Exception as e:
+            yield _sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        _guarded_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
 
 
 # Endpoint that retrieves the travel preferences (base + additional prefs) of the specified user.
 # This has been implemented (TODO remove this note)
 # TODO should this just be a GET, e.g. /v1/user_profile/{user_id} ?
 @app.post("/v1/get_user_profile")
-def get_user_profile(payload: UserRequest) -> Union[UserProfile, None]:
-    return read_user_profile(payload.user_id)
+async def get_user_profile(payload: UserRequest) -> Union[UserProfile, None]:
+    return await aread_user_profile(payload.user_id)
 
 
 # Endpoint that stores the travel preferences (base + additional prefs) of the specified user.
 # It also calls the LLM to create the travel profile summary, and stores the summary in the user's profile.
 # This has been implemented (TODO remove this note)
 @app.post("/v1/set_user_profile")
-def set_user_profile(
+async def set_user_profile(
     payload: UserProfileSubmitRequest, bg_tasks: BackgroundTasks
 ) -> Dict[str, bool]:
     try:
-        write_user_profile(
+        await awrite_user_profile(
             payload.user_id,
             payload.user_profile,
         )
         bg_tasks.add_task(
-            update_user_travel_profile_summary,
+            aupdate_user_travel_profile_summary,
             user_id=payload.user_id,
             user_profile=payload.user_profile,
         )
@@ -84,39 +249,76 @@ def set_user_profile(
 
 # Endpoint that retrieves a list of hotels located in the specified city.
 # This has been implemented (TODO remove this note)
+# The review count of each hotel comes from the counter stored on the hotel document.
 # TODO implement geo search based on proximity to a point
 @app.post("/v1/find_hotels")
-def get_hotels(hotel_request: HotelSearchRequest) -> List[Hotel]:
-    hotels = find_hotels_by_location(hotel_request.city, hotel_request.country)
-    for hotel in hotels:
-        hotel.num_reviews = select_review_count_by_hotel(hotel.id)
-    return hotels
+async def get_hotels(hotel_request: HotelSearchRequest) -> List[Hotel]:
+    return await afind_hotels_by_location(hotel_request.city, hotel_request.country)
 
 
 # Endpoint that selects the most recent reviews + some featured ones and creates a general concise summary.
+# The summary is served from the precomputed store (filled on first request, refreshed when reviews are added).
 # This has been implemented (TODO remove this note)
 @app.post("/v1/base_hotel_summary")
-def get_base_hotel_summary(payload: HotelDetailsRequest) -> HotelSummary:
-    hotel_reviews = select_general_hotel_reviews(payload.id)
-    hotel_review_summary = summarize_reviews_for_hotel(hotel_reviews)
+async def get_base_hotel_summary(payload: HotelDetailsRequest) -> HotelSummary:
+    # (each step needs the previous one: no stage graph here)
+    stored_summary = await aread_base_hotel_summary(payload.id)
+    if stored_summary is not None:
+        hotel_reviews = stored_summary["reviews"]
+        summary = stored_summary["summary"]
+    else:
+        hotel_reviews = await aselect_general_hotel_reviews(payload.id)
+        summary = await agenerate_base_hotel_summary(payload.id, hotel_reviews)
+
     return HotelSummary(
         request_id=payload.request_id,
         reviews=hotel_reviews,
-        summary=hotel_review_summary,
+        summary=summary,
     )
 
 
+# Streaming (SSE) version of the base summary endpoint: the reviews first, then the summary bullet points.
+# A stored summary is replayed at once; otherwise bullet points are sent as the LLM generates them.
+@app.post("/v1/base_hotel_summary/stream")
+async def stream_base_hotel_summary(payload: HotelDetailsRequest) -> StreamingResponse:
+
+    async def _events():
+        stored_summary = await aread_base_hotel_summary(payload.id)
+        if stored_summary is not None:
+            hotel_reviews = stored_summary["reviews"]
+            bullet_points = _aiter(stored_summary["summary"])
+        else:
+            hotel_reviews = await aselect_general_hotel_reviews(payload.id)
+            bullet_points = astream_generate_base_hotel_summary(payload.id, hotel_reviews)
+
+        yield _sse_event("reviews", {
+            "request_id": payload.request_id,
+            "reviews": [review.dict() for review in hotel_reviews],
+        })
+        async for bullet_point in bullet_points:
+            yield _sse_event("bullet", bullet_point)
+
+    return _sse_response(_events())
+
+
 # Endpoint that inserts a review for a hotel.
+# The review is acknowledged once stored in the reviews collection: its embedding
+# and the vector collection insertion are handled by the (batching) ingestion queue.
+# The new review changes the "recent" set, so the base summary is then regenerated in the background.
 # This has been implemented (TODO remove this note)
 @app.post("/v1/{hotel_id}/add_review")
-def add_review(hotel_id: str, payload: HotelReview):
+async def add_review(hotel_id: str, payload: HotelReview, bg_tasks: BackgroundTasks):
     try:
-        insert_review_for_hotel(
+        await asubmit_review_for_hotel(
             hotel_id=hotel_id,
             review_title=payload.title,
             review_body=payload.body,
             review_rating=payload.rating,
         )
+        bg_tasks.add_task(
+            arefresh_base_hotel_summary,
+            hotel_id=hotel_id,
+        )
         return {
             "success": True,
         }
@@ -126,12 +328,75 @@ def add_review(hotel_id: str, payload: HotelReview):
         }
 
 
+# Endpoint that inserts many reviews at once, possibly for several hotels (e.g. from partners).
+# Reviews are written with bulk insertions and embedded in large batches;
+# the result of each review is returned (in the same order as the request).
+# The base summary of each affected hotel is then regenerated in the background.
+@app.post("/v1/reviews/bulk")
+async def add_reviews_bulk(
+    payload: BulkReviewSubmitRequest, bg_tasks: BackgroundTasks
+) -> BulkReviewSubmitResponse:
+    results = await asubmit_reviews_bulk([
+        {
+            "hotel_id": review.hotel_id,
+            "title": review.title,
+            "body": review.body,
+            "rating": review.rating,
+        }
+        for review in payload.reviews
+    ])
+    for hotel_id in {result["hotel_id"] for result in results if result["success"]}:
+        bg_tasks.add_task(
+            arefresh_base_hotel_summary,
+            hotel_id=hotel_id,
+        )
+    return BulkReviewSubmitResponse(results=results)
+
+
+# Stages of the customized hotel details, up to (excluding) the LLM summary,
+# shared by the plain and the streaming endpoints.
+def _customized_hotel_details_stages(hotel_id: str, user_id: str) -> StageGraph:
+    # The hotel details do not depend on anything else: they run concurrently to the rest.
+
+    async def _user_profile():
+        return await aread_user_profile_with_vector(user_id)
+
+    async def _hotel_details():
+        return await afind_hotel_by_id(hotel_id)
+
+    async def _travel_profile(user_profile):
+        profile, profile_vector = user_profile
+        if profile:
+            if profile_vector is None and profile.travel_profile_summary:
+                # (embedded once here, for both the ANN search and the semantic summary cache)
+                profile_vector = await aembed_travel_profile_summary(profile.travel_profile_summary)
+            return profile.travel_profile_summary, profile_vector
+        else:
+            # (memoized: only embedded once per process)
+            return DEFAULT_TRAVEL_PROFILE_SUMMARY, await aget_default_travel_profile_vector()
+
+    async def _reviews(travel_profile):
+        travel_profile_summary, travel_profile_vector = travel_profile
+        return await aselect_hotel_reviews_for_user(
+            hotel_id=hotel_id,
+            user_travel_profile_summary=travel_profile_summary,
+            user_travel_profile_vector=travel_profile_vector,
+        )
+
+    stage_graph = StageGraph()
+    stage_graph.add("user_profile", _user_profile)
+    stage_graph.add("hotel_details", _hotel_details)
+    stage_graph.add("travel_profile", _travel_profile, depends_on=["user_profile"])
+    stage_graph.add("reviews", _reviews, depends_on=["travel_profile"])
+    return stage_graph
+
+
 # Endpoint that selects the three reviews of this hotel that are most relevant to this user
 # and generates a user-tailored summary of these reviews.
 # This has been implemented (TODO remove this note)
 # TODO should this become a GET and have the user_id as part of the path somewhere?
 @app.post("/v1/customized_hotel_details/{hotel_id}")
-def get_customized_hotel_details(
+async def get_customized_hotel_details(
     hotel_id: str, payload: UserRequest
 ) -> CustomizedHotelDetails:
     """
@@ -143,26 +408,52 @@ def get_customized_hotel_details(
     6. return the summary and the reviews used (+ name), as in the structure below
     """
 
-    user_profile = read_user_profile(payload.user_id)
+    async def _summary(travel_profile, reviews):
+        travel_profile_summary, travel_profile_vector = travel_profile
+        return await asummarize_reviews_for_user(
+            reviews=reviews,
+            travel_profile_summary=travel_profile_summary,
+            travel_profile_vector=travel_profile_vector,
+        )
 
-    if user_profile:
-        travel_profile_summary = user_profile.travel_profile_summary
-    else:
-        travel_profile_summary = DEFAULT_TRAVEL_PROFILE_SUMMARY
+    stage_graph = _customized_hotel_details_stages(hotel_id, payload.user_id)
+    stage_graph.add("summary", _summary, depends_on=["travel_profile", "reviews"])
+    results = await stage_graph.run()
+    _report_stage_timings("customized_hotel_details", stage_graph)
 
-    hotel_reviews_for_user = select_hotel_reviews_for_user(
-        hotel_id=hotel_id,
-        user_travel_profile_summary=travel_profile_summary,
+    return CustomizedHotelDetails(
+        name=results["hotel_details"].name,
+        summary=results["summary"],
+        reviews=results["reviews"],
     )
 
-    customized_review_summary = summarize_reviews_for_user(
-        reviews=hotel_reviews_for_user,
-        travel_profile_summary=travel_profile_summary,
-    )
-    hotel_details = find_hotel_by_id(hotel_id)
 
-    return CustomizedHotelDetails(
-        name=hotel_details.name,
-        summary=customized_review_summary,
-        reviews=hotel_reviews_for_user,
-    )
\ No newline at end of file
+# Streaming (SSE) version of the customized hotel details endpoint:
+# hotel name and reviews first, then the summary bullet points as the LLM generates them.
+@app.post("/v1/customized_hotel_details/{hotel_id}/stream")
+async def stream_customized_hotel_details(
+    hotel_id: str, payload: UserRequest
+) -> StreamingResponse:
+
+    async def _events():
+        stage_graph = _customized_hotel_details_stages(hotel_id, payload.user_id)
+        results = await stage_graph.run()
+        _report_stage_timings("customized_hotel_details/stream", stage_graph)
+
+        yield _sse_event("reviews", {
+            "name": results["hotel_details"].name,
+            "reviews": [review.dict() for review in results["reviews"]],
+        })
+        travel_profile_summary, travel_profile_vector = results["travel_profile"]
+        async for bullet_point in astream_summarize_reviews_for_user(
+            reviews=results["reviews"],
+            travel_profile_summary=travel_profile_summary,
+            travel_profile_vector=travel_profile_vector,
+        ):
+            yield _sse_event("bullet", bullet_point)
+
+    return _sse_response(_events())
+
+
+startup_stats["import_seconds"] = time.perf_counter() - API_IMPORT_START_TIME
+_report_import_time()
@@ -0,0 +1,102 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+
+# Cold start of the API: time to import api.py in a fresh interpreter, as measured
+# by `python -X importtime`, with the modules contributing the most to it.
+# By default this runs on the local backends (no credentials needed); the import
+# itself sets up no client, so the measure holds for the real backends as well.
+
+DEFAULT_MODULE = "api"
+DEFAULT_TOP = 15
+
+
+def parse_importtime(stderr_text: str) -> List[Tuple[str, int, int, int]]:
+    # "import time: self [us] | cumulative | imported package" (nesting shown by indentation)
+    entries = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module_field = line[len("import time:"):].split("|")
+        module_name = module_field.strip()
+        depth = (len(module_field) - len(module_field.lstrip()) - 1) // 2
+        entries.append((module_name, int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+# The modules imported by `module` itself: importtime lists them (one level deeper)
+# right before it, after the previous top-level entry.
+def _direct_imports(entries: List[Tuple[str, int, int, int]], module: str) -> List[Tuple[str, int]]:
+    module_index = next(index for index, entry in enumerate(entries) if entry[0] == module and entry[3] == 0)
+    direct_imports = []
+    for module_name, _, cumulative_us, depth in reversed(entries[:module_index]):
+        if depth == 0:
+            break
+        if depth == 1:
+            direct_imports.append((module_name, cumulative_us))
+    return direct_imports
+
+
+def measure_import(module: str, env: Dict[str, str]) -> List[Tuple[str, int, int, int]]:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        print(completed.stderr[-2000:])
+        raise RuntimeError(f"Importing {module} failed")
+    return parse_importtime(completed.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the import time of the API in fresh interpreters, with the costliest modules"
+    )
+    parser.add_argument("--module", default=DEFAULT_MODULE, help="module to import (default: %(default)s)")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to run (default: %(default)s)")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="modules to list (default: %(default)s)")
+    parser.add_argument("--budget-ms", type=float, help="fail if the median import time exceeds this")
+    parser.add_argument("--use-env", action="store_true", help="keep the configured backends instead of the local ones")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["TERSE_LOGGING"] = "1"
+    if not args.use_env:
+        env.update({
+            "ASTRA_DB_BACKEND": "local",
+            "LOCAL_DATA_API_SNAPSHOT_FILE": "",
+            "LLM_PROVIDER": "Local",
+            "EMBEDDINGS_PROVIDER": "Local",
+        })
+
+    runs = [measure_import(args.module, env) for _ in range(args.runs)]
+    totals_ms = [
+        next(cumulative_us for module_name, _, cumulative_us, depth in entries if module_name == args.module and depth == 0) / 1000
+        for entries in runs
+    ]
+    median_ms = statistics.median(totals_ms)
+    print(
+        f"[cold_start.py] import {args.module}: median {median_ms:.0f}ms "
+        f"(min {min(totals_ms):.0f}ms, max {max(totals_ms):.0f}ms, {args.runs} runs)"
+    )
+
+    # breakdown from the median run: top-level packages by cumulative time, modules by own time
+    median_run = runs[totals_ms.index(sorted(totals_ms)[len(totals_ms) // 2])]
+    top_level = sorted(_direct_imports(median_run, args.module), key=lambda item: -item[1])
+    print(f"\n{'imported by ' + args.module:<50} {'cumulative(ms)':>15}")
+    for module_name, cumulative_us in top_level[:args.top]:
+        print(f"{module_name:<50} {cumulative_us / 1000:>15.1f}")
+    by_self_time = sorted(median_run, key=lambda entry: -entry[1])
+    print(f"\n{'costliest modules':<50} {'self(ms)':>15}")
+    for module_name, self_us, _, _ in by_self_time[:args.top]:
+        print(f"{module_name:<50} {self_us / 1000:>15.1f}")
+
+    if args.budget_ms is not None and median_ms > args.budget_ms:
+        print(f"\n[cold_start.py] Over budget: {median_ms:.0f}ms > {args.budget_ms:.0f}ms")
+        sys.exit(1)
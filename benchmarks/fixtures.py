@@ -0,0 +1,100 @@
+"""Synthetic data for the benchmarks, written to the local (in-process) backend"""
+import random
+from typing import Any, Dict, List
+
+from common_constants import (
+    CITIES_COLLECTION_NAME,
+    HOTELS_COLLECTION_NAME,
+    INSERTION_BATCH_SIZE,
+    REVIEWS_COLLECTION_NAME,
+    REVIEW_VECTOR_COLLECTION_NAME,
+    USERS_COLLECTION_NAME,
+)
+from utils.ai import EMBEDDING_DIMENSION, get_embeddings
+from utils.batching import batch_iterable
+from utils.db import get_astra_db_client
+from utils.models import UserProfile
+from utils.reviews import (
+    format_review_content_for_embedding,
+    _new_review_document,
+    _review_vector_document,
+)
+from utils.users import write_user_profile, update_user_travel_profile_summary
+
+
+BENCHMARK_CITY = "Benchmark City"
+BENCHMARK_COUNTRY = "Benchmarkland"
+BENCHMARK_USER_ID = "benchmark_user"
+
+REVIEW_WORDS = (
+    "room clean staff friendly location breakfast noisy quiet view bed comfortable "
+    "small spacious price value pool parking wifi helpful dated modern walk station"
+).split()
+
+
+def hotel_id(hotel_index: int) -> str:
+    return f"benchmark_hotel_{hotel_index:03d}"
+
+
+def random_review(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "title": " ".join(rng.choices(REVIEW_WORDS, k=4)).capitalize(),
+        "body": " ".join(rng.choices(REVIEW_WORDS, k=40)).capitalize() + ".",
+        "rating": rng.randint(1, 5),
+    }
+
+
+def _insert_in_batches(collection_name: str, documents: List[Dict[str, Any]]):
+    collection = get_astra_db_client().collection(collection_name)
+    for document_batch in batch_iterable(documents, INSERTION_BATCH_SIZE):
+        collection.insert_many(document_batch)
+
+
+# Creates the collections and fills them with num_hotels hotels in the benchmark city,
+# each with reviews_per_hotel reviews (in both review collections), plus a user
+# with a stored travel profile (summary and vector).
+def seed_benchmark_data(num_hotels: int, reviews_per_hotel: int, seed: int = 0):
+    rng = random.Random(seed)
+    astra_db_client = get_astra_db_client()
+    for collection_name in [HOTELS_COLLECTION_NAME, CITIES_COLLECTION_NAME, REVIEWS_COLLECTION_NAME, USERS_COLLECTION_NAME]:
+        astra_db_client.create_collection(collection_name)
+    astra_db_client.create_collection(REVIEW_VECTOR_COLLECTION_NAME, dimension=EMBEDDING_DIMENSION)
+
+    _insert_in_batches(HOTELS_COLLECTION_NAME, [
+        {
+            "_id": hotel_id(hotel_index),
+            "name": f"Benchmark Hotel {hotel_index}",
+            "city": BENCHMARK_CITY,
+            "country": BENCHMARK_COUNTRY,
+            "num_reviews": reviews_per_hotel,
+        }
+        for hotel_index in range(num_hotels)
+    ])
+
+    review_entries = [
+        {"hotel_id": hotel_id(hotel_index), "review_id": f"{hotel_id(hotel_index)}_review_{review_index:04d}", **random_review(rng)}
+        for hotel_index in range(num_hotels)
+        for review_index in range(reviews_per_hotel)
+    ]
+    _insert_in_batches(REVIEWS_COLLECTION_NAME, [
+        _new_review_document(entry["hotel_id"], entry["review_id"], entry["title"], entry["body"], entry["rating"])
+        for entry in review_entries
+    ])
+    review_vectors = get_embeddings().embed_documents([
+        format_review_content_for_embedding(entry["title"], entry["body"])
+        for entry in review_entries
+    ])
+    _insert_in_batches(REVIEW_VECTOR_COLLECTION_NAME, [
+        _review_vector_document(
+            entry["hotel_id"], entry["review_id"], entry["title"], entry["body"], entry["rating"], review_vector
+        )
+        for entry, review_vector in zip(review_entries, review_vectors)
+    ])
+
+    user_profile = UserProfile(
+        base_preferences={"pets": True, "quiet": True, "wellness": False},
+        additional_preferences="I travel for work and like a good breakfast.",
+        travel_profile_summary=None,
+    )
+    write_user_profile(BENCHMARK_USER_ID, user_profile)
+    update_user_travel_profile_summary(BENCHMARK_USER_ID, user_profile)
@@ -0,0 +1,106 @@
+"""Measurement and baseline helpers for the benchmark suite"""
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+this_dir = os.path.abspath(os.path.dirname(__file__))
+BASELINE_DIR = os.path.join(this_dir, "baselines")
+
+
+# Runs the operation repeatedly for (at least) min_seconds, after a warm-up, then
+# measures allocations in a separate (shorter) pass, as tracing slows everything down:
+#   ops_per_second, mean_us:     throughput and mean duration of one operation
+#   peak_kib_per_op:             mean peak of traced memory above the starting point, per operation
+#   retained_blocks_per_op:      memory blocks still allocated after the operations (leak detector)
+def measure(
+    operation: Callable[[], Any],
+    min_seconds: float = 1.0,
+    warmup_ops: int = 3,
+    allocation_ops: int = 20,
+) -> Dict[str, float]:
+    for _ in range(warmup_ops):
+        operation()
+
+    gc.collect()
+    num_ops = 0
+    start_time = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_seconds or num_ops < 3:
+        operation()
+        num_ops += 1
+        elapsed = time.perf_counter() - start_time
+
+    gc.collect()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    total_peak_bytes = 0
+    for _ in range(allocation_ops):
+        tracemalloc.reset_peak()
+        traced_before, _ = tracemalloc.get_traced_memory()
+        operation()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        total_peak_bytes += traced_peak - traced_before
+    tracemalloc.stop()
+    gc.collect()
+    blocks_after = sys.getallocatedblocks()
+
+    return {
+        "ops_per_second": num_ops / elapsed,
+        "mean_us": elapsed / num_ops * 1e6,
+        "peak_kib_per_op": total_peak_bytes / allocation_ops / 1024,
+        "retained_blocks_per_op": (blocks_after - blocks_before) / allocation_ops,
+    }
+
+
+def format_result(name: str, result: Dict[str, float]) -> str:
+    return (
+        f"{name:<40} {result['ops_per_second']:>12.1f} ops/s {result['mean_us']:>12.1f} us/op"
+        f" {result['peak_kib_per_op']:>10.1f} KiB peak/op {result['retained_blocks_per_op']:>8.1f} blocks kept/op"
+    )
+
+
+def _baseline_path(baseline_name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{baseline_name}.json")
+
+
+def save_baseline(baseline_name: str, results: Dict[str, Dict[str, float]]) -> str:
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    baseline_path = _baseline_path(baseline_name)
+    with open(baseline_path, "w") as o_file:
+        json.dump(results, o_file, indent=2, sort_keys=True)
+    return baseline_path
+
+
+def load_baseline(baseline_name: str) -> Dict[str, Dict[str, float]]:
+    with open(_baseline_path(baseline_name)) as i_file:
+        return json.load(i_file)
+
+
+# A case regresses when its throughput drops by more than max_regression (a fraction)
+# with respect to the baseline. Returns the report lines and the names of the regressed cases.
+def compare_to_baseline(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    max_regression: float,
+) -> Tuple[List[str], List[str]]:
+    report_lines = []
+    regressions = []
+    for name, result in results.items():
+        baseline_result: Optional[Dict[str, float]] = baseline.get(name)
+        if baseline_result is None:
+            report_lines.append(f"{name:<40} (not in baseline)")
+            continue
+        change = result["ops_per_second"] / baseline_result["ops_per_second"] - 1.0
+        regressed = change < -max_regression
+        if regressed:
+            regressions.append(name)
+        report_lines.append(
+            f"{name:<40} {baseline_result['ops_per_second']:>12.1f} -> {result['ops_per_second']:>12.1f} ops/s"
+            f" ({change * 100:+.1f}%){'  REGRESSION' if regressed else ''}"
+        )
+    return report_lines, regressions
@@ -0,0 +1,260 @@
+import argparse
+import asyncio
+import csv
+import random
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+
+# Load generator replaying the calls of the React client (client/src/utils/*.ts)
+# against a running API. Each session of a (simulated) user:
+#   1. reads the user profile (and, sometimes, saves it)
+#   2. searches the hotels of a city
+#   3. fetches the base summary of every hotel card (concurrently, as the cards do)
+#   4. opens the customized details of one of these hotels
+#   5. sometimes posts a review for it
+# Sessions either arrive at a given rate (open model: Poisson arrivals, with at most
+# `concurrency` sessions in progress) or are run back-to-back by `concurrency` users (closed model).
+# A sweep over several rates (or concurrencies) gives the saturation curve of each endpoint.
+
+DEFAULT_BASE_URL = "http://127.0.0.1:8000"
+# (demo values suggested by the client)
+DEFAULT_CITIES = "US/Atlanta:3,US/Miami:3,US/Orlando:2,US/San Diego:2,US/Las Vegas:2,US/Chicago:1"
+PERCENTILES = (50, 95, 99)
+
+
+def parse_cities(cities_spec: str) -> List[Tuple[Tuple[str, str], float]]:
+    # "COUNTRY/CITY[:WEIGHT],..."
+    cities = []
+    for city_spec in cities_spec.split(","):
+        location, _, weight = city_spec.partition(":")
+        country, _, city = location.partition("/")
+        cities.append(((country.strip(), city.strip()), float(weight or 1)))
+    return cities
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class LoadStats:
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.sessions = 0
+        self.session_wait_seconds: List[float] = []
+
+    def record(self, endpoint: str, latency: float, ok: bool):
+        self.latencies[endpoint].append(latency)
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def summary(self, elapsed: float) -> List[Dict[str, Any]]:
+        rows = []
+        for endpoint, latencies in sorted(self.latencies.items()):
+            sorted_latencies = sorted(latencies)
+            rows.append({
+                "endpoint": endpoint,
+                "count": len(latencies),
+                "errors": self.errors[endpoint],
+                "throughput": len(latencies) / elapsed,
+                **{
+                    f"p{pct}_ms": percentile(sorted_latencies, pct) * 1000
+                    for pct in PERCENTILES
+                },
+            })
+        return rows
+
+
+class ClientFlows:
+
+    def __init__(self, client: httpx.AsyncClient, stats: LoadStats, args, rng: random.Random):
+        self.client = client
+        self.stats = stats
+        self.args = args
+        self.rng = rng
+        self.cities = parse_cities(args.cities)
+        # Zipf-like popularity of the users (skew zero: uniform)
+        self.user_weights = [1.0 / (rank + 1) ** args.user_skew for rank in range(args.users)]
+
+    async def _post(self, endpoint: str, path: str, json_payload: Dict[str, Any]) -> Optional[Any]:
+        start_time = time.perf_counter()
+        try:
+            response = await self.client.post(path, json=json_payload)
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.stats.record(endpoint, time.perf_counter() - start_time, ok)
+        return response.json() if ok else None
+
+    async def _think(self):
+        if self.args.think_time > 0:
+            await asyncio.sleep(self.rng.expovariate(1.0 / self.args.think_time))
+
+    async def session(self):
+        user_id = f"loadtest_user_{self.rng.choices(range(self.args.users), weights=self.user_weights)[0]}"
+        (country, city), = self.rng.choices(
+            [location for location, _ in self.cities],
+            weights=[weight for _, weight in self.cities],
+        )
+
+        await self._post("/v1/get_user_profile", "/v1/get_user_profile", {"user_id": user_id})
+        if self.rng.random() < self.args.set_profile_rate:
+            await self._post("/v1/set_user_profile", "/v1/set_user_profile", {
+                "user_id": user_id,
+                "user_profile": {
+                    "base_preferences": {"pets": self.rng.random() < 0.5, "quiet": self.rng.random() < 0.5},
+                    "additional_preferences": "Generated by the load test.",
+                },
+            })
+        await self._think()
+
+        hotels = await self._post("/v1/find_hotels", "/v1/find_hotels", {"city": city, "country": country})
+        if not hotels:
+            return
+        await asyncio.gather(*(
+            self._post("/v1/base_hotel_summary", "/v1/base_hotel_summary", {
+                "request_id": hotel["id"],
+                "city": hotel["city"],
+                "country": hotel["country"],
+                "id": hotel["id"],
+            })
+            for hotel in hotels
+        ))
+        await self._think()
+
+        hotel = self.rng.choice(hotels)
+        await self._post(
+            "/v1/customized_hotel_details/{hotel_id}",
+            f"/v1/customized_hotel_details/{hotel['id']}",
+            {"user_id": user_id},
+        )
+        if self.rng.random() < self.args.review_rate:
+            await self._think()
+            await self._post("/v1/{hotel_id}/add_review", f"/v1/{hotel['id']}/add_review", {
+                "title": "Load test review",
+                "body": "Generated by the load test.",
+                "rating": self.rng.randint(1, 5),
+                "id": "will-be-discarded",
+            })
+
+
+async def run_stage(args, rate: Optional[float], concurrency: int, seed: int) -> Tuple[LoadStats, float]:
+    stats = LoadStats()
+    rng = random.Random(seed)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        flows = ClientFlows(client, stats, args, rng)
+        start_time = time.perf_counter()
+        deadline = start_time + args.duration
+
+        async def _run_session(arrival_time: float, slots: asyncio.Semaphore):
+            async with slots:
+                stats.session_wait_seconds.append(time.perf_counter() - arrival_time)
+                await flows.session()
+                stats.sessions += 1
+
+        slots = asyncio.Semaphore(concurrency)
+        if rate is not None:
+            # open model: arrivals do not wait for earlier sessions to complete
+            sessions = []
+            while time.perf_counter() < deadline:
+                sessions.append(asyncio.ensure_future(_run_session(time.perf_counter(), slots)))
+                await asyncio.sleep(rng.expovariate(rate))
+            await asyncio.gather(*sessions)
+        else:
+            # closed model: each user starts a new session as soon as the previous one ends
+            async def _user_loop():
+                while time.perf_counter() < deadline:
+                    await _run_session(time.perf_counter(), slots)
+            await asyncio.gather(*(_user_loop() for _ in range(concurrency)))
+
+        return stats, time.perf_counter() - start_time
+
+
+def print_stage_report(stage_label: str, stats: LoadStats, elapsed: float):
+    waits = sorted(stats.session_wait_seconds)
+    print(
+        f"\n[load_test.py] {stage_label}: {stats.sessions} sessions in {elapsed:.1f}s "
+        f"({stats.sessions / elapsed:.2f}/s), session queueing p95={percentile(waits, 95) * 1000:.0f}ms"
+    )
+    print(f"{'endpoint':<42} {'count':>7} {'errors':>7} {'req/s':>8} " + " ".join(f"{f'p{pct}(ms)':>9}" for pct in PERCENTILES))
+    for row in stats.summary(elapsed):
+        print(
+            f"{row['endpoint']:<42} {row['count']:>7} {row['errors']:>7} {row['throughput']:>8.2f} "
+            + " ".join(f"{row[f'p{pct}_ms']:>9.0f}" for pct in PERCENTILES)
+        )
+
+
+def print_saturation_curves(stage_results: List[Dict[str, Any]]):
+    print("\n[load_test.py] Saturation curves (p95 latency in ms, by offered load):")
+    endpoints = sorted({row["endpoint"] for stage in stage_results for row in stage["rows"]})
+    print(f"{'load':<30} {'sessions/s':>11} " + " ".join(f"{endpoint[:24]:>25}" for endpoint in endpoints))
+    for stage in stage_results:
+        p95_by_endpoint = {row["endpoint"]: row["p95_ms"] for row in stage["rows"]}
+        print(
+            f"{stage['load']:<30} {stage['sessions_per_second']:>11.2f} "
+            + " ".join(f"{p95_by_endpoint.get(endpoint, float('nan')):>25.0f}" for endpoint in endpoints)
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay the client flows against a running API and report latency percentiles"
+    )
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL, help="default: %(default)s")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds per stage (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=10, help="max sessions in progress (default: %(default)s)")
+    parser.add_argument("--rate", type=float, help="session arrivals per second (default: closed model)")
+    parser.add_argument("--rate-sweep", metavar="RATES", help="comma-separated rates, one stage each")
+    parser.add_argument("--concurrency-sweep", metavar="CONCURRENCIES", help="comma-separated concurrencies, one stage each")
+    parser.add_argument("--cities", default=DEFAULT_CITIES, help="COUNTRY/CITY[:WEIGHT],... (default: %(default)s)")
+    parser.add_argument("--users", type=int, default=1000, help="number of distinct users (default: %(default)s)")
+    parser.add_argument("--user-skew", type=float, default=1.0, help="Zipf exponent of user popularity (0: uniform)")
+    parser.add_argument("--set-profile-rate", type=float, default=0.05, help="share of sessions saving the profile")
+    parser.add_argument("--review-rate", type=float, default=0.1, help="share of sessions posting a review")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between steps, in seconds")
+    parser.add_argument("--timeout", type=float, default=120.0, help="request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--csv", metavar="FILE", help="also write the per-stage, per-endpoint results to a CSV file")
+    args = parser.parse_args()
+
+    if args.rate_sweep:
+        stages = [(float(rate), args.concurrency) for rate in args.rate_sweep.split(",")]
+    elif args.concurrency_sweep:
+        stages = [(args.rate, int(concurrency)) for concurrency in args.concurrency_sweep.split(",")]
+    else:
+        stages = [(args.rate, args.concurrency)]
+
+    stage_results = []
+    for stage_index, (rate, concurrency) in enumerate(stages):
+        stage_label = f"rate={rate:g}/s,concurrency={concurrency}" if rate is not None else f"concurrency={concurrency}"
+        stats, elapsed = asyncio.run(run_stage(args, rate, concurrency, seed=args.seed + stage_index))
+        print_stage_report(stage_label, stats, elapsed)
+        stage_results.append({
+            "load": stage_label,
+            "sessions_per_second": stats.sessions / elapsed,
+            "rows": stats.summary(elapsed),
+        })
+
+    if len(stage_results) > 1:
+        print_saturation_curves(stage_results)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as o_file:
+            fieldnames = ["load", "sessions_per_second", "endpoint", "count", "errors", "throughput"] + [
+                f"p{pct}_ms" for pct in PERCENTILES
+            ]
+            writer = csv.DictWriter(o_file, fieldnames=fieldnames)
+            writer.writeheader()
+            for stage in stage_results:
+                for row in stage["rows"]:
+                    writer.writerow({"load": stage["load"], "sessions_per_second": stage["sessions_per_second"], **row})
+        print(f"[load_test.py] Results written to {args.csv}")
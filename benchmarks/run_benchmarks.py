@@ -0,0 +1,192 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+
+import numpy as np
+
+# The benchmarks always run on stubbed backends: the in-process emulation of
+# the Data API and the local LLM/embeddings ("instant" timings unless configured),
+# so that they measure the request path of this code only.
+# (This must happen before the application modules are imported.)
+os.environ["ASTRA_DB_BACKEND"] = "local"
+os.environ["LOCAL_DATA_API_SNAPSHOT_FILE"] = ""
+os.environ["LLM_PROVIDER"] = "Local"
+os.environ["EMBEDDINGS_PROVIDER"] = "Local"
+os.environ["TERSE_LOGGING"] = "1"
+
+from fastapi.testclient import TestClient
+
+from benchmarks.fixtures import (
+    BENCHMARK_CITY,
+    BENCHMARK_COUNTRY,
+    BENCHMARK_USER_ID,
+    hotel_id,
+    random_review,
+    seed_benchmark_data,
+)
+from benchmarks.harness import (
+    compare_to_baseline,
+    format_result,
+    load_baseline,
+    measure,
+    save_baseline,
+)
+from setup.embedding_dump import compress_embeddings_map, deflate_embeddings_map
+from setup.embedding_store import EmbeddingStore
+from utils.ai import EMBEDDING_DIMENSION
+from utils.batching import batch_iterable
+from utils.dates import datetime_to_json_block, restore_doc_dates
+from utils.hotels import clear_hotel_cache
+from utils.models import CustomizedHotelDetails, Hotel, HotelReview, UserProfile
+from utils.review_llm import _split_bulletpoints
+from utils.review_vector_index import HotelReviewVectors
+from utils.vector_codec import decode_vector_array
+
+
+DEFAULT_NUM_HOTELS = 20
+DEFAULT_REVIEWS_PER_HOTEL = 50
+DEFAULT_MAX_REGRESSION = 0.2
+
+
+def route_cases(client: TestClient):
+    rng = random.Random(1)
+
+    def _post(path, json_payload):
+        def _operation():
+            response = client.post(path, json=json_payload() if callable(json_payload) else json_payload)
+            assert response.status_code == 200, response.text
+        return _operation
+
+    def _find_hotels_uncached():
+        clear_hotel_cache()
+        _post("/v1/find_hotels", {"city": BENCHMARK_CITY, "country": BENCHMARK_COUNTRY})()
+
+    base_summary_payload = {"request_id": "benchmark", "city": BENCHMARK_CITY, "country": BENCHMARK_COUNTRY, "id": hotel_id(0)}
+    user_payload = {"user_id": BENCHMARK_USER_ID}
+    user_profile_payload = {
+        "user_id": "benchmark_other_user",
+        "user_profile": {
+            "base_preferences": {"pets": False, "quiet": True},
+            "additional_preferences": "Close to the beach, please.",
+        },
+    }
+
+    return {
+        "route:find_hotels": _post("/v1/find_hotels", {"city": BENCHMARK_CITY, "country": BENCHMARK_COUNTRY}),
+        "route:find_hotels (uncached)": _find_hotels_uncached,
+        "route:base_hotel_summary": _post("/v1/base_hotel_summary", base_summary_payload),
+        "route:base_hotel_summary/stream": _post("/v1/base_hotel_summary/stream", base_summary_payload),
+        "route:customized_hotel_details": _post(f"/v1/customized_hotel_details/{hotel_id(1)}", user_payload),
+        "route:customized_hotel_details/stream": _post(f"/v1/customized_hotel_details/{hotel_id(1)}/stream", user_payload),
+        "route:get_user_profile": _post("/v1/get_user_profile", user_payload),
+        "route:set_user_profile": _post("/v1/set_user_profile", user_profile_payload),
+        "route:add_review": _post(
+            f"/v1/{hotel_id(2)}/add_review",
+            lambda: {**random_review(rng), "id": "will-be-discarded"},
+        ),
+        "route:reviews/bulk (20 reviews)": _post(
+            "/v1/reviews/bulk",
+            lambda: {"reviews": [{"hotel_id": hotel_id(3), **random_review(rng)} for _ in range(20)]},
+        ),
+    }
+
+
+def helper_cases():
+    rng = random.Random(2)
+    bullet_text = "\n".join(f"- {random_review(rng)['body']}" for _ in range(5))
+    review_doc = {
+        "_id": "r",
+        "hotel_id": "h",
+        "date_added": {"$date": 1700000000000},
+        "title": "Title",
+        "body": "Body",
+        "rating": 4,
+        "featured": 0,
+    }
+    embeddings_map = {
+        f"review_{i}": [rng.random() for _ in range(EMBEDDING_DIMENSION)]
+        for i in range(100)
+    }
+    compressed_map = compress_embeddings_map(embeddings_map)
+    embedding_store = EmbeddingStore(
+        list(compressed_map.keys()),
+        np.stack([decode_vector_array(compressed_vector) for compressed_vector in compressed_map.values()]),
+    )
+    hotel_review_vectors = HotelReviewVectors.from_documents([
+        {"_id": review_id, "content": "Title\nBody", "metadata": {"rating": 4}, "$vector": vector}
+        for review_id, vector in embeddings_map.items()
+    ])
+    query_vector = embeddings_map["review_0"]
+    items = list(range(1000))
+    review_dicts = [{"title": "Title", "body": "Body", "rating": 4, "id": f"r{i}"} for i in range(3)]
+
+    return {
+        "helper:_split_bulletpoints": lambda: _split_bulletpoints(bullet_text),
+        "helper:restore_doc_dates": lambda: restore_doc_dates(review_doc),
+        "helper:datetime_to_json_block": lambda: datetime_to_json_block(restore_doc_dates(review_doc)["date_added"]),
+        "helper:compress_embeddings_map (100)": lambda: compress_embeddings_map(embeddings_map),
+        "helper:deflate_embeddings_map (100)": lambda: deflate_embeddings_map(compressed_map),
+        "helper:EmbeddingStore lookup (100)": lambda: [embedding_store[review_id] for review_id in compressed_map],
+        "helper:HotelReviewVectors.top_k (100)": lambda: hotel_review_vectors.top_k(query_vector, 3),
+        "helper:batch_iterable (1000/20)": lambda: [list(batch) for batch in batch_iterable(items, 20)],
+        "model:HotelReview": lambda: HotelReview(**review_dicts[0]),
+        "model:Hotel": lambda: Hotel(city="c", country="k", name="n", id="h", num_reviews=None),
+        "model:UserProfile": lambda: UserProfile(
+            base_preferences={"pets": True, "quiet": False}, additional_preferences="x", travel_profile_summary=None
+        ),
+        "model:CustomizedHotelDetails": lambda: CustomizedHotelDetails(
+            name="n", reviews=[HotelReview(**review_dict) for review_dict in review_dicts], summary=["a", "b", "c"]
+        ),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the API routes (in-process, on stubbed backends) and the hot helpers"
+    )
+    parser.add_argument("-k", metavar="SUBSTRING", help="only run the cases whose name contains this")
+    parser.add_argument("--min-time", metavar="SECONDS", type=float, default=1.0, help="minimum run time per case")
+    parser.add_argument("--hotels", type=int, default=DEFAULT_NUM_HOTELS, help="number of synthetic hotels")
+    parser.add_argument("--reviews", type=int, default=DEFAULT_REVIEWS_PER_HOTEL, help="reviews per hotel")
+    parser.add_argument("--save-baseline", metavar="NAME", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="NAME", help="compare the results with a saved baseline")
+    parser.add_argument(
+        "--max-regression",
+        metavar="FRACTION",
+        type=float,
+        default=DEFAULT_MAX_REGRESSION,
+        help="throughput drop (vs. baseline) making a case fail (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    print(f"[run_benchmarks.py] Seeding {args.hotels} hotels x {args.reviews} reviews")
+    with contextlib.redirect_stdout(io.StringIO()):
+        seed_benchmark_data(args.hotels, args.reviews)
+        import api
+
+    results = {}
+    with TestClient(api.app) as client:
+        cases = {**route_cases(client), **helper_cases()}
+        for name, operation in cases.items():
+            if args.k and args.k not in name:
+                continue
+            # (the application logs are silenced while measuring)
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[name] = measure(operation, min_seconds=args.min_time)
+            print(format_result(name, results[name]))
+
+    if args.save_baseline:
+        baseline_path = save_baseline(args.save_baseline, results)
+        print(f"[run_benchmarks.py] Baseline saved to {baseline_path}")
+
+    if args.compare:
+        report_lines, regressions = compare_to_baseline(results, load_baseline(args.compare), args.max_regression)
+        print(f"\n[run_benchmarks.py] Comparison with baseline '{args.compare}':")
+        for report_line in report_lines:
+            print(report_line)
+        if regressions:
+            print(f"[run_benchmarks.py] {len(regressions)} regression(s) beyond {args.max_regression * 100:.0f}%")
+            sys.exit(1)
@@ -4,3 +4,5 @@ REVIEWS_COLLECTION_NAME = "reviews"
 REVIEW_VECTOR_COLLECTION_NAME = "hotel_reviews_embeddings"
 USERS_COLLECTION_NAME = "users"
 FEATURED_VOTE_THRESHOLD = 13
+
+INSERTION_BATCH_SIZE = 20  # 20 is the max in JSON API
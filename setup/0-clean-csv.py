@@ -1,28 +1,79 @@
 import os
+import argparse
 
-import random
 import pandas as pd
 import numpy as np
+import tqdm
 from setup.setup_constants import (
     HOTEL_REVIEW_FILE_NAME,
     RAW_REVIEW_SOURCE_FILE_NAME,
     MAX_REVIEW_TEXT_LENGTH,
     MAX_REVIEW_TITLE_LENGTH,
+    CSV_CLEANING_CHUNK_SIZE,
 )
 
-from utils.reviews import generate_review_id
+from utils.reviews import generate_review_ids
 
 # Script that cleans up the raw CSV data and stores it in a new CSV:
 #  - Picks only the columns of interest.
 #  - Cleans up trailing truncation marker from truncated reviews.
 #  - Assigns a synthetic, unique review_id because the original dataset does not contain one.
 #
+# The raw CSV is streamed in chunks (memory use does not depend on its size), each cleaned
+# with vectorized string operations and appended to the output as soon as it is ready.
+#
 # The resulting CSV file will be used as the review data in subsequent setup steps.
 
 
 this_dir = os.path.abspath(os.path.dirname(__file__))
 
+RENAME_MAP = {
+    "id": "hotel_id",
+    "reviews.date": "date",
+    "city": "hotel_city",
+    "country": "hotel_country",
+    "latitude": "hotel_latitude",
+    "longitude": "hotel_longitude",
+    "name": "hotel_name",
+    "reviews.rating": "rating",
+    "reviews.text": "text",
+    "reviews.title": "title",
+    "reviews.username": "username",
+}
+
+# Truncated reviews end with "... More" or "...More": the text is cut at the first of them
+DISCARDABLE_ENDING_PATTERN = r"\.\.\. ?More[\s\S]*"
+
+
+def clean_review_chunk(raw_chunk: pd.DataFrame) -> pd.DataFrame:
+    cleaned = raw_chunk.reindex(columns=list(RENAME_MAP.keys())).rename(columns=RENAME_MAP)
+    cleaned["title"] = cleaned["title"].fillna("(No title)").str.slice(0, MAX_REVIEW_TITLE_LENGTH)
+    cleaned["text"] = (
+        cleaned["text"]
+        .fillna("(No review text)")
+        .str.replace(DISCARDABLE_ENDING_PATTERN, "", n=1, regex=True)
+        # sanitize for extremely long texts
+        .str.slice(0, MAX_REVIEW_TEXT_LENGTH)
+    )
+    cleaned.insert(len(cleaned.columns), "id", generate_review_ids(len(cleaned)))
+    cleaned["review_upvotes"] = np.random.randint(1, 21, size=len(cleaned))
+    # (same column order as the former, whole-file cleaning: "id" comes right after the source columns)
+    return cleaned[list(RENAME_MAP.values()) + ["id", "review_upvotes"]]
+
+
 if __name__ == "__main__":
+    #
+    parser = argparse.ArgumentParser(
+        description="Clean the raw hotel review CSV"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help="Number of rows read, cleaned and written at once",
+        default=CSV_CLEANING_CHUNK_SIZE,
+    )
+    args = parser.parse_args()
+
     hotel_review_file_path = os.path.join(this_dir, HOTEL_REVIEW_FILE_NAME)
     if os.path.isfile(hotel_review_file_path):
         print(
@@ -35,72 +86,23 @@ if __name__ == "__main__":
         raw_review_source_file_path = os.path.join(
             this_dir, RAW_REVIEW_SOURCE_FILE_NAME
         )
-        raw_csv = pd.read_csv(raw_review_source_file_path)
-        chosen_columns = pd.DataFrame(
-            raw_csv,
-            columns=[
-                "id",
-                "reviews.date",
-                "city",
-                "country",
-                "latitude",
-                "longitude",
-                "name",
-                "reviews.rating",
-                "reviews.text",
-                "reviews.title",
-                "reviews.username",
-            ],
+        raw_chunks = pd.read_csv(
+            raw_review_source_file_path,
+            usecols=lambda column: column in RENAME_MAP,
+            # (types fixed upfront, not inferred chunk by chunk)
+            dtype={"reviews.text": str, "reviews.title": str, "reviews.rating": float},
+            chunksize=args.chunk_size,
         )
 
-        rename_map = {
-            "id": "hotel_id",
-            "reviews.date": "date",
-            "city": "hotel_city",
-            "country": "hotel_country",
-            "latitude": "hotel_latitude",
-            "longitude": "hotel_longitude",
-            "name": "hotel_name",
-            "reviews.rating": "rating",
-            "reviews.text": "text",
-            "reviews.title": "title",
-            "reviews.username": "username",
-        }
-        renamed_csv = chosen_columns.rename(columns=rename_map)
-
-        DISCARDABLE_ENDING_WITH_SPACE = "... More"
-        DISCARDABLE_ENDING_WITHOUT_SPACE = "...More"
-
-        def clean_review_text(row):
-            text0 = row["text"]
-            #
-            if text0.find(DISCARDABLE_ENDING_WITH_SPACE) > -1:
-                text1 = text0[: text0.find(DISCARDABLE_ENDING_WITH_SPACE)]
-            else:
-                text1 = text0
-            #
-            if text1.find(DISCARDABLE_ENDING_WITHOUT_SPACE) > -1:
-                text2 = text1[: text1.find(DISCARDABLE_ENDING_WITHOUT_SPACE)]
-            else:
-                text2 = text1
-            # sanitize for extremely long texts
-            return text2[:MAX_REVIEW_TEXT_LENGTH]
-
-        def clean_review_title(row):
-            title0 = row["title"]
-            return title0[:MAX_REVIEW_TITLE_LENGTH]
-
-        def review_id(row):
-            return generate_review_id()
-
-        renamed_csv["title"] = renamed_csv["title"].fillna("(No title)")
-        renamed_csv["text"] = renamed_csv["text"].fillna("(No review text)")
-        renamed_csv["id"] = renamed_csv.apply(review_id, axis=1)
-        renamed_csv["text"] = renamed_csv.apply(clean_review_text, axis=1)
-        renamed_csv["title"] = renamed_csv.apply(clean_review_title, axis=1)
-        renamed_csv["review_upvotes"] = np.random.randint(1, 21, size=len(renamed_csv))
+        # written under a temporary name, so that an interrupted run leaves no partial file behind
+        temp_file_path = f"{hotel_review_file_path}.tmp"
+        num_rows = 0
+        with open(temp_file_path, "w", newline="") as o_csv:
+            for raw_chunk in tqdm.tqdm(raw_chunks, unit="chunk"):
+                # (the row index carries on across chunks, as in a single data frame)
+                clean_review_chunk(raw_chunk).to_csv(o_csv, header=(num_rows == 0))
+                num_rows += len(raw_chunk)
+        os.replace(temp_file_path, hotel_review_file_path)
 
         file_name = hotel_review_file_path
-        renamed_csv.to_csv(file_name)
-
-        print(f"[0-clean-csv.py] Cleaned CSV saved to {file_name}")
+        print(f"[0-clean-csv.py] Cleaned CSV saved to {file_name} ({num_rows} reviews)")
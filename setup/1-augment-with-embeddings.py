@@ -1,13 +1,37 @@
 import os
-import json
+import time
+import random
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import tqdm
+import numpy as np
 import pandas as pd
 
-from utils.ai import get_embeddings
+from utils.ai import EMBEDDING_DIMENSION, get_embeddings
 from utils.reviews import format_review_content_for_embedding
-from setup.embedding_dump import compress_embeddings_map, deflate_embeddings_map
-from setup.setup_constants import EMBEDDING_FILE_NAME, HOTEL_REVIEW_FILE_NAME
+from setup.embedding_dump import append_embeddings_checkpoint, load_embeddings_checkpoint
+from setup.embedding_store import (
+    EMBEDDING_STORE_DTYPES,
+    EmbeddingStore,
+    convert_embeddings_json,
+    embedding_store_exists,
+    embedding_store_file_paths,
+    open_embedding_store,
+    write_embedding_store,
+)
+from setup.setup_constants import (
+    EMBEDDING_BATCH_CONCURRENCY,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CHECKPOINT_FILE_NAME,
+    EMBEDDING_FILE_NAME,
+    EMBEDDING_REQUESTS_PER_MINUTE,
+    EMBEDDING_STORE_DTYPE,
+    EMBEDDING_STORE_FILE_NAME,
+    EMBEDDING_TOKENS_PER_MINUTE,
+    HOTEL_REVIEW_FILE_NAME,
+)
 
 # Important note:
 # This step can be skipped if using the precalculated embeddings available as part of the setup assets.
@@ -17,16 +41,79 @@ from setup.setup_constants import EMBEDDING_FILE_NAME, HOTEL_REVIEW_FILE_NAME
 # If some of the data has already been embedded, this script will skip it to avoid re-embedding it unnecessarily.
 #
 # This script performs the following operations:
-#  - Loads the already-embedded data, if any.
+#  - Loads the already-embedded data, if any (including the checkpoint of an interrupted run);
+#    embeddings in the former JSON format are first converted to the binary embedding store.
 #  - Loops over the contents of the hotel review CSV, identifying the reviews that have not yet been embedded.
-#  - Embeds those reviews and stores them to a JSON file, with the review_id as document id and the vector as content.
-#
-# The resulting JSON file is compressed in order to reduce storage footprint.
+#  - Embeds those reviews, several batches at a time within the requests- and tokens-per-minute limits,
+#    appending each batch to a checkpoint file as it completes (an interrupted run resumes from there).
+#  - Stores all vectors to the binary embedding store (see setup/embedding_store.py),
+#    a memory-mappable matrix with the review_id of each row, then removes the checkpoint.
 
 
 this_dir = os.path.abspath(os.path.dirname(__file__))
 
-BATCH_SIZE = 20
+# Retries of a failing batch (e.g. rate-limited by the provider anyway), with exponential backoff
+MAX_BATCH_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+
+# Rough token count of a text for rate limiting purposes (about 4 characters per token in English)
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+class MinuteRateLimiter:
+    """
+    Two token buckets, for requests and tokens per minute, refilled continuously.
+    acquire blocks until both budgets allow the request.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.capacities = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.available = dict(self.capacities)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        for budget, capacity in self.capacities.items():
+            self.available[budget] = min(capacity, self.available[budget] + elapsed * capacity / 60)
+
+    def acquire(self, tokens):
+        # (a request larger than the whole budget waits for a full bucket)
+        needed = {"requests": 1, "tokens": min(tokens, self.capacities["tokens"])}
+        while True:
+            with self.lock:
+                self._refill()
+                wait_seconds = max(
+                    (needed[budget] - self.available[budget]) * 60 / self.capacities[budget]
+                    for budget in needed
+                )
+                if wait_seconds <= 0:
+                    for budget in needed:
+                        self.available[budget] -= needed[budget]
+                    return
+            time.sleep(wait_seconds)
+
+
+def embed_batch(embeddings, rate_limiter, batch):
+    bodies = [item["body"] for item in batch]
+    tokens = sum(estimate_tokens(body) for body in bodies)
+    for attempt in range(MAX_BATCH_ATTEMPTS):
+        rate_limiter.acquire(tokens)
+        try:
+            return batch, embeddings.embed_documents(bodies)
+        except Exception as e:
+            if attempt + 1 == MAX_BATCH_ATTEMPTS:
+                raise
+            backoff_seconds = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+            backoff_seconds *= random.uniform(0.5, 1.0)
+            tqdm.tqdm.write(f"[1-augment-with-embeddings.py] Batch failed ({e}), retrying in {backoff_seconds:.1f}s")
+            time.sleep(backoff_seconds)
+
 
 if __name__ == "__main__":
     #
@@ -46,16 +133,55 @@ if __name__ == "__main__":
         action="store_true",
         help="Force re-computation",
     )
+    parser.add_argument(
+        "-c",
+        metavar="CONCURRENCY",
+        type=int,
+        help="Number of batches embedded at once",
+        default=EMBEDDING_BATCH_CONCURRENCY,
+    )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        help="Max embedding requests per minute",
+        default=EMBEDDING_REQUESTS_PER_MINUTE,
+    )
+    parser.add_argument(
+        "--tpm",
+        type=int,
+        help="Max embedded tokens per minute",
+        default=EMBEDDING_TOKENS_PER_MINUTE,
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=EMBEDDING_STORE_DTYPES,
+        help=f"Storage type of the vectors (default: that of the existing store, else {EMBEDDING_STORE_DTYPE})",
+        default=None,
+    )
     args = parser.parse_args()
 
     embeddings = get_embeddings()
     embedding_file_path = os.path.join(this_dir, EMBEDDING_FILE_NAME)
+    embedding_store_path = os.path.join(this_dir, EMBEDDING_STORE_FILE_NAME)
+    checkpoint_file_path = os.path.join(this_dir, EMBEDDING_CHECKPOINT_FILE_NAME)
 
-    if os.path.isfile(embedding_file_path):
-        # review_id -> vector, which was stored in a compressed format to shrink file size
-        enrichment = deflate_embeddings_map(json.load(open(embedding_file_path)))
+    if not embedding_store_exists(embedding_store_path) and os.path.isfile(embedding_file_path):
+        num_converted = convert_embeddings_json(
+            embedding_file_path, embedding_store_path, dtype=args.dtype or EMBEDDING_STORE_DTYPE
+        )
+        print(f"[1-augment-with-embeddings.py] Converted {num_converted} embeddings from '{embedding_file_path}'.")
+
+    if embedding_store_exists(embedding_store_path):
+        # review_id -> vector, memory-mapped from the binary store
+        enrichment = open_embedding_store(embedding_store_path)
     else:
-        enrichment = {}
+        enrichment = EmbeddingStore([], np.empty((0, EMBEDDING_DIMENSION), dtype=EMBEDDING_STORE_DTYPE))
+    # review_id -> vector computed by this run: starting with those of an interrupted run
+    # (newer than the store, hence never recomputed, even with -f)
+    checkpointed = load_embeddings_checkpoint(checkpoint_file_path)
+    computed = dict(checkpointed)
+    if checkpointed:
+        print(f"[1-augment-with-embeddings.py] Resuming: {len(checkpointed)} embeddings found in '{checkpoint_file_path}'.")
 
     hotel_review_file_path = os.path.join(this_dir, HOTEL_REVIEW_FILE_NAME)
     hotel_review_data = pd.read_csv(hotel_review_file_path)
@@ -63,7 +189,7 @@ if __name__ == "__main__":
     reviews_to_embed = []
     for _, row in hotel_review_data.iterrows():
         review_id = row["id"]
-        if review_id not in enrichment or args.force:
+        if review_id not in computed and (review_id not in enrichment or args.force):
             if args.n is None or len(reviews_to_embed) < args.n:
                 reviews_to_embed.append(
                     {
@@ -77,21 +203,51 @@ if __name__ == "__main__":
         if args.n is not None and len(reviews_to_embed) >= args.n:
             break
 
-    # scan 'todos' and compute embeddings, then store them to json
+    # scan 'todos' and compute embeddings (appended to the checkpoint as batches complete)
+    batches = [
+        reviews_to_embed[batch_start : batch_start + EMBEDDING_BATCH_SIZE]
+        for batch_start in range(0, len(reviews_to_embed), EMBEDDING_BATCH_SIZE)
+    ]
+    rate_limiter = MinuteRateLimiter(requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
     done = 0
-    num_batches = (len(reviews_to_embed) + BATCH_SIZE - 1) // BATCH_SIZE
-    for batch_index in tqdm.tqdm(range(num_batches)):
-        this_batch = reviews_to_embed[
-            BATCH_SIZE * batch_index : BATCH_SIZE * (batch_index + 1)
+    with open(checkpoint_file_path, "a") as checkpoint_file:
+        with ThreadPoolExecutor(max_workers=args.c) as tpe:
+            futures = [tpe.submit(embed_batch, embeddings, rate_limiter, batch) for batch in batches]
+            try:
+                for future in tqdm.tqdm(as_completed(futures), total=len(futures)):
+                    this_batch, embedding_vectors = future.result()
+                    batch_enrichment = {
+                        item["id"]: vector
+                        for item, vector in zip(this_batch, embedding_vectors)
+                    }
+                    append_embeddings_checkpoint(checkpoint_file, batch_enrichment)
+                    computed.update(
+                        (review_id, np.asarray(vector, dtype=np.float32))
+                        for review_id, vector in batch_enrichment.items()
+                    )
+                    done += len(embedding_vectors)
+            except BaseException:
+                # (what is checkpointed so far is kept: rerun the script to resume)
+                for future in futures:
+                    future.cancel()
+                raise
+
+    # consolidate: the store is rewritten once (recomputed vectors replace their row),
+    # then the checkpoint is not needed anymore
+    store_dtype = args.dtype or enrichment.dtype
+    if computed or store_dtype != enrichment.dtype:
+        review_ids = enrichment.review_ids + [
+            review_id for review_id in computed if review_id not in enrichment
         ]
-        bodies = [item["body"] for item in this_batch]
-        embedding_vectors = embeddings.embed_documents(bodies)
-        #
-        for item, vector in zip(this_batch, embedding_vectors):
-            enrichment[item["id"]] = vector
-        #
-        with open(embedding_file_path, "w") as o_json:
-            json.dump(compress_embeddings_map(enrichment), o_json, indent=4)
-        done += len(embedding_vectors)
-
-    print(f"[1-augment-with-embeddings.py] Finished. {done} embeddings computed and stored to '{embedding_file_path}'.")
+        write_embedding_store(
+            embedding_store_path,
+            review_ids,
+            (computed[review_id] if review_id in computed else enrichment[review_id] for review_id in review_ids),
+            dtype=store_dtype,
+        )
+    os.remove(checkpoint_file_path)
+
+    print(
+        f"[1-augment-with-embeddings.py] Finished. {done} embeddings computed and stored to "
+        f"{' and '.join(embedding_store_file_paths(embedding_store_path))}."
+    )
@@ -1,52 +1,39 @@
 import os
-import sys
-import json
 import argparse
-import pandas as pd
-from itertools import groupby
-from typing import Dict, List
-import concurrent.futures
 
-from setup.embedding_dump import deflate_embeddings_map
-from setup.setup_constants import EMBEDDING_FILE_NAME, HOTEL_REVIEW_FILE_NAME
+import tqdm
 
-from utils.db import get_astra_db_client
-from utils.ai import EMBEDDING_DIMENSION
-from utils.reviews import format_review_content_for_embedding, get_review_vectorstore
-
-
-# We create an ad-hoc "Embeddings" class, sitting on the precalculated embeddings,
-# to perform all these insertions idiomatically through the LangChain
-# abstraction. This is to avoid having to work at the astrapy level
-# while still taking advantage of the stored json with precalculated vectors.
-from langchain.embeddings.base import Embeddings
-
-
-class JustPreCalculatedEmbeddings(Embeddings):
-    def __init__(self, precalc_dict: Dict[str, List[float]]) -> None:
-        self.precalc_dict = precalc_dict
-
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return [self.embed_query(txt) for txt in texts]
+from common_constants import REVIEW_VECTOR_COLLECTION_NAME
+from setup.bulk_loading import LoadingCheckpoint, insert_documents_idempotently, load_batches
+from setup.embedding_store import open_precalculated_embeddings
+from setup.ingestion import (
+    create_review_vector_collection,
+    read_review_records,
+    review_vector_document,
+    save_missing_vector_ids,
+)
+from setup.setup_constants import HOTEL_REVIEW_FILE_NAME, INGESTION_CHUNK_SIZE, INSERTION_BATCH_SIZE
 
-    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
-        return self.embed_documents(texts)
+from utils.db import get_astra_db_client
+from utils.batching import batch_iterable
 
-    def embed_query(self, text: str) -> List[float]:
-        if text in self.precalc_dict:
-            return self.precalc_dict[text]
-        else:
-            # this happens from LangChain when creating the store:
-            print(f"** [JustPreCalculatedEmbeddings] INFO: embed request for '{text}'. Returning moot results")
-            return [0.0] * EMBEDDING_DIMENSION
 
-    async def aembed_query(self, text: str) -> List[float]:
-        return self.embed_query(text)
+# Script that writes the reviews, with their precalculated vectors, to the review vector collection.
+#
+# The documents are built straight from the review_id -> vector mapping of the precalculated
+# embeddings (see setup/embedding_store.py), in the layout of the LangChain vector store
+# used by the API, and written with bounded concurrency.
+# Reviews without a precalculated vector are left out, and their ids listed in a file.
+#
+# Insertions are idempotent, retried on transient failures, and checkpointed:
+# an interrupted run resumes where it stopped when launched again (see setup/bulk_loading.py).
 
 
 this_dir = os.path.abspath(os.path.dirname(__file__))
 DEFAULT_CONCURRENT_BATCHES = 50
 
+REVIEW_VECTOR_COLUMNS = ["hotel_id", "id", "title", "text", "rating"]
+
 
 if __name__ == "__main__":
     astra_db_client = get_astra_db_client()
@@ -61,58 +48,51 @@ if __name__ == "__main__":
         help="Number of insertion batches running at once",
         default=DEFAULT_CONCURRENT_BATCHES,
     )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Replace the documents already in the collection (e.g. after recomputing the embeddings)",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore the checkpoint of an interrupted run (already-inserted documents are left as they are)",
+    )
     args = parser.parse_args()
 
+    # review_id -> vector
+    enrichment = open_precalculated_embeddings()
+    if enrichment is None:
+        print("[2-populate-review-vector-collection.py] No precalculated embeddings found (see step 1).")
+        raise SystemExit(1)
 
-    embedding_file_path = os.path.join(this_dir, EMBEDDING_FILE_NAME)
-    if os.path.isfile(embedding_file_path):
-        # review_id -> vector, which was stored in a compressed format to shrink file size
-        enrichment = deflate_embeddings_map(json.load(open(embedding_file_path)))
-    else:
-        enrichment = {}
+    review_vector_col = create_review_vector_collection(astra_db_client)
 
     hotel_review_file_path = os.path.join(this_dir, HOTEL_REVIEW_FILE_NAME)
-    hotel_review_data = pd.read_csv(hotel_review_file_path)
-
-    # sadly the precalc map for this "embeddings" must be sentence -> vector,
-    # so we need a 'join' (which amounts to a preprocess pass through the hotel reviews dataframe)
-    precalc_text_to_vector_map = {
-        format_review_content_for_embedding(
-            title=row["title"], body=row["text"]
-        ): enrichment[row["id"]]
-        for _, row in hotel_review_data.iterrows()
-        if row["id"] in enrichment
-    }
-    c_embeddings = JustPreCalculatedEmbeddings(precalc_dict=precalc_text_to_vector_map)
-
-    review_vectorstore = get_review_vectorstore(embeddings=c_embeddings, astra_db_client=astra_db_client)
-
-    eligibles = [
-        {
-            "text": format_review_content_for_embedding(
-                title=row["title"], body=row["text"]
-            ),
-            "metadata": {
-                "hotel_id": row["hotel_id"],
-                "rating": row["rating"],
-                "title": row["title"],
-            },
-            "id": row["id"],
-        }
-        for _, row in hotel_review_data.iterrows()
-        if row["id"] in enrichment
-    ]
-
-    texts, metadatas, ids = zip(*[
-        (itm["text"], itm["metadata"], itm["id"])
-        for itm in eligibles
-    ])
-
-    inserted_ids = review_vectorstore.add_texts(
-        texts=texts,
-        metadatas=metadatas,
-        ids=ids,
-        batch_concurrency=args.c,
+    missing_vector_ids = []
+
+    def review_vector_documents():
+        review_records = read_review_records(hotel_review_file_path, INGESTION_CHUNK_SIZE, columns=REVIEW_VECTOR_COLUMNS)
+        for record in tqdm.tqdm(review_records, unit="review"):
+            review_vector = enrichment.get(record["id"])
+            if review_vector is None:
+                missing_vector_ids.append(record["id"])
+            else:
+                yield review_vector_document(record, review_vector)
+
+    num_inserted, num_skipped = load_batches(
+        batch_iterable(review_vector_documents(), INSERTION_BATCH_SIZE),
+        lambda doc_batch: insert_documents_idempotently(review_vector_col, doc_batch, overwrite=args.overwrite),
+        checkpoint=LoadingCheckpoint(REVIEW_VECTOR_COLLECTION_NAME, restart=args.restart),
+        document_id=lambda doc: doc["_id"],
+        concurrency=args.c,
+        description="Review vector insertion",
     )
 
-    print(f"\n[2-populate-review-vector-collection.py] Finished. {len(inserted_ids)} rows written.")
+    if missing_vector_ids:
+        missing_vector_ids_file_path = save_missing_vector_ids(missing_vector_ids)
+        print(
+            f"\n[2-populate-review-vector-collection.py] {len(missing_vector_ids)} reviews have no precalculated "
+            f"vector (not inserted): ids listed in '{missing_vector_ids_file_path}'."
+        )
+    print(f"\n[2-populate-review-vector-collection.py] Finished. {num_inserted} rows written ({num_skipped} done already).")
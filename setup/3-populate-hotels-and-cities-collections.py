@@ -1,13 +1,19 @@
 import os
+import argparse
 
 import pandas as pd
 
 from common_constants import HOTELS_COLLECTION_NAME, CITIES_COLLECTION_NAME
+from setup.bulk_loading import LoadingCheckpoint, insert_documents_idempotently, load_batches
 from setup.setup_constants import HOTEL_REVIEW_FILE_NAME, INSERTION_BATCH_SIZE
 from utils.db import get_astra_db_client
 from utils.batching import batch_iterable
 
 
+# Insertions are idempotent, retried on transient failures, and checkpointed:
+# an interrupted run resumes where it stopped when launched again (see setup/bulk_loading.py).
+
+
 this_dir = os.path.abspath(os.path.dirname(__file__))
 astra_db_client = get_astra_db_client()
 
@@ -20,7 +26,7 @@ def create_city_collection():
     return astra_db_client.create_collection(CITIES_COLLECTION_NAME)
 
 
-def populate_city_collection_from_csv(city_col):
+def populate_city_collection_from_csv(city_col, restart=False):
     hotel_review_file_path = os.path.join(this_dir, HOTEL_REVIEW_FILE_NAME)
     hotel_review_data = pd.read_csv(hotel_review_file_path)
     city_centres = pd.DataFrame(
@@ -54,14 +60,19 @@ def populate_city_collection_from_csv(city_col):
         }
         for _, row in city_centres_df.iterrows()
     )
-    for doc_batch in batch_iterable(docs_to_insert, INSERTION_BATCH_SIZE):
-        _docs = list(doc_batch)
-        city_col.insert_many(_docs)
+    num_inserted, num_skipped = load_batches(
+        batch_iterable(docs_to_insert, INSERTION_BATCH_SIZE),
+        lambda doc_batch: insert_documents_idempotently(city_col, doc_batch),
+        checkpoint=LoadingCheckpoint(CITIES_COLLECTION_NAME, restart=restart),
+        document_id=lambda doc: doc["_id"],
+        concurrency=1,
+        description="City insertion",
+    )
 
-    print(f"[3-populate-hotels-and-cities-collections.py] Inserted {len(city_centres_df)} cities")
+    print(f"[3-populate-hotels-and-cities-collections.py] Inserted {num_inserted} cities ({num_skipped} done already)")
 
 
-def populate_hotel_collection_from_csv(hotel_col):
+def populate_hotel_collection_from_csv(hotel_col, restart=False):
     hotel_review_file_path = os.path.join(this_dir, HOTEL_REVIEW_FILE_NAME)
     hotel_review_data = pd.read_csv(hotel_review_file_path)
     chosen_columns = pd.DataFrame(
@@ -86,6 +97,8 @@ def populate_hotel_collection_from_csv(hotel_col):
         }
     )
     hotel_df = renamed_columns.drop_duplicates()
+    # materialized review counters (step 5 inserts one review per CSV row)
+    review_counts = hotel_review_data["hotel_id"].value_counts()
 
     docs_to_insert = (
         {
@@ -97,18 +110,35 @@ def populate_hotel_collection_from_csv(hotel_col):
             "country": row["country"],
             "latitude": row["latitude"],
             "longitude": row["longitude"],
+            "num_reviews": int(review_counts[row["id"]]),
         }
         for _, row in hotel_df.iterrows()
     )
-    for doc_batch in batch_iterable(docs_to_insert, INSERTION_BATCH_SIZE):
-        _docs = list(doc_batch)
-        hotel_col.insert_many(_docs)
+    num_inserted, num_skipped = load_batches(
+        batch_iterable(docs_to_insert, INSERTION_BATCH_SIZE),
+        lambda doc_batch: insert_documents_idempotently(hotel_col, doc_batch),
+        checkpoint=LoadingCheckpoint(HOTELS_COLLECTION_NAME, restart=restart),
+        document_id=lambda doc: doc["_id"],
+        concurrency=1,
+        description="Hotel insertion",
+    )
 
-    print(f"[3-populate-hotels-and-cities-collections.py] Inserted {len(hotel_df)} hotels")
+    print(f"[3-populate-hotels-and-cities-collections.py] Inserted {num_inserted} hotels ({num_skipped} done already)")
 
 
 if __name__ == "__main__":
+    #
+    parser = argparse.ArgumentParser(
+        description="Store hotels and cities to Astra DB collections"
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore the checkpoint of an interrupted run (already-inserted documents are left as they are)",
+    )
+    args = parser.parse_args()
+
     hotel_col = create_hotel_collection()
-    populate_hotel_collection_from_csv(hotel_col)
+    populate_hotel_collection_from_csv(hotel_col, restart=args.restart)
     city_col = create_city_collection()
-    populate_city_collection_from_csv(city_col)
+    populate_city_collection_from_csv(city_col, restart=args.restart)
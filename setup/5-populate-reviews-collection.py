@@ -1,9 +1,10 @@
 import os
+import argparse
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor
 import datetime
 
 from common_constants import REVIEWS_COLLECTION_NAME
+from setup.bulk_loading import LoadingCheckpoint, insert_documents_idempotently, load_batches
 from setup.setup_constants import HOTEL_REVIEW_FILE_NAME, INSERTION_BATCH_SIZE, INSERTION_BATCH_CONCURRENCY
 from utils.reviews import choose_featured
 from utils.db import get_astra_db_client
@@ -11,6 +12,10 @@ from utils.batching import batch_iterable
 from utils.dates import datetime_to_json_block
 
 
+# Insertions are idempotent, retried on transient failures, and checkpointed:
+# an interrupted run resumes where it stopped when launched again (see setup/bulk_loading.py).
+
+
 this_dir = os.path.abspath(os.path.dirname(__file__))
 astra_db_client = get_astra_db_client()
 
@@ -24,7 +29,7 @@ def parse_date(date_str) -> datetime.datetime:
     return datetime.datetime.strptime(trunc_date, "%Y-%m-%d")
 
 
-def populate_reviews_collection_from_csv(rev_col):
+def populate_reviews_collection_from_csv(rev_col, restart=False):
     hotel_review_file_path = os.path.join(this_dir, HOTEL_REVIEW_FILE_NAME)
     hotel_review_data = pd.read_csv(hotel_review_file_path)
 
@@ -65,20 +70,29 @@ def populate_reviews_collection_from_csv(rev_col):
         for _, row in review_df.iterrows()
     )
 
-    with ThreadPoolExecutor(max_workers=INSERTION_BATCH_CONCURRENCY) as tpe:
-        _ = list(
-            tpe.map(
-                rev_col.insert_many,
-                (
-                    list(batch)
-                    for batch in batch_iterable(docs_to_insert, INSERTION_BATCH_SIZE)
-                ),
-            )
-        )
+    num_inserted, num_skipped = load_batches(
+        batch_iterable(docs_to_insert, INSERTION_BATCH_SIZE),
+        lambda doc_batch: insert_documents_idempotently(rev_col, doc_batch),
+        checkpoint=LoadingCheckpoint(REVIEWS_COLLECTION_NAME, restart=restart),
+        document_id=lambda doc: doc["_id"],
+        concurrency=INSERTION_BATCH_CONCURRENCY,
+        description="Review insertion",
+    )
 
-    print(f"[5-populate-reviews-collection.py] Inserted {len(review_df)} reviews")
+    print(f"[5-populate-reviews-collection.py] Inserted {num_inserted} reviews ({num_skipped} done already)")
 
 
 if __name__ == "__main__":
+    #
+    parser = argparse.ArgumentParser(
+        description="Store reviews to Astra DB collection"
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore the checkpoint of an interrupted run (already-inserted documents are left as they are)",
+    )
+    args = parser.parse_args()
+
     rev_col = create_reviews_collection()
-    populate_reviews_collection_from_csv(rev_col)
+    populate_reviews_collection_from_csv(rev_col, restart=args.restart)
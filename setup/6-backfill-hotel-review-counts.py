@@ -0,0 +1,58 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from common_constants import HOTELS_COLLECTION_NAME, REVIEWS_COLLECTION_NAME
+from setup.setup_constants import INSERTION_BATCH_CONCURRENCY
+from utils.db import get_astra_db_client
+from utils.hotels import set_hotel_review_count
+
+# Script that (re)builds the per-hotel review counters stored on the hotel documents.
+# Step 3 already writes the counters when populating from the CSV: this is only needed
+# for databases populated before the counters existed, or to fix counters that drifted.
+#
+# This script performs the following operations:
+#  - Pages once through the whole reviews collection, counting reviews by hotel_id.
+#  - Pages through the hotels collection and writes the count onto each hotel (zero if none).
+
+
+astra_db_client = get_astra_db_client()
+
+
+def count_reviews_by_hotel():
+    review_col = astra_db_client.collection(REVIEWS_COLLECTION_NAME)
+    return Counter(
+        review_doc["hotel_id"]
+        for review_doc in review_col.paginated_find(
+            projection={
+                "hotel_id": 1,
+            },
+        )
+    )
+
+
+def list_hotel_ids():
+    hotels_col = astra_db_client.collection(HOTELS_COLLECTION_NAME)
+    return [
+        hotel_doc["_id"]
+        for hotel_doc in hotels_col.paginated_find(
+            # Current workaround to "get me just _id" projection:
+            projection={
+                "not_a_field": 1,
+            },
+        )
+    ]
+
+
+if __name__ == "__main__":
+    review_counts = count_reviews_by_hotel()
+    hotel_ids = list_hotel_ids()
+
+    with ThreadPoolExecutor(max_workers=INSERTION_BATCH_CONCURRENCY) as tpe:
+        _ = list(
+            tpe.map(
+                lambda hotel_id: set_hotel_review_count(hotel_id, review_counts[hotel_id]),
+                hotel_ids,
+            )
+        )
+
+    print(f"[6-backfill-hotel-review-counts.py] Updated review counters for {len(hotel_ids)} hotels")
@@ -0,0 +1,72 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import tqdm
+
+from common_constants import HOTELS_COLLECTION_NAME
+from utils.ai import enable_llm_cache
+from utils.db import get_astra_db_client
+from utils.summaries import refresh_base_hotel_summary
+
+# Note that the LLM calls made by this script are likely to incur a financial cost.
+#
+# Script that fills the store of precomputed base hotel summaries (see utils/summaries.py),
+# so that the base summary endpoint never has to call the LLM on the request path.
+#
+# This script performs the following operations:
+#  - Pages through the hotels collection to get all hotel IDs.
+#  - For each hotel, selects the reviews for the base summary and, unless
+#    the stored summary was generated from the very same reviews, calls the LLM and stores the result.
+
+
+DEFAULT_CONCURRENCY = 8
+
+
+def list_hotel_ids():
+    hotels_col = get_astra_db_client().collection(HOTELS_COLLECTION_NAME)
+    return [
+        hotel_doc["_id"]
+        for hotel_doc in hotels_col.paginated_find(
+            # Current workaround to "get me just _id" projection:
+            projection={
+                "not_a_field": 1,
+            },
+        )
+    ]
+
+
+if __name__ == "__main__":
+    #
+    parser = argparse.ArgumentParser(
+        description="Precompute the base summary for all hotels"
+    )
+    parser.add_argument(
+        "-c",
+        metavar="CONCURRENCY",
+        type=int,
+        help="Number of hotels processed at once",
+        default=DEFAULT_CONCURRENCY,
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="Force re-computation of up-to-date summaries",
+    )
+    args = parser.parse_args()
+
+    enable_llm_cache()
+    hotel_ids = list_hotel_ids()
+
+    with ThreadPoolExecutor(max_workers=args.c) as tpe:
+        refreshed = list(
+            tqdm.tqdm(
+                tpe.map(
+                    lambda hotel_id: refresh_base_hotel_summary(hotel_id, force=args.force),
+                    hotel_ids,
+                ),
+                total=len(hotel_ids),
+            )
+        )
+
+    print(f"[7-precompute-base-hotel-summaries.py] Finished. {sum(refreshed)} of {len(hotel_ids)} summaries (re)generated.")
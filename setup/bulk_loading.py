@@ -0,0 +1,150 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List
+
+import httpx
+
+# Resumable, idempotent bulk loading (used by setup steps 2, 3 and 5, and by setup/ingest_all.py):
+#   - insertions tolerate documents that exist already (a batch, or a whole load, can be replayed),
+#   - transient failures (network errors, rate limiting, server errors) are retried with backoff,
+#   - each completed batch is recorded in a checkpoint file, only ever appended to:
+#     a load interrupted (or failed) midway skips, when run again, the batches already done.
+# The checkpoint is removed once the load is complete.
+
+
+this_dir = os.path.abspath(os.path.dirname(__file__))
+
+LOADING_CHECKPOINT_DIR_NAME = "loading_checkpoints"
+
+MAX_BATCH_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+
+def is_transient_error(error: Exception) -> bool:
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+
+def call_with_retries(func: Callable[[], Any], description: str) -> Any:
+    for attempt in range(MAX_BATCH_ATTEMPTS):
+        try:
+            return func()
+        except Exception as e:
+            if attempt + 1 == MAX_BATCH_ATTEMPTS or not is_transient_error(e):
+                raise
+            backoff_seconds = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+            backoff_seconds *= random.uniform(0.5, 1.0)
+            print(f"[bulk_loading] {description} failed ({e}), retrying in {backoff_seconds:.1f}s")
+            time.sleep(backoff_seconds)
+
+
+# Documents with an _id found in the collection already are left untouched (and not an error),
+# or replaced with overwrite=True
+def insert_documents_idempotently(collection, documents: List[Dict[str, Any]], overwrite: bool = False):
+    im_result = collection.insert_many(
+        documents=documents,
+        options={"ordered": False},
+        partial_failures_allowed=True,
+    )
+    unexpected_errors = [
+        error
+        for error in im_result.get("errors", [])
+        if error.get("errorCode") != "DOCUMENT_ALREADY_EXISTS"
+    ]
+    if unexpected_errors:
+        raise ValueError(f"API Exception while running bulk insertion: {str(unexpected_errors)}")
+    if overwrite and im_result.get("errors"):
+        inserted_ids = set(im_result.get("status", {}).get("insertedIds", []))
+        for document in documents:
+            if document["_id"] not in inserted_ids:
+                collection.find_one_and_replace(filter={"_id": document["_id"]}, replacement=document)
+
+
+# A batch is identified by its first and last document ids, and its size
+def batch_key(document_ids: List[str]) -> str:
+    return f"{document_ids[0]}:{document_ids[-1]}:{len(document_ids)}"
+
+
+class LoadingCheckpoint:
+    """The keys of the completed batches of a load, in setup/loading_checkpoints/<name>.done"""
+
+    def __init__(self, name: str, restart: bool = False):
+        self.file_path = os.path.join(this_dir, LOADING_CHECKPOINT_DIR_NAME, f"{name}.done")
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        if restart and os.path.isfile(self.file_path):
+            os.remove(self.file_path)
+        self.done_keys = set()
+        if os.path.isfile(self.file_path):
+            with open(self.file_path) as checkpoint_file:
+                # (a line cut short by an interruption just does not match any batch)
+                self.done_keys = set(checkpoint_file.read().splitlines())
+        self.checkpoint_file = open(self.file_path, "a")
+        self.lock = threading.Lock()
+
+    def is_done(self, key: str) -> bool:
+        return key in self.done_keys
+
+    def mark_done(self, key: str):
+        with self.lock:
+            self.done_keys.add(key)
+            self.checkpoint_file.write(f"{key}\n")
+            self.checkpoint_file.flush()
+
+    def close(self):
+        self.checkpoint_file.close()
+
+    # Once the load is complete: the checkpoint is removed
+    def complete(self):
+        self.close()
+        os.remove(self.file_path)
+
+
+# Runs load_batch on each batch not done yet, at most `concurrency` at once
+# (the batches are consumed as they go, so that they can come from a generator).
+# Returns the number of documents loaded and of those skipped as already done.
+# A failing batch (after retries) stops the load, after the batches in progress.
+def load_batches(
+    batches: Iterable[List[Dict[str, Any]]],
+    load_batch: Callable[[List[Dict[str, Any]]], Any],
+    checkpoint: LoadingCheckpoint,
+    document_id: Callable[[Dict[str, Any]], str],
+    concurrency: int,
+    description: str,
+):
+    def _load(batch, key):
+        call_with_retries(lambda: load_batch(batch), f"{description} (batch {key})")
+        checkpoint.mark_done(key)
+        return len(batch)
+
+    num_loaded = 0
+    num_skipped = 0
+    running = set()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as tpe:
+            try:
+                for batch in batches:
+                    key = batch_key([document_id(document) for document in batch])
+                    if checkpoint.is_done(key):
+                        num_skipped += len(batch)
+                        continue
+                    if len(running) >= 2 * concurrency:
+                        done, running = wait(running, return_when=FIRST_COMPLETED)
+                        num_loaded += sum(future.result() for future in done)
+                    running.add(tpe.submit(_load, batch, key))
+                num_loaded += sum(future.result() for future in running)
+            except BaseException:
+                for future in running:
+                    future.cancel()
+                raise
+    finally:
+        # (on failure, the checkpoint file stays, for the next run to resume from)
+        checkpoint.close()
+    checkpoint.complete()
+    return num_loaded, num_skipped
@@ -0,0 +1,34 @@
+import os
+import argparse
+
+from setup.embedding_store import EMBEDDING_STORE_DTYPES, convert_embeddings_json, embedding_store_file_paths
+from setup.setup_constants import EMBEDDING_FILE_NAME, EMBEDDING_STORE_DTYPE, EMBEDDING_STORE_FILE_NAME
+
+# Script that converts precalculated embeddings from the base64-in-JSON format
+# (precalculated_embeddings.json) to the binary embedding store read by the setup steps
+# (see setup/embedding_store.py). The JSON file is left in place.
+
+
+this_dir = os.path.abspath(os.path.dirname(__file__))
+
+if __name__ == "__main__":
+    #
+    parser = argparse.ArgumentParser(
+        description="Convert the precalculated embeddings JSON file to the binary embedding store"
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=EMBEDDING_STORE_DTYPES,
+        help="Storage type of the vectors (float16 halves the size, with a small loss of precision)",
+        default=EMBEDDING_STORE_DTYPE,
+    )
+    args = parser.parse_args()
+
+    embedding_file_path = os.path.join(this_dir, EMBEDDING_FILE_NAME)
+    embedding_store_path = os.path.join(this_dir, EMBEDDING_STORE_FILE_NAME)
+    num_vectors = convert_embeddings_json(embedding_file_path, embedding_store_path, dtype=args.dtype)
+
+    print(
+        f"[convert_embeddings_json.py] Finished. {num_vectors} embeddings ({args.dtype}) "
+        f"stored to {' and '.join(embedding_store_file_paths(embedding_store_path))}."
+    )
@@ -1,20 +1,41 @@
-import struct
-import base64
+import json
+import os
 
 from utils.ai import EMBEDDING_DIMENSION
+from utils.vector_codec import decode_vector, decode_vector_array, encode_vector
 
 
-def compress_embeddings_map(deflated_emb_map):
-    def _compress_floats(f_list):
-        byte_buf = struct.pack("%if" % EMBEDDING_DIMENSION, *f_list)
-        return base64.b64encode(byte_buf).decode()
+# (the vectors are packed float32, base64-encoded: see utils/vector_codec.py)
 
-    return {k: _compress_floats(v) for k, v in deflated_emb_map.items()}
+def compress_embeddings_map(deflated_emb_map):
+    return {k: encode_vector(v) for k, v in deflated_emb_map.items()}
 
 
 def deflate_embeddings_map(compressed_emb_map):
-    def _deflate_floats(f_buf_str):
-        byte_buf = base64.b64decode(f_buf_str)
-        return struct.unpack("%if" % EMBEDDING_DIMENSION, byte_buf)
+    return {k: decode_vector(v) for k, v in compressed_emb_map.items()}
+
+
+# Checkpoint of an embedding run: one JSON line per review, {"id": ..., "vector": <compressed>},
+# only ever appended to (the cost of saving a batch does not grow with the progress made).
+# A line cut short by an interruption is ignored when reading it back.
+# (the vectors are read back as float32 NumPy arrays, not tuples of Python floats)
+
+def append_embeddings_checkpoint(checkpoint_file, deflated_emb_map):
+    for k, v in deflated_emb_map.items():
+        checkpoint_file.write(json.dumps({"id": k, "vector": encode_vector(v)}) + "\n")
+    checkpoint_file.flush()
+
 
-    return {k: _deflate_floats(v) for k, v in compressed_emb_map.items()}
+def load_embeddings_checkpoint(checkpoint_file_path):
+    deflated_emb_map = {}
+    if os.path.isfile(checkpoint_file_path):
+        with open(checkpoint_file_path) as checkpoint_file:
+            for line in checkpoint_file:
+                try:
+                    entry = json.loads(line)
+                    vector = decode_vector_array(entry["vector"])
+                except (ValueError, KeyError):
+                    continue
+                if len(vector) == EMBEDDING_DIMENSION:
+                    deflated_emb_map[entry["id"]] = vector
+    return deflated_emb_map
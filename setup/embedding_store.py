@@ -0,0 +1,141 @@
+import json
+import os
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from setup.setup_constants import EMBEDDING_FILE_NAME, EMBEDDING_STORE_FILE_NAME
+from utils.ai import EMBEDDING_DIMENSION
+from utils.vector_codec import decode_vector_array
+
+# Binary store of the precalculated embeddings, made of two files:
+#   - "<store_path>.npy": the vectors as one contiguous matrix (NumPy .npy format,
+#     float32 or float16), which is memory-mapped when read: only the rows
+#     actually accessed are paged in, and no Python float object is created;
+#   - "<store_path>.ids": the review_id of each row, one per line, in row order.
+# Compared to the base64-in-JSON format (see embedding_dump.py), nothing has to be
+# decoded when loading, and a vector takes 6 KB (3 KB as float16) in memory.
+
+EMBEDDING_STORE_DTYPES = ("float32", "float16")
+
+this_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def embedding_store_file_paths(store_path):
+    return f"{store_path}.npy", f"{store_path}.ids"
+
+
+def embedding_store_exists(store_path):
+    return all(os.path.isfile(file_path) for file_path in embedding_store_file_paths(store_path))
+
+
+class EmbeddingStore:
+    """
+    review_id -> vector, backed by a (possibly memory-mapped) matrix.
+    The vectors handed out are read-only views into the matrix, in the stored dtype.
+    """
+
+    def __init__(self, review_ids: List[str], matrix: np.ndarray):
+        if len(review_ids) != matrix.shape[0]:
+            raise ValueError(f"Embedding store mismatch: {len(review_ids)} ids for {matrix.shape[0]} vectors")
+        self.review_ids = review_ids
+        self.matrix = matrix
+        self.row_index = {review_id: row for row, review_id in enumerate(review_ids)}
+
+    def __len__(self):
+        return len(self.review_ids)
+
+    def __contains__(self, review_id):
+        return review_id in self.row_index
+
+    def __getitem__(self, review_id) -> np.ndarray:
+        return self.matrix[self.row_index[review_id]]
+
+    def get(self, review_id, default=None) -> Optional[np.ndarray]:
+        row = self.row_index.get(review_id)
+        return default if row is None else self.matrix[row]
+
+    def items(self):
+        for row, review_id in enumerate(self.review_ids):
+            yield review_id, self.matrix[row]
+
+    @property
+    def dtype(self) -> str:
+        return self.matrix.dtype.name
+
+
+def open_embedding_store(store_path, mmap=True) -> EmbeddingStore:
+    matrix_file_path, ids_file_path = embedding_store_file_paths(store_path)
+    matrix = np.load(matrix_file_path, mmap_mode="r" if mmap else None)
+    with open(ids_file_path) as ids_file:
+        review_ids = ids_file.read().splitlines()
+    return EmbeddingStore(review_ids, matrix)
+
+
+# The vectors (any sequences of floats) are written one by one to the memory-mapped
+# output, which is only put in place once complete: an interrupted write leaves
+# the previous store untouched (and a store may be rewritten from a view of itself).
+def write_embedding_store(store_path, review_ids: List[str], vectors: Iterable, dtype="float32") -> int:
+    if dtype not in EMBEDDING_STORE_DTYPES:
+        raise ValueError(f"Unsupported embedding store dtype '{dtype}' (choose from {EMBEDDING_STORE_DTYPES})")
+    matrix_file_path, ids_file_path = embedding_store_file_paths(store_path)
+    temp_matrix_file_path, temp_ids_file_path = f"{matrix_file_path}.tmp", f"{ids_file_path}.tmp"
+    try:
+        matrix = np.lib.format.open_memmap(
+            temp_matrix_file_path,
+            mode="w+",
+            dtype=dtype,
+            shape=(len(review_ids), EMBEDDING_DIMENSION),
+        )
+        num_written = 0
+        for row, vector in enumerate(vectors):
+            matrix[row] = vector
+            num_written += 1
+        if num_written != len(review_ids):
+            raise ValueError(f"Embedding store mismatch: {len(review_ids)} ids for {num_written} vectors")
+        matrix.flush()
+        del matrix
+        with open(temp_ids_file_path, "w") as ids_file:
+            ids_file.writelines(f"{review_id}\n" for review_id in review_ids)
+    except BaseException:
+        for temp_file_path in (temp_matrix_file_path, temp_ids_file_path):
+            if os.path.isfile(temp_file_path):
+                os.remove(temp_file_path)
+        raise
+    os.replace(temp_matrix_file_path, matrix_file_path)
+    os.replace(temp_ids_file_path, ids_file_path)
+    return num_written
+
+
+# ### From the base64-in-JSON format
+
+
+def read_embeddings_json_as_store(json_file_path) -> EmbeddingStore:
+    compressed_emb_map = json.load(open(json_file_path))
+    matrix = np.empty((len(compressed_emb_map), EMBEDDING_DIMENSION), dtype=np.float32)
+    for row, compressed_vector in enumerate(compressed_emb_map.values()):
+        matrix[row] = decode_vector_array(compressed_vector)
+    return EmbeddingStore(list(compressed_emb_map.keys()), matrix)
+
+
+def convert_embeddings_json(json_file_path, store_path, dtype="float32") -> int:
+    compressed_emb_map = json.load(open(json_file_path))
+    return write_embedding_store(
+        store_path,
+        list(compressed_emb_map.keys()),
+        (decode_vector_array(compressed_vector) for compressed_vector in compressed_emb_map.values()),
+        dtype=dtype,
+    )
+
+
+# The precalculated embeddings of the setup, from the binary store if there is one,
+# else from the former JSON format (decoded in memory: run setup.convert_embeddings_json
+# once instead); None if there are none.
+def open_precalculated_embeddings() -> Optional[EmbeddingStore]:
+    embedding_store_path = os.path.join(this_dir, EMBEDDING_STORE_FILE_NAME)
+    embedding_file_path = os.path.join(this_dir, EMBEDDING_FILE_NAME)
+    if embedding_store_exists(embedding_store_path):
+        return open_embedding_store(embedding_store_path)
+    elif os.path.isfile(embedding_file_path):
+        return read_embeddings_json_as_store(embedding_file_path)
+    return None
@@ -0,0 +1,178 @@
+import os
+import argparse
+
+import tqdm
+
+from common_constants import (
+    CITIES_COLLECTION_NAME,
+    HOTELS_COLLECTION_NAME,
+    REVIEW_VECTOR_COLLECTION_NAME,
+    REVIEWS_COLLECTION_NAME,
+    USERS_COLLECTION_NAME,
+)
+from setup.bulk_loading import LoadingCheckpoint
+from setup.embedding_store import open_precalculated_embeddings
+from setup.ingestion import (
+    DEFAULT_SINK_QUEUE_SIZE,
+    CollectionSink,
+    HotelAggregator,
+    create_review_vector_collection,
+    read_review_records,
+    review_document,
+    review_vector_document,
+    save_missing_vector_ids,
+)
+from setup.setup_constants import (
+    HOTEL_REVIEW_FILE_NAME,
+    INGESTION_CHUNK_SIZE,
+    INSERTION_BATCH_CONCURRENCY,
+    INSERTION_BATCH_SIZE,
+)
+from utils.db import get_astra_db_client
+
+# Script that loads all collections at once, in place of steps 2 to 5
+# (it needs the cleaned CSV and, for the vector collection, the precalculated embeddings).
+#
+# This script performs the following operations:
+#  - Creates the collections (including the, initially empty, users collection).
+#  - Streams the hotel review CSV once, sending each review to the reviews collection
+#    and, with its precalculated vector, to the review vector collection.
+#  - Meanwhile counts the reviews of each hotel and averages the position of each city:
+#    once the stream is over, the hotels and cities collections are filled in turn.
+# Each collection is written by its own workers, with its own batch size and concurrency
+# (see setup/ingestion.py). An interrupted run resumes where it stopped when launched again.
+
+
+this_dir = os.path.abspath(os.path.dirname(__file__))
+
+# sink -> (collection, default concurrency): the hotels and cities are few
+SINKS = {
+    "reviews": (REVIEWS_COLLECTION_NAME, INSERTION_BATCH_CONCURRENCY),
+    "review_vectors": (REVIEW_VECTOR_COLLECTION_NAME, INSERTION_BATCH_CONCURRENCY),
+    "hotels": (HOTELS_COLLECTION_NAME, 4),
+    "cities": (CITIES_COLLECTION_NAME, 4),
+}
+
+
+# "SINK=NUMBER" command-line settings
+def sink_setting(text):
+    sink_name, _, value = text.partition("=")
+    if sink_name not in SINKS or not value.isdigit() or int(value) < 1:
+        raise argparse.ArgumentTypeError(f"expected SINK=NUMBER, with SINK one of {', '.join(SINKS)}")
+    return sink_name, int(value)
+
+
+def create_collection(astra_db_client, collection_name):
+    if collection_name == REVIEW_VECTOR_COLLECTION_NAME:
+        return create_review_vector_collection(astra_db_client)
+    return astra_db_client.create_collection(collection_name)
+
+
+if __name__ == "__main__":
+    #
+    parser = argparse.ArgumentParser(
+        description="Load all collections in a single pass over the hotel review CSV"
+    )
+    parser.add_argument(
+        "--sinks",
+        nargs="+",
+        choices=list(SINKS),
+        help="Collections to load (default: all)",
+        default=list(SINKS),
+    )
+    parser.add_argument(
+        "--concurrency",
+        metavar="SINK=NUMBER",
+        type=sink_setting,
+        action="append",
+        help="Number of insertion batches running at once for a sink (can be repeated)",
+        default=[],
+    )
+    parser.add_argument(
+        "--batch-size",
+        metavar="SINK=NUMBER",
+        type=sink_setting,
+        action="append",
+        help=f"Documents per insertion for a sink (can be repeated; default: {INSERTION_BATCH_SIZE})",
+        default=[],
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        help="Insertion batches waiting, at most, for each sink",
+        default=DEFAULT_SINK_QUEUE_SIZE,
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help="Number of CSV rows read at once",
+        default=INGESTION_CHUNK_SIZE,
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore the checkpoints of an interrupted run (already-inserted documents are left as they are)",
+    )
+    args = parser.parse_args()
+    concurrencies = {sink_name: default_concurrency for sink_name, (_, default_concurrency) in SINKS.items()}
+    concurrencies.update(args.concurrency)
+    batch_sizes = {sink_name: INSERTION_BATCH_SIZE for sink_name in SINKS}
+    batch_sizes.update(args.batch_size)
+
+    sink_names = list(dict.fromkeys(args.sinks))
+    enrichment = None
+    if "review_vectors" in sink_names:
+        # review_id -> vector
+        enrichment = open_precalculated_embeddings()
+        if enrichment is None:
+            print("[ingest_all.py] No precalculated embeddings found: skipping the review vector collection.")
+            sink_names.remove("review_vectors")
+
+    astra_db_client = get_astra_db_client()
+    _ = astra_db_client.create_collection(USERS_COLLECTION_NAME)
+    sinks = {
+        sink_name: CollectionSink(
+            sink_name,
+            create_collection(astra_db_client, SINKS[sink_name][0]),
+            batch_size=batch_sizes[sink_name],
+            concurrency=concurrencies[sink_name],
+            queue_size=args.queue_size,
+            checkpoint=LoadingCheckpoint(SINKS[sink_name][0], restart=args.restart),
+        )
+        for sink_name in sink_names
+    }
+
+    hotel_review_file_path = os.path.join(this_dir, HOTEL_REVIEW_FILE_NAME)
+    aggregator = HotelAggregator()
+    num_reviews = 0
+    missing_vector_ids = []
+    for record in tqdm.tqdm(read_review_records(hotel_review_file_path, args.chunk_size), unit="review"):
+        num_reviews += 1
+        aggregator.add(record)
+        if "reviews" in sinks:
+            sinks["reviews"].put(review_document(record))
+        if "review_vectors" in sinks:
+            review_vector = enrichment.get(record["id"])
+            if review_vector is None:
+                missing_vector_ids.append(record["id"])
+            else:
+                sinks["review_vectors"].put(review_vector_document(record, review_vector))
+    if "hotels" in sinks:
+        sinks["hotels"].put_all(aggregator.hotel_documents())
+    if "cities" in sinks:
+        sinks["cities"].put_all(aggregator.city_documents())
+
+    for sink in sinks.values():
+        sink.close()
+
+    for sink_name, sink in sinks.items():
+        print(
+            f"[ingest_all.py] Inserted {sink.inserted} documents into the {SINKS[sink_name][0]} collection "
+            f"({sink.skipped} done already)"
+        )
+    if missing_vector_ids:
+        print(
+            f"[ingest_all.py] {len(missing_vector_ids)} of {num_reviews} reviews have no precalculated vector "
+            f"(not inserted): ids listed in '{save_missing_vector_ids(missing_vector_ids)}'."
+        )
+    print(f"[ingest_all.py] Finished. {num_reviews} reviews read.")
@@ -0,0 +1,242 @@
+import datetime
+import os
+import queue
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from setup.bulk_loading import LoadingCheckpoint, batch_key, call_with_retries, insert_documents_idempotently
+from common_constants import REVIEW_VECTOR_COLLECTION_NAME
+from setup.setup_constants import INSERTION_BATCH_SIZE, MISSING_VECTOR_IDS_FILE_NAME
+from utils.ai import EMBEDDING_DIMENSION
+from utils.dates import datetime_to_json_block
+from utils.reviews import _review_vector_document, choose_featured
+
+# Building blocks of the single-pass ingestion (see setup/ingest_all.py):
+# the cleaned review CSV is streamed once, and each record is fanned out to "sinks",
+# one per collection, which turn records into documents and insert them in batches.
+#
+# Each sink has its own batch size, number of worker threads and bounded queue of
+# pending batches: a slow sink (typically the vector collection, with the largest
+# documents) makes the reader wait instead of piling up documents in memory,
+# while the faster sinks keep going at their own pace.
+# Insertions are idempotent and retried, and the sinks can be given a checkpoint
+# (skipping, when the ingestion is run again, the batches it had completed).
+
+this_dir = os.path.abspath(os.path.dirname(__file__))
+
+# Batches waiting for a worker, per sink (on top of those being inserted)
+DEFAULT_SINK_QUEUE_SIZE = 64
+
+
+def read_review_records(csv_file_path, chunk_size, columns: Optional[List[str]] = None) -> Iterable[Dict[str, Any]]:
+    for review_chunk in pd.read_csv(csv_file_path, chunksize=chunk_size, usecols=columns):
+        yield from review_chunk.to_dict("records")
+
+
+def create_review_vector_collection(astra_db_client):
+    # (as the LangChain vector store would create it)
+    return astra_db_client.create_collection(REVIEW_VECTOR_COLLECTION_NAME, dimension=EMBEDDING_DIMENSION)
+
+
+# Reviews without a precalculated vector are not written to the vector collection:
+# their ids are listed in a file (e.g. to embed them with step 1), whose path is returned.
+def save_missing_vector_ids(review_ids: List[str]) -> str:
+    file_path = os.path.join(this_dir, MISSING_VECTOR_IDS_FILE_NAME)
+    with open(file_path, "w") as ids_file:
+        ids_file.writelines(f"{review_id}\n" for review_id in review_ids)
+    return file_path
+
+
+def parse_date(date_str) -> datetime.datetime:
+    trunc_date = date_str[: date_str.find("T")]
+    return datetime.datetime.strptime(trunc_date, "%Y-%m-%d")
+
+
+# The review fields as written to the collections (with the fallbacks of step 5)
+def review_fields(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "hotel_id": record["hotel_id"],
+        "review_id": record["id"],
+        "title": record["title"] if isinstance(record["title"], str) else "Review",
+        "body": record["text"] if isinstance(record["text"], str) else "(empty review)",
+        "rating": 5.0 if pd.isna(record["rating"]) else record["rating"],
+    }
+
+
+def review_document(record: Dict[str, Any]) -> Dict[str, Any]:
+    fields = review_fields(record)
+    return {
+        # it so happens that the review ID is globally unique
+        "_id": fields["review_id"],
+        # the data:
+        "hotel_id": fields["hotel_id"],
+        # Caution: datetimes are at play here
+        "date_added": datetime_to_json_block(parse_date(record["date"])),
+        "id": fields["review_id"],
+        "title": fields["title"],
+        "body": fields["body"],
+        "rating": fields["rating"],
+        "featured": choose_featured(record["review_upvotes"]),
+    }
+
+
+def review_vector_document(record: Dict[str, Any], review_vector) -> Dict[str, Any]:
+    fields = review_fields(record)
+    return _review_vector_document(
+        fields["hotel_id"],
+        fields["review_id"],
+        fields["title"],
+        fields["body"],
+        fields["rating"],
+        # (the embedding store hands out NumPy views)
+        review_vector.tolist(),
+    )
+
+
+class HotelAggregator:
+    """Hotels and city centres, accumulated over the stream (emitted once it is over)."""
+
+    def __init__(self):
+        # hotel_id -> hotel document (first occurrence), with its review count
+        self.hotels: Dict[str, Dict[str, Any]] = {}
+        # (country, city) -> [latitude sum, latitude count, longitude sum, longitude count]
+        self.city_sums: Dict[Any, List[float]] = {}
+
+    def add(self, record: Dict[str, Any]):
+        hotel_id = record["hotel_id"]
+        if hotel_id not in self.hotels:
+            self.hotels[hotel_id] = {
+                # it so happens that the hotel ID is globally unique
+                "_id": hotel_id,
+                # the data:
+                "name": record["hotel_name"],
+                "city": record["hotel_city"],
+                "country": record["hotel_country"],
+                "latitude": record["hotel_latitude"],
+                "longitude": record["hotel_longitude"],
+                # materialized review counter (one review per record)
+                "num_reviews": 0,
+            }
+        self.hotels[hotel_id]["num_reviews"] += 1
+        # city centre: mean position over the review rows, as the former step 3 did
+        # (with the same handling of missing values as its pandas groupby)
+        if pd.isna(record["hotel_country"]) or pd.isna(record["hotel_city"]):
+            return
+        city_sums = self.city_sums.setdefault((record["hotel_country"], record["hotel_city"]), [0.0, 0, 0.0, 0])
+        if not pd.isna(record["hotel_latitude"]):
+            city_sums[0] += record["hotel_latitude"]
+            city_sums[1] += 1
+        if not pd.isna(record["hotel_longitude"]):
+            city_sums[2] += record["hotel_longitude"]
+            city_sums[3] += 1
+
+    def hotel_documents(self) -> Iterable[Dict[str, Any]]:
+        return self.hotels.values()
+
+    def city_documents(self) -> Iterable[Dict[str, Any]]:
+        for (country, city), (latitude_sum, latitude_count, longitude_sum, longitude_count) in self.city_sums.items():
+            yield {
+                # our _id will be '{country}/{city}' consistently
+                "_id": f"{country}/{city}",
+                # the data:
+                "country": country,
+                "city": city,
+                "latitude": latitude_sum / latitude_count if latitude_count else float("nan"),
+                "longitude": longitude_sum / longitude_count if longitude_count else float("nan"),
+            }
+
+
+class CollectionSink:
+    """
+    Inserts the documents it is given into a collection, by batches, from its worker threads.
+    put() is called from the reading thread and blocks while the queue is full.
+    close() waits for all insertions, then raises the first insertion error, if any
+    (after an error, put() raises as well, to stop the reading early).
+    The checkpoint, if any, is completed by close() when all insertions succeeded.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        collection,
+        batch_size: int = INSERTION_BATCH_SIZE,
+        concurrency: int = 1,
+        queue_size: int = DEFAULT_SINK_QUEUE_SIZE,
+        checkpoint: Optional[LoadingCheckpoint] = None,
+    ):
+        self.name = name
+        self.collection = collection
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.pending_documents: List[Dict[str, Any]] = []
+        self.inserted = 0
+        self.skipped = 0
+        self.error: Optional[Exception] = None
+        self.lock = threading.Lock()
+        self.workers = [
+            threading.Thread(target=self._work, name=f"{name}-sink-{worker_index}", daemon=True)
+            for worker_index in range(concurrency)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def _work(self):
+        while True:
+            queued = self.batches.get()
+            if queued is None:
+                return
+            if self.error is not None:
+                # (keep draining the queue, so that the reading thread is never stuck)
+                continue
+            batch, key = queued
+            try:
+                call_with_retries(
+                    lambda: insert_documents_idempotently(self.collection, batch),
+                    f"Insertion into the {self.name} collection (batch {key})",
+                )
+            except Exception as e:
+                with self.lock:
+                    self.error = self.error or e
+                continue
+            if self.checkpoint is not None:
+                self.checkpoint.mark_done(key)
+            with self.lock:
+                self.inserted += len(batch)
+
+    def _enqueue_pending(self):
+        batch, self.pending_documents = self.pending_documents, []
+        key = batch_key([document["_id"] for document in batch])
+        if self.checkpoint is not None and self.checkpoint.is_done(key):
+            self.skipped += len(batch)
+        else:
+            self.batches.put((batch, key))
+
+    def _check_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"Insertion into the {self.name} collection failed: {self.error}") from self.error
+
+    def put(self, document: Dict[str, Any]):
+        self._check_error()
+        self.pending_documents.append(document)
+        if len(self.pending_documents) >= self.batch_size:
+            self._enqueue_pending()
+
+    def put_all(self, documents: Iterable[Dict[str, Any]]):
+        for document in documents:
+            self.put(document)
+
+    def close(self):
+        if self.pending_documents:
+            self._enqueue_pending()
+        for _ in self.workers:
+            self.batches.put(None)
+        for worker in self.workers:
+            worker.join()
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+        self._check_error()
+        if self.checkpoint is not None:
+            self.checkpoint.complete()
@@ -1,3 +1,5 @@
+from common_constants import INSERTION_BATCH_SIZE  # 20 is the max in JSON API (also used by the API)
+
 # File names are relative to "setup/"
 RAW_REVIEW_SOURCE_FILE_NAME = "original/Datafiniti_Hotel_Reviews_Jun19.csv"
 EMBEDDING_FILE_NAME = "precalculated_embeddings.json"
@@ -6,5 +8,24 @@ HOTEL_REVIEW_FILE_NAME = "hotel_reviews.csv"
 MAX_REVIEW_TEXT_LENGTH = 4096
 MAX_REVIEW_TITLE_LENGTH = 256
 
-INSERTION_BATCH_SIZE = 20  # 20 is the max in JSON API
-INSERTION_BATCH_CONCURRENCY = 20
\ No newline at end of file
+# Rows of the raw CSV cleaned at once (step 0)
+CSV_CLEANING_CHUNK_SIZE = 50000
+# Rows of the cleaned CSV read at once by the single-pass ingestion (setup/ingest_all.py)
+INGESTION_CHUNK_SIZE = 10000
+
+INSERTION_BATCH_CONCURRENCY = 20
+
+# Embedding computation (step 1): concurrent batches, kept within the provider rate limits
+# (the defaults fit a low OpenAI usage tier: raise them to match your account)
+EMBEDDING_BATCH_SIZE = 20
+EMBEDDING_BATCH_CONCURRENCY = 8
+EMBEDDING_REQUESTS_PER_MINUTE = 3000
+EMBEDDING_TOKENS_PER_MINUTE = 1000000
+EMBEDDING_CHECKPOINT_FILE_NAME = "precalculated_embeddings.checkpoint.jsonl"
+
+# Binary, memory-mappable embedding store (see setup/embedding_store.py):
+# files "precalculated_embeddings.npy" (vectors) and "precalculated_embeddings.ids"
+EMBEDDING_STORE_FILE_NAME = "precalculated_embeddings"
+EMBEDDING_STORE_DTYPE = "float32"
+# Ids of the reviews left out of the vector collection for lack of a precalculated vector
+MISSING_VECTOR_IDS_FILE_NAME = "reviews_without_vector.txt"
@@ -0,0 +1,23 @@
+import os
+
+# The tests run hermetically, as the benchmarks do: on the in-process emulation
+# of the Data API and the local LLM/embeddings stand-ins.
+# (This must happen before the application modules are imported.)
+os.environ["ASTRA_DB_BACKEND"] = "local"
+os.environ["LOCAL_DATA_API_SNAPSHOT_FILE"] = ""
+os.environ["LLM_PROVIDER"] = "Local"
+os.environ["EMBEDDINGS_PROVIDER"] = "Local"
+os.environ["TERSE_LOGGING"] = "1"
+
+import pytest
+
+from utils.local_data_api import get_local_data_api
+
+
+# Each test starts from (and leaves behind) empty databases
+@pytest.fixture
+def local_data_api():
+    data_api = get_local_data_api()
+    data_api.namespaces.clear()
+    yield data_api
+    data_api.namespaces.clear()
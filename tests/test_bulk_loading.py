@@ -0,0 +1,175 @@
+import httpx
+import pytest
+
+from setup import bulk_loading
+from setup.bulk_loading import (
+    LoadingCheckpoint,
+    batch_key,
+    call_with_retries,
+    insert_documents_idempotently,
+    is_transient_error,
+    load_batches,
+)
+from utils.batching import batch_iterable
+from utils.db import get_astra_db_client
+
+
+@pytest.fixture(autouse=True)
+def checkpoint_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_loading, "this_dir", str(tmp_path))
+    monkeypatch.setattr(bulk_loading, "BACKOFF_BASE_SECONDS", 0)
+    return tmp_path / bulk_loading.LOADING_CHECKPOINT_DIR_NAME
+
+
+@pytest.fixture
+def collection(local_data_api):
+    return get_astra_db_client().create_collection("bulk_test")
+
+
+def documents(num_documents: int, version: int = 1):
+    return [
+        {"_id": f"doc_{document_index:03d}", "version": version}
+        for document_index in range(num_documents)
+    ]
+
+
+def stored_documents(collection):
+    return {document["_id"]: document for document in collection.paginated_find()}
+
+
+def http_status_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://local-data-api")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status_code, request=request))
+
+
+def test_transient_errors():
+    assert is_transient_error(httpx.ConnectError("connection refused"))
+    assert is_transient_error(http_status_error(429))
+    assert is_transient_error(http_status_error(503))
+    assert not is_transient_error(http_status_error(400))
+    assert not is_transient_error(ValueError("invalid document"))
+
+
+def test_call_with_retries():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise httpx.ReadTimeout("timeout")
+        return "done"
+
+    assert call_with_retries(flaky, "flaky call") == "done"
+    assert len(attempts) == 3
+
+    def invalid():
+        attempts.append(1)
+        raise ValueError("invalid document")
+
+    attempts.clear()
+    with pytest.raises(ValueError):
+        call_with_retries(invalid, "invalid call")
+    assert len(attempts) == 1
+
+    def unavailable():
+        attempts.append(1)
+        raise http_status_error(503)
+
+    attempts.clear()
+    with pytest.raises(httpx.HTTPStatusError):
+        call_with_retries(unavailable, "unavailable call")
+    assert len(attempts) == bulk_loading.MAX_BATCH_ATTEMPTS
+
+
+def test_insertion_is_idempotent(collection):
+    insert_documents_idempotently(collection, documents(5))
+    insert_documents_idempotently(collection, documents(8, version=2))
+    stored = stored_documents(collection)
+    assert len(stored) == 8
+    # (existing documents are left untouched)
+    assert [stored[f"doc_{document_index:03d}"]["version"] for document_index in range(8)] == [1] * 5 + [2] * 3
+
+
+def test_insertion_with_overwrite(collection):
+    insert_documents_idempotently(collection, documents(5))
+    insert_documents_idempotently(collection, documents(8, version=2), overwrite=True)
+    assert {document["version"] for document in stored_documents(collection).values()} == {2}
+
+
+def test_checkpoint_keeps_the_completed_batches(checkpoint_dir):
+    checkpoint = LoadingCheckpoint("bulk_test")
+    checkpoint.mark_done("a:b:2")
+    checkpoint.close()
+    # (a line cut short by an interruption)
+    with open(checkpoint_dir / "bulk_test.done", "a") as checkpoint_file:
+        checkpoint_file.write("c:d")
+
+    resumed_checkpoint = LoadingCheckpoint("bulk_test")
+    assert resumed_checkpoint.is_done("a:b:2")
+    assert not resumed_checkpoint.is_done("c:d:2")
+    resumed_checkpoint.close()
+
+    assert not LoadingCheckpoint("bulk_test", restart=True).is_done("a:b:2")
+
+
+def load(collection, all_documents, batch_size: int = 4, restart: bool = False, fail_from_batch=None):
+    loaded_batches = []
+
+    def _load_batch(batch):
+        if fail_from_batch is not None and batch[0]["_id"] >= fail_from_batch:
+            raise ValueError("invalid document")
+        insert_documents_idempotently(collection, batch)
+        loaded_batches.append(batch)
+
+    return load_batches(
+        batch_iterable(all_documents, batch_size),
+        _load_batch,
+        checkpoint=LoadingCheckpoint("bulk_test", restart=restart),
+        document_id=lambda document: document["_id"],
+        # (one at a time: the batches done before the failure are known)
+        concurrency=1,
+        description="Test load",
+    )
+
+
+def test_interrupted_load_resumes(collection, checkpoint_dir):
+    with pytest.raises(ValueError):
+        load(collection, documents(20), fail_from_batch="doc_012")
+    assert len(stored_documents(collection)) == 12
+    checkpoint_file_path = checkpoint_dir / "bulk_test.done"
+    assert checkpoint_file_path.read_text().splitlines() == [
+        batch_key([document["_id"] for document in batch])
+        for batch in batch_iterable(documents(12), 4)
+    ]
+
+    assert load(collection, documents(20)) == (8, 12)
+    assert len(stored_documents(collection)) == 20
+    assert not checkpoint_file_path.exists()
+
+
+def test_restarted_load_ignores_the_checkpoint(collection, checkpoint_dir):
+    with pytest.raises(ValueError):
+        load(collection, documents(20), fail_from_batch="doc_008")
+    # (the documents inserted already are not an error)
+    assert load(collection, documents(20), restart=True) == (20, 0)
+    assert len(stored_documents(collection)) == 20
+
+
+def test_failed_load_closes_its_checkpoint(checkpoint_dir):
+    checkpoint = LoadingCheckpoint("bulk_test")
+
+    def _failing_load_batch(batch):
+        raise ValueError("invalid document")
+
+    with pytest.raises(ValueError):
+        load_batches(
+            batch_iterable(documents(8), 4),
+            _failing_load_batch,
+            checkpoint=checkpoint,
+            document_id=lambda document: document["_id"],
+            concurrency=2,
+            description="Test load",
+        )
+    assert checkpoint.checkpoint_file.closed
+    # (kept, for the next run to resume from)
+    assert (checkpoint_dir / "bulk_test.done").is_file()
@@ -0,0 +1,133 @@
+from langchain.schema import Generation
+from langchain.schema.cache import BaseCache
+
+from utils.ai import _create_remote_llm_cache
+from utils.llm_cache import InstrumentedLLMCache, TwoTierLLMCache
+
+LLM_STRING = "[('model_name', 'local')]"
+
+
+def generations(text: str):
+    return [Generation(text=text)]
+
+
+class DictCache(BaseCache):
+    """Remote tier stand-in, recording its calls"""
+
+    def __init__(self):
+        self.entries = {}
+        self.lookups = 0
+        self.updates = 0
+
+    def lookup(self, prompt, llm_string):
+        self.lookups += 1
+        return self.entries.get((prompt, llm_string))
+
+    def update(self, prompt, llm_string, return_val):
+        self.updates += 1
+        self.entries[(prompt, llm_string)] = return_val
+
+    def clear(self, **kwargs):
+        self.entries.clear()
+
+
+class DictCacheFactory:
+
+    def __init__(self):
+        self.created = []
+
+    def __call__(self):
+        self.created.append(DictCache())
+        return self.created[-1]
+
+
+def test_remote_tier_is_created_on_first_use():
+    factory = DictCacheFactory()
+    cache = TwoTierLLMCache(remote_cache_factory=factory)
+    assert factory.created == []
+    assert cache.lookup("prompt", LLM_STRING) is None
+    cache.lookup("other prompt", LLM_STRING)
+    assert len(factory.created) == 1
+
+
+def test_update_writes_both_tiers_and_local_hits_stay_local():
+    factory = DictCacheFactory()
+    cache = TwoTierLLMCache(remote_cache_factory=factory)
+    cache.update("prompt", LLM_STRING, generations("completion"))
+    remote_cache = factory.created[0]
+    assert remote_cache.entries[("prompt", LLM_STRING)] == generations("completion")
+
+    assert cache.lookup("prompt", LLM_STRING) == generations("completion")
+    assert remote_cache.lookups == 0
+    stats = cache.stats()
+    assert (stats["local_hits"], stats["local_misses"], stats["remote_hits"], stats["remote_misses"]) == (1, 0, 0, 0)
+
+
+def test_remote_hit_is_copied_to_the_local_tier():
+    factory = DictCacheFactory()
+    # (e.g. written by another API worker)
+    remote_cache = factory()
+    remote_cache.update("prompt", LLM_STRING, generations("completion"))
+    cache = TwoTierLLMCache(remote_cache_factory=lambda: remote_cache)
+
+    assert cache.lookup("prompt", LLM_STRING) == generations("completion")
+    assert cache.lookup("prompt", LLM_STRING) == generations("completion")
+    assert remote_cache.lookups == 1
+    stats = cache.stats()
+    assert (stats["local_hits"], stats["local_misses"], stats["remote_hits"], stats["remote_misses"]) == (1, 1, 1, 0)
+    assert stats["local_hit_ratio"] == 0.5
+
+
+def test_llm_string_is_part_of_the_key():
+    cache = TwoTierLLMCache(remote_cache_factory=DictCacheFactory())
+    cache.update("prompt", LLM_STRING, generations("completion"))
+    assert cache.lookup("prompt", "[('model_name', 'another')]") is None
+
+
+def test_local_tier_alone():
+    cache = TwoTierLLMCache(remote_cache_factory=None)
+    assert cache.lookup("prompt", LLM_STRING) is None
+    cache.update("prompt", LLM_STRING, generations("completion"))
+    assert cache.lookup("prompt", LLM_STRING) == generations("completion")
+    assert cache.stats()["remote_misses"] == 0
+
+
+def test_local_tier_is_bounded():
+    factory = DictCacheFactory()
+    cache = TwoTierLLMCache(remote_cache_factory=factory, local_max_size=2)
+    for prompt_index in range(3):
+        cache.update(f"prompt {prompt_index}", LLM_STRING, generations(f"completion {prompt_index}"))
+    assert cache.stats()["local_size"] == 2
+    assert cache.stats()["local_evictions"] == 1
+    # the evicted entry comes back from the remote tier
+    assert cache.lookup("prompt 0", LLM_STRING) == generations("completion 0")
+    assert cache.stats()["remote_hits"] == 1
+
+
+def test_clear_clears_both_tiers():
+    factory = DictCacheFactory()
+    cache = TwoTierLLMCache(remote_cache_factory=factory)
+    cache.update("prompt", LLM_STRING, generations("completion"))
+    cache.clear()
+    assert cache.lookup("prompt", LLM_STRING) is None
+    assert factory.created[0].entries == {}
+
+
+def test_instrumented_cache_passes_through():
+    cache = InstrumentedLLMCache(TwoTierLLMCache(remote_cache_factory=None))
+    cache.update("prompt", LLM_STRING, generations("completion"))
+    assert cache.lookup("prompt", LLM_STRING) == generations("completion")
+    assert cache.lookup("other prompt", LLM_STRING) is None
+    # (attributes of the wrapped cache are reachable)
+    assert cache.stats()["local_hits"] == 1
+
+
+def test_astra_db_remote_tier(local_data_api):
+    cache = TwoTierLLMCache(remote_cache_factory=_create_remote_llm_cache)
+    cache.update("prompt", LLM_STRING, generations("completion"))
+
+    # as seen from another process: empty local tier, same database
+    other_cache = TwoTierLLMCache(remote_cache_factory=_create_remote_llm_cache)
+    assert other_cache.lookup("prompt", LLM_STRING) == generations("completion")
+    assert other_cache.lookup("other prompt", LLM_STRING) is None
+    assert (other_cache.stats()["remote_hits"], other_cache.stats()["remote_misses"]) == (1, 1)
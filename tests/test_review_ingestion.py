@@ -0,0 +1,190 @@
+import asyncio
+
+import pytest
+
+from common_constants import (
+    HOTELS_COLLECTION_NAME,
+    REVIEW_VECTOR_COLLECTION_NAME,
+    REVIEWS_COLLECTION_NAME,
+)
+from utils import ingestion
+from utils.ai import EMBEDDING_DIMENSION
+from utils.db import get_astra_db_client
+from utils.ingestion import ReviewIngestionQueue
+from utils.reviews import EMBEDDING_PENDING_FIELD
+
+
+def review_entry(review_index: int):
+    return {
+        "hotel_id": "hotel_a",
+        "review_id": f"review_{review_index}",
+        "title": f"Title {review_index}",
+        "body": "Body",
+        "rating": 4,
+    }
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(ingestion, "REVIEW_INGESTION_RETRY_BASE_DELAY_SECONDS", 0)
+
+
+# Stands in for the vector insertion (and the clearing of the flags),
+# failing its first `failures` calls
+class RecordingIngestion:
+
+    def __init__(self, monkeypatch, failures: int = 0):
+        self.failures = failures
+        self.calls = []
+        self.cleared_review_ids = []
+        monkeypatch.setattr(ingestion, "ainsert_batch_into_review_vector_collection", self.ainsert_batch)
+        monkeypatch.setattr(ingestion, "aclear_reviews_embedding_pending", self.aclear_pending)
+
+    async def ainsert_batch(self, review_entries):
+        self.calls.append([entry["review_id"] for entry in review_entries])
+        if len(self.calls) <= self.failures:
+            raise ValueError("embedding service unavailable")
+        return [entry["review_id"] for entry in review_entries]
+
+    async def aclear_pending(self, review_ids):
+        self.cleared_review_ids.extend(review_ids)
+
+
+async def run_queue(queue: ReviewIngestionQueue, review_entries):
+    queue.start()
+    for entry in review_entries:
+        await queue.enqueue(entry)
+    await queue.stop()
+
+
+def test_reviews_are_ingested_in_batches(monkeypatch):
+    recording = RecordingIngestion(monkeypatch)
+    queue = ReviewIngestionQueue(batch_size=2, batch_window_seconds=0.05)
+    asyncio.run(run_queue(queue, [review_entry(review_index) for review_index in range(5)]))
+
+    assert recording.calls == [["review_0", "review_1"], ["review_2", "review_3"], ["review_4"]]
+    assert recording.cleared_review_ids == [f"review_{review_index}" for review_index in range(5)]
+    stats = queue.stats()
+    assert (stats["ingested"], stats["failed"], stats["batches"], stats["depth"]) == (5, 0, 3, 0)
+
+
+def test_failed_batch_is_retried(monkeypatch):
+    recording = RecordingIngestion(monkeypatch, failures=ingestion.REVIEW_INGESTION_MAX_ATTEMPTS - 1)
+    queue = ReviewIngestionQueue(batch_size=10, batch_window_seconds=0.05)
+    asyncio.run(run_queue(queue, [review_entry(0), review_entry(1)]))
+
+    assert len(recording.calls) == ingestion.REVIEW_INGESTION_MAX_ATTEMPTS
+    assert recording.cleared_review_ids == ["review_0", "review_1"]
+    assert queue.stats()["ingested"] == 2
+    assert queue.stats()["failed"] == 0
+
+
+def test_batch_failing_every_attempt_stays_pending(monkeypatch):
+    recording = RecordingIngestion(monkeypatch, failures=ingestion.REVIEW_INGESTION_MAX_ATTEMPTS + 1)
+    queue = ReviewIngestionQueue(batch_size=10, batch_window_seconds=0.05)
+    asyncio.run(run_queue(queue, [review_entry(0), review_entry(1), review_entry(2)]))
+
+    assert len(recording.calls) == ingestion.REVIEW_INGESTION_MAX_ATTEMPTS
+    # (the flags are left in place, for the recovery at the next startup)
+    assert recording.cleared_review_ids == []
+    stats = queue.stats()
+    assert (stats["ingested"], stats["failed"], stats["depth"]) == (0, 3, 0)
+
+
+def test_worker_keeps_going_after_a_failed_batch(monkeypatch):
+    recording = RecordingIngestion(monkeypatch, failures=ingestion.REVIEW_INGESTION_MAX_ATTEMPTS)
+
+    async def _run(queue):
+        queue.start()
+        await queue.enqueue(review_entry(0))
+        await queue._queue.join()
+        await queue.enqueue(review_entry(1))
+        await queue.stop()
+
+    queue = ReviewIngestionQueue(batch_size=10, batch_window_seconds=0.01)
+    asyncio.run(_run(queue))
+
+    assert recording.cleared_review_ids == ["review_1"]
+    assert (queue.stats()["ingested"], queue.stats()["failed"]) == (1, 1)
+
+
+# ### On the local Data API
+
+
+@pytest.fixture
+def review_collections(local_data_api):
+    astra_db_client = get_astra_db_client()
+    for collection_name in [HOTELS_COLLECTION_NAME, REVIEWS_COLLECTION_NAME]:
+        astra_db_client.create_collection(collection_name)
+    astra_db_client.create_collection(REVIEW_VECTOR_COLLECTION_NAME, dimension=EMBEDDING_DIMENSION)
+    astra_db_client.collection(HOTELS_COLLECTION_NAME).insert_one({"_id": "hotel_a", "num_reviews": 0})
+    return astra_db_client
+
+
+def test_submitted_review_is_written_behind(review_collections, monkeypatch):
+    monkeypatch.setattr(ingestion, "review_ingestion_queue", ReviewIngestionQueue(batch_size=10, batch_window_seconds=0.01))
+
+    async def _submit():
+        ingestion.review_ingestion_queue.start()
+        review_id = await ingestion.asubmit_review_for_hotel("hotel_a", "Title", "Body", 5)
+        await ingestion.review_ingestion_queue.stop()
+        return review_id
+
+    review_id = asyncio.run(_submit())
+    review_doc = review_collections.collection(REVIEWS_COLLECTION_NAME).find_one({"_id": review_id})["data"]["document"]
+    assert EMBEDDING_PENDING_FIELD not in review_doc
+    vector_doc = review_collections.collection(REVIEW_VECTOR_COLLECTION_NAME).find_one({"_id": review_id})["data"]["document"]
+    assert vector_doc["metadata"]["hotel_id"] == "hotel_a"
+    hotel_doc = review_collections.collection(HOTELS_COLLECTION_NAME).find_one({"_id": "hotel_a"})["data"]["document"]
+    assert hotel_doc["num_reviews"] == 1
+
+
+def test_pending_reviews_are_recovered(review_collections, monkeypatch):
+    recording = RecordingIngestion(monkeypatch)
+    reviews_col = review_collections.collection(REVIEWS_COLLECTION_NAME)
+    reviews_col.insert_many([
+        {"_id": "review_0", "hotel_id": "hotel_a", "title": "T", "body": "B", "rating": 3, EMBEDDING_PENDING_FIELD: 1},
+        {"_id": "review_1", "hotel_id": "hotel_a", "title": "T", "body": "B", "rating": 3},
+    ])
+
+    async def _recover(queue):
+        queue.start()
+        num_recovered = await queue.arecover_pending()
+        await queue.stop()
+        return num_recovered
+
+    queue = ReviewIngestionQueue(batch_size=10, batch_window_seconds=0.01)
+    assert asyncio.run(_recover(queue)) == 1
+    assert recording.calls == [["review_0"]]
+
+
+def test_recovery_failure_is_not_raised(local_data_api):
+    # (no reviews collection)
+    queue = ReviewIngestionQueue(batch_size=10, batch_window_seconds=0.01)
+    assert asyncio.run(queue.arecover_pending()) == 0
+
+
+def test_bulk_submission_is_embedded_in_batches(review_collections, monkeypatch):
+    recording = RecordingIngestion(monkeypatch, failures=1)
+    monkeypatch.setattr(ingestion, "REVIEW_INGESTION_BATCH_SIZE", 4)
+    queue = ReviewIngestionQueue(batch_size=10, batch_window_seconds=0.01)
+    monkeypatch.setattr(ingestion, "review_ingestion_queue", queue)
+    bulk_entries = [
+        {"hotel_id": "hotel_a", "title": f"Title {review_index}", "body": "Body", "rating": 4}
+        for review_index in range(10)
+    ]
+
+    async def _submit():
+        queue.start()
+        results = await ingestion.asubmit_reviews_bulk(bulk_entries)
+        await queue.stop()
+        return results
+
+    results = asyncio.run(_submit())
+    assert all(result["success"] for result in results)
+    # the first batch failed, and went through the queue
+    assert [len(review_ids) for review_ids in recording.calls] == [4, 4, 2, 4]
+    assert recording.calls[-1] == recording.calls[0]
+    assert sorted(recording.cleared_review_ids) == sorted(result["review_id"] for result in results)
+    hotel_doc = review_collections.collection(HOTELS_COLLECTION_NAME).find_one({"_id": "hotel_a"})["data"]["document"]
+    assert hotel_doc["num_reviews"] == 10
@@ -0,0 +1,187 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from common_constants import REVIEW_VECTOR_COLLECTION_NAME
+from utils import reviews
+from utils.ai import EMBEDDING_DIMENSION
+from utils.db import get_astra_db_client
+from utils.review_vector_index import TOO_MANY_REVIEWS, ReviewVectorIndex
+
+HOTEL_ID = "hotel_a"
+
+
+# A vector pointing mostly along the given axis (the closest review to axis_vector(i) is the one made with i)
+def axis_vector(axis: int, noise: float = 0.1):
+    vector = np.full(EMBEDDING_DIMENSION, noise / EMBEDDING_DIMENSION)
+    vector[axis] = 1.0
+    return vector.tolist()
+
+
+def review_vector_doc(review_index: int, hotel_id: str = HOTEL_ID):
+    return reviews._review_vector_document(
+        hotel_id, f"{hotel_id}_review_{review_index}", f"Title {review_index}", "Body", 4, axis_vector(review_index)
+    )
+
+
+@pytest.fixture
+def review_vector_col(local_data_api):
+    astra_db_client = get_astra_db_client()
+    return astra_db_client.create_collection(REVIEW_VECTOR_COLLECTION_NAME, dimension=EMBEDDING_DIMENSION)
+
+
+def insert_reviews(review_vector_col, review_indices, hotel_id: str = HOTEL_ID):
+    review_vector_col.insert_many([review_vector_doc(review_index, hotel_id) for review_index in review_indices])
+
+
+def match_ids(review_matches):
+    return [review_id for _, _, review_id in review_matches]
+
+
+def test_hotel_not_in_index_is_a_miss(review_vector_col):
+    index = ReviewVectorIndex()
+    insert_reviews(review_vector_col, range(5))
+    assert index.search(HOTEL_ID, axis_vector(0), k=3) is None
+    assert index.stats()["remote_fallbacks"] == 1
+
+
+def test_loaded_hotel_is_searched_exactly(review_vector_col):
+    index = ReviewVectorIndex()
+    insert_reviews(review_vector_col, range(5))
+    insert_reviews(review_vector_col, range(5), hotel_id="hotel_b")
+    assert index._claim_load(HOTEL_ID)
+    index._load(HOTEL_ID)
+
+    review_matches = index.search(HOTEL_ID, axis_vector(2), k=3)
+    assert match_ids(review_matches)[0] == f"{HOTEL_ID}_review_2"
+    assert len(review_matches) == 3
+    assert all(review_id.startswith(f"{HOTEL_ID}_") for review_id in match_ids(review_matches))
+    content, metadata, _ = review_matches[0]
+    assert content == reviews.format_review_content_for_embedding("Title 2", "Body")
+    assert metadata["hotel_id"] == HOTEL_ID
+    assert index.stats()["local_searches"] == 1
+
+
+def test_local_search_matches_the_remote_search(review_vector_col):
+    index = ReviewVectorIndex()
+    insert_reviews(review_vector_col, range(8))
+    assert index._claim_load(HOTEL_ID)
+    index._load(HOTEL_ID)
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        query_vector = rng.random(EMBEDDING_DIMENSION).tolist()
+        remote_hits = review_vector_col.vector_find(query_vector, limit=3, filter={"metadata.hotel_id": HOTEL_ID})
+        assert match_ids(index.search(HOTEL_ID, query_vector, k=3)) == [hit["_id"] for hit in remote_hits]
+
+
+def test_reviews_added_during_load_are_kept(review_vector_col):
+    index = ReviewVectorIndex()
+    insert_reviews(review_vector_col, range(3))
+    assert index._claim_load(HOTEL_ID)
+    # a second load of the same hotel is not started
+    assert not index._claim_load(HOTEL_ID)
+    # (written after the load read the collection)
+    index.add_review(HOTEL_ID, review_vector_doc(7))
+    index._load(HOTEL_ID)
+
+    assert match_ids(index.search(HOTEL_ID, axis_vector(7), k=1)) == [f"{HOTEL_ID}_review_7"]
+    assert len(index._hotels.get(HOTEL_ID).review_ids) == 4
+
+
+def test_review_added_to_a_loaded_hotel(review_vector_col):
+    index = ReviewVectorIndex()
+    insert_reviews(review_vector_col, range(3))
+    assert index._claim_load(HOTEL_ID)
+    index._load(HOTEL_ID)
+    index.add_review(HOTEL_ID, review_vector_doc(9))
+    # (added once only, even if reported again)
+    index.add_review(HOTEL_ID, review_vector_doc(9))
+
+    assert match_ids(index.search(HOTEL_ID, axis_vector(9), k=1)) == [f"{HOTEL_ID}_review_9"]
+    assert len(index._hotels.get(HOTEL_ID).review_ids) == 4
+
+
+def test_review_added_to_a_hotel_not_in_index_is_ignored(review_vector_col):
+    index = ReviewVectorIndex()
+    index.add_review(HOTEL_ID, review_vector_doc(0))
+    assert index.search(HOTEL_ID, axis_vector(0), k=1) is None
+
+
+def test_failed_load_leaves_the_hotel_out(local_data_api):
+    # (no vector collection)
+    index = ReviewVectorIndex()
+    assert index._claim_load(HOTEL_ID)
+    index._load(HOTEL_ID)
+    assert index.search(HOTEL_ID, axis_vector(0), k=1) is None
+    assert index.stats()["load_failures"] == 1
+    # and can be loaded again
+    assert index._claim_load(HOTEL_ID)
+
+
+def test_too_large_hotel_is_searched_remotely(review_vector_col):
+    index = ReviewVectorIndex(max_reviews_per_hotel=3)
+    insert_reviews(review_vector_col, range(5))
+    assert index._claim_load(HOTEL_ID)
+    index._load(HOTEL_ID)
+    assert index.search(HOTEL_ID, axis_vector(0), k=3) is TOO_MANY_REVIEWS
+
+
+def test_evicted_hotel_is_a_miss_again(review_vector_col):
+    index = ReviewVectorIndex(max_hotels=1)
+    insert_reviews(review_vector_col, range(3))
+    insert_reviews(review_vector_col, range(3), hotel_id="hotel_b")
+    for hotel_id in [HOTEL_ID, "hotel_b"]:
+        assert index._claim_load(hotel_id)
+        index._load(hotel_id)
+    assert index.search(HOTEL_ID, axis_vector(0), k=1) is None
+    assert index.search("hotel_b", axis_vector(0), k=1) is not None
+
+
+# ### Through the review selection
+
+
+@pytest.fixture
+def recorded_loads(monkeypatch):
+    index = ReviewVectorIndex(max_reviews_per_hotel=3)
+    loaded_hotel_ids = []
+
+    # (loads run inline, to be deterministic)
+    def schedule_load(hotel_id):
+        loaded_hotel_ids.append(hotel_id)
+        if index._claim_load(hotel_id):
+            index._load(hotel_id)
+
+    monkeypatch.setattr(index, "schedule_load", schedule_load)
+    monkeypatch.setattr(index, "aschedule_load", schedule_load)
+    monkeypatch.setattr(reviews, "review_vector_index", index)
+    return index, loaded_hotel_ids
+
+
+def test_selection_loads_a_hotel_once(review_vector_col, recorded_loads):
+    index, loaded_hotel_ids = recorded_loads
+    insert_reviews(review_vector_col, range(3))
+    selections = [
+        reviews.select_hotel_reviews_for_user(HOTEL_ID, "profile", axis_vector(1))
+        for _ in range(3)
+    ]
+    assert loaded_hotel_ids == [HOTEL_ID]
+    assert index.stats()["local_searches"] == 2
+    # the remote and local searches agree
+    assert all(selection == selections[0] for selection in selections)
+    assert selections[0][0].id == f"{HOTEL_ID}_review_1"
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_selection_does_not_reload_a_too_large_hotel(review_vector_col, recorded_loads, use_async):
+    index, loaded_hotel_ids = recorded_loads
+    insert_reviews(review_vector_col, range(5))
+    for _ in range(3):
+        if use_async:
+            selection = asyncio.run(reviews.aselect_hotel_reviews_for_user(HOTEL_ID, "profile", axis_vector(4)))
+        else:
+            selection = reviews.select_hotel_reviews_for_user(HOTEL_ID, "profile", axis_vector(4))
+        assert selection[0].id == f"{HOTEL_ID}_review_4"
+    assert loaded_hotel_ids == [HOTEL_ID]
+    assert index.stats()["loads"] == 1
+    assert index.stats()["remote_fallbacks"] == 3
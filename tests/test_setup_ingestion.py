@@ -0,0 +1,157 @@
+import threading
+
+import httpx
+import pandas as pd
+import pytest
+
+from setup import bulk_loading
+from setup.bulk_loading import LoadingCheckpoint
+from setup.ingestion import CollectionSink, HotelAggregator
+from utils.db import get_astra_db_client
+
+
+@pytest.fixture(autouse=True)
+def checkpoint_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_loading, "this_dir", str(tmp_path))
+    return tmp_path
+
+
+# Runs func in a thread, failing (instead of hanging the test run) if it does not return in time
+def run_with_timeout(func, timeout_seconds: float = 10):
+    outcome = {}
+
+    def _run():
+        try:
+            outcome["result"] = func()
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    thread.join(timeout_seconds)
+    assert not thread.is_alive(), "deadlock"
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
+
+
+class FailingCollection:
+    """Collection whose insertions all fail (with a non-transient error)"""
+
+    def __init__(self):
+        self.insertions = 0
+        self.lock = threading.Lock()
+
+    def insert_many(self, documents, options=None, partial_failures_allowed=False):
+        with self.lock:
+            self.insertions += 1
+        raise ValueError("invalid document")
+
+
+def documents(num_documents: int):
+    return [{"_id": f"doc_{document_index:03d}", "value": document_index} for document_index in range(num_documents)]
+
+
+@pytest.fixture
+def collection(local_data_api):
+    return get_astra_db_client().create_collection("sink_test")
+
+
+def test_sink_inserts_all_documents(collection):
+    sink = CollectionSink("sink_test", collection, batch_size=7, concurrency=3, queue_size=2)
+    sink.put_all(documents(50))
+    run_with_timeout(sink.close)
+    assert (sink.inserted, sink.skipped) == (50, 0)
+    assert len(list(collection.paginated_find())) == 50
+
+
+def test_sink_error_stops_the_reading_without_deadlock():
+    failing_collection = FailingCollection()
+    sink = CollectionSink("failing", failing_collection, batch_size=1, concurrency=2, queue_size=1)
+
+    with pytest.raises(RuntimeError, match="Insertion into the failing collection failed"):
+        # (the workers keep draining the full queue: put never blocks forever)
+        run_with_timeout(lambda: sink.put_all(documents(200)))
+    with pytest.raises(RuntimeError):
+        run_with_timeout(sink.close)
+    # batches queued after the error are dropped, not inserted
+    assert failing_collection.insertions < 200
+    assert sink.inserted == 0
+
+
+def test_sink_retries_transient_errors(collection, monkeypatch):
+    monkeypatch.setattr(bulk_loading, "BACKOFF_BASE_SECONDS", 0)
+    insert_many = collection.insert_many
+    attempts = []
+
+    def flaky_insert_many(*args, **kwargs):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise httpx.ConnectError("connection reset")
+        return insert_many(*args, **kwargs)
+
+    monkeypatch.setattr(collection, "insert_many", flaky_insert_many)
+    sink = CollectionSink("sink_test", collection, batch_size=20)
+    sink.put_all(documents(10))
+    run_with_timeout(sink.close)
+    assert sink.inserted == 10
+    assert len(attempts) == 2
+
+
+def test_failed_sink_keeps_its_checkpoint(checkpoint_dir):
+    sink = CollectionSink("failing", FailingCollection(), checkpoint=LoadingCheckpoint("failing"))
+    sink.put_all(documents(3))
+    with pytest.raises(RuntimeError):
+        run_with_timeout(sink.close)
+    assert sink.checkpoint.checkpoint_file.closed
+    assert (checkpoint_dir / "loading_checkpoints" / "failing.done").is_file()
+
+
+def test_sink_resumes_from_its_checkpoint(collection, checkpoint_dir):
+    # (as left by a run interrupted after its first two batches)
+    collection.insert_many(documents(10))
+    interrupted_checkpoint = LoadingCheckpoint("sink_test")
+    interrupted_checkpoint.mark_done("doc_000:doc_004:5")
+    interrupted_checkpoint.mark_done("doc_005:doc_009:5")
+    interrupted_checkpoint.close()
+
+    sink = CollectionSink("sink_test", collection, batch_size=5, checkpoint=LoadingCheckpoint("sink_test"))
+    sink.put_all(documents(23))
+    run_with_timeout(sink.close)
+    assert (sink.inserted, sink.skipped) == (13, 10)
+    assert len(list(collection.paginated_find())) == 23
+    # complete: the checkpoint is removed
+    assert not (checkpoint_dir / "loading_checkpoints" / "sink_test.done").exists()
+
+
+def test_hotel_aggregator_matches_the_former_pandas_computation():
+    nan = float("nan")
+    records = [
+        {"hotel_id": "h1", "hotel_name": "One", "hotel_city": "Paris", "hotel_country": "FR",
+         "hotel_latitude": 48.0, "hotel_longitude": 2.0},
+        {"hotel_id": "h1", "hotel_name": "One", "hotel_city": "Paris", "hotel_country": "FR",
+         "hotel_latitude": 48.0, "hotel_longitude": 2.0},
+        {"hotel_id": "h2", "hotel_name": "Two", "hotel_city": "Paris", "hotel_country": "FR",
+         "hotel_latitude": 49.0, "hotel_longitude": nan},
+        {"hotel_id": "h3", "hotel_name": "Three", "hotel_city": nan, "hotel_country": "FR",
+         "hotel_latitude": 40.0, "hotel_longitude": 1.0},
+        {"hotel_id": "h4", "hotel_name": "Four", "hotel_city": "Lyon", "hotel_country": "FR",
+         "hotel_latitude": nan, "hotel_longitude": nan},
+    ]
+    aggregator = HotelAggregator()
+    for record in records:
+        aggregator.add(record)
+
+    assert {hotel["_id"]: hotel["num_reviews"] for hotel in aggregator.hotel_documents()} == {
+        "h1": 2, "h2": 1, "h3": 1, "h4": 1,
+    }
+    city_means = pd.DataFrame(records).groupby(["hotel_country", "hotel_city"])[
+        ["hotel_latitude", "hotel_longitude"]
+    ].mean()
+    city_documents = {city_doc["_id"]: city_doc for city_doc in aggregator.city_documents()}
+    assert set(city_documents) == {f"{country}/{city}" for country, city in city_means.index}
+    for (country, city), city_row in city_means.iterrows():
+        city_doc = city_documents[f"{country}/{city}"]
+        for field in ["latitude", "longitude"]:
+            expected = city_row[f"hotel_{field}"]
+            assert city_doc[field] == pytest.approx(expected, nan_ok=True)
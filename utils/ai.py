@@ -1,31 +1,70 @@
 import os
-from dotenv import find_dotenv, load_dotenv
-
-import langchain
-from langchain.llms import OpenAI
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.cache import AstraDBCache
+from typing import Dict
 
+import utils.env  # (loads the .env file)
 from utils.db import get_astra_db_client
 
+# "OpenAI" (default) or "Local" (deterministic offline stand-ins, see utils/local_ai.py).
+# The embeddings follow the LLM provider unless set otherwise.
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "OpenAI")
+EMBEDDINGS_PROVIDER = os.environ.get("EMBEDDINGS_PROVIDER", LLM_PROVIDER)
 
-LLM_PROVIDER = "OpenAI"
-
-dotenv_file = find_dotenv(".env")
-load_dotenv(dotenv_file)
-
-OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
+# Only required by the OpenAI provider (when the LLM/embeddings are first needed)
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
 EMBEDDING_DIMENSION = 1536
 
 llm = None
 embeddings = None
+two_tier_llm_cache = None
+
+
+# LangChain (and the provider modules) are imported only when the LLM/embeddings
+# are first needed: importing them takes about a second, which would delay the API startup.
+
+def _create_openai_llm():
+    from langchain.llms import OpenAI
+    return OpenAI(openai_api_key=OPENAI_API_KEY)
+
+
+def _create_openai_embeddings():
+    from langchain.embeddings import OpenAIEmbeddings
+    return OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+
+
+def _create_local_llm():
+    from utils.local_ai import create_local_llm
+    return create_local_llm()
+
+
+def _create_local_embeddings():
+    from utils.local_ai import create_local_embeddings
+    return create_local_embeddings(dimension=EMBEDDING_DIMENSION)
+
+
+LLM_PROVIDERS = {
+    "OpenAI": _create_openai_llm,
+    "Local": _create_local_llm,
+}
+
+EMBEDDINGS_PROVIDERS = {
+    "OpenAI": _create_openai_embeddings,
+    "Local": _create_local_embeddings,
+}
+
+
+def _create_from_provider(providers, provider_name: str):
+    if provider_name not in providers:
+        raise ValueError(
+            f"Unknown provider '{provider_name}' (choose among: {', '.join(providers)})"
+        )
+    return providers[provider_name]()
 
 
 def get_llm():
     global llm
     if llm is None:
-        llm = OpenAI(openai_api_key=OPENAI_API_KEY)
+        llm = _create_from_provider(LLM_PROVIDERS, LLM_PROVIDER)
     #
     return llm
 
@@ -33,17 +72,36 @@ def get_llm():
 def get_embeddings():
     global embeddings
     if embeddings is None:
-        embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+        embeddings = _create_from_provider(EMBEDDINGS_PROVIDERS, EMBEDDINGS_PROVIDER)
     #
     return embeddings
 
 
-def enable_llm_cache():
+def _create_remote_llm_cache():
+    from langchain.cache import AstraDBCache
     # This is a strange trick to circumvent the 5-collection limit
     # well... 'circumvent' actually means we use TWO DATABASES lol
-    astra_db_client2 = get_astra_db_client(alternative_db=True)
-    if astra_db_client2:
-        langchain.llm_cache = AstraDBCache(astra_db_client=astra_db_client2)
+    return AstraDBCache(astra_db_client=get_astra_db_client(alternative_db=True))
+
+
+# The Astra DB tier of the cache (and its collection) is only set up on the first lookup
+# reaching it, i.e. not when the cache is enabled (see utils/llm_cache.py).
+def enable_llm_cache():
+    global two_tier_llm_cache
+    import langchain
+    from utils.llm_cache import InstrumentedLLMCache, TwoTierLLMCache
+
+    if get_astra_db_client(alternative_db=True):
+        remote_cache_factory = _create_remote_llm_cache
     else:
-        print("\n\n   *** NO LLM CACHING AVAILABLE ***\n\n")
+        remote_cache_factory = None
+        print("\n\n   *** NO PERSISTENT LLM CACHING AVAILABLE (in-process cache only) ***\n\n")
+    two_tier_llm_cache = TwoTierLLMCache(remote_cache_factory=remote_cache_factory)
+    # (wrapped to count the cache hits/misses for the metrics)
+    langchain.llm_cache = InstrumentedLLMCache(two_tier_llm_cache)
+
 
+def llm_cache_stats() -> Dict[str, float]:
+    if two_tier_llm_cache is None:
+        return {}
+    return two_tier_llm_cache.stats()
@@ -1,33 +1,136 @@
 import os
+from copy import copy as shallow_copy
 
-from dotenv import find_dotenv, load_dotenv
+import httpx
 #
-from astrapy.db import AstraDB
+from astrapy.db import AstraDB, AstraDBCollection, AsyncAstraDB
 
+import utils.env  # (loads the .env file)
+from utils.http_pool import (
+    aclose_async_http_clients,
+    get_async_http_client,
+    get_sync_http_client,
+)
 
-dotenv_file = find_dotenv(".env")
-load_dotenv(dotenv_file)
 
+# "astra" (default) uses the Astra DB Data API. "local" uses instead an in-process
+# emulation of it (see utils/local_data_api.py, only imported in that case),
+# requiring no endpoint nor token: the API and the setup scripts then run hermetically.
+ASTRA_DB_BACKEND = os.environ.get("ASTRA_DB_BACKEND", "astra")
+LOCAL_API_ENDPOINT = "http://local-data-api"
+LOCAL_API_ENDPOINT_ALT = "http://local-data-api-alt"
+LOCAL_TOKEN = "local"
 
 astra_db_client = None
+alternative_astra_db_client = None
+async_astra_db_client = None
+
+
+# The sync astrapy classes share a class-level httpx client
+# (in particular, each collection object uses AstraDBCollection's):
+# it is replaced with the pooled one (see utils/http_pool.py).
+def _use_shared_sync_http_client():
+    if ASTRA_DB_BACKEND == "local":
+        from utils.local_data_api import LocalDataAPITransport, get_local_data_api
+        http_client = get_sync_http_client(transport=LocalDataAPITransport(get_local_data_api()))
+    else:
+        http_client = get_sync_http_client()
+    AstraDB.client = http_client
+    AstraDBCollection.client = http_client
+
+
+# Each AsyncAstraDB.collection() call works on a copy of the database object,
+# which would get a new httpx client of its own: here copies share the client.
+# (Copies are made without running the constructor: merely creating an httpx
+# client, which sets up an SSL context, takes tens of milliseconds.)
+class _SharedClientAsyncAstraDB(AsyncAstraDB):
+
+    def __init__(self, http_client: httpx.AsyncClient, **kwargs):
+        super().__init__(**kwargs)
+        self.client = http_client
+
+    def copy(
+        self,
+        *,
+        token=None,
+        api_endpoint=None,
+        api_path=None,
+        api_version=None,
+        namespace=None,
+        caller_name=None,
+        caller_version=None,
+    ) -> "_SharedClientAsyncAstraDB":
+        db_copy = shallow_copy(self)
+        db_copy.token = token or self.token
+        db_copy.base_url = (api_endpoint or self.base_url).strip("/")
+        db_copy.api_path = (api_path or self.api_path).strip("/")
+        db_copy.api_version = (api_version or self.api_version).strip("/")
+        db_copy.namespace = namespace or self.namespace
+        db_copy.caller_name = caller_name or self.caller_name
+        db_copy.caller_version = caller_version or self.caller_version
+        db_copy.base_path = f"/{db_copy.api_path}/{db_copy.api_version}/{db_copy.namespace}"
+        return db_copy
+
+
+def _alternative_db_settings():
+    if ASTRA_DB_BACKEND == "local":
+        return {"api_endpoint": LOCAL_API_ENDPOINT_ALT, "token": LOCAL_TOKEN}
+    if "ASTRA_DB_API_ENDPOINT_ALT" in os.environ and "ASTRA_DB_APPLICATION_TOKEN_ALT" in os.environ:
+        return {
+            "api_endpoint": os.environ["ASTRA_DB_API_ENDPOINT_ALT"],
+            "token": os.environ["ASTRA_DB_APPLICATION_TOKEN_ALT"],
+            "namespace": os.environ.get("ASTRA_DB_KEYSPACE_ALT"),
+        }
+    return None
+
+
+def _primary_db_settings():
+    if ASTRA_DB_BACKEND == "local":
+        return {"api_endpoint": LOCAL_API_ENDPOINT, "token": LOCAL_TOKEN}
+    return {
+        "api_endpoint": os.environ["ASTRA_DB_API_ENDPOINT"],
+        "token": os.environ["ASTRA_DB_APPLICATION_TOKEN"],
+        "namespace": os.environ.get("ASTRA_DB_KEYSPACE"),
+    }
 
 
 def get_astra_db_client(alternative_db=False):
+    _use_shared_sync_http_client()
     if alternative_db:
-        if "ASTRA_DB_API_ENDPOINT_ALT" in os.environ and "ASTRA_DB_APPLICATION_TOKEN_ALT" in os.environ:
-            return AstraDB(
-                api_endpoint=os.environ["ASTRA_DB_API_ENDPOINT_ALT"],
-                token=os.environ["ASTRA_DB_APPLICATION_TOKEN_ALT"],
-                namespace=os.environ.get("ASTRA_DB_KEYSPACE_ALT"),
-            )
-        else:
-            return None
+        global alternative_astra_db_client
+        if alternative_astra_db_client is None:
+            alternative_db_settings = _alternative_db_settings()
+            if alternative_db_settings is None:
+                return None
+            alternative_astra_db_client = AstraDB(**alternative_db_settings)
+        return alternative_astra_db_client
     else:
         global astra_db_client
         if astra_db_client is None:
-            astra_db_client = AstraDB(
-                api_endpoint=os.environ["ASTRA_DB_API_ENDPOINT"],
-                token=os.environ["ASTRA_DB_APPLICATION_TOKEN"],
-                namespace=os.environ.get("ASTRA_DB_KEYSPACE"),
-            )
+            astra_db_client = AstraDB(**_primary_db_settings())
         return astra_db_client
+
+
+# Async counterpart of the (primary) client above, used by the async request path.
+# Its httpx.AsyncClient is bound to the running event loop, so this is
+# meant to be first called from within the app (and closed at shutdown).
+def get_async_astra_db_client():
+    global async_astra_db_client
+    if async_astra_db_client is None:
+        primary_db_settings = _primary_db_settings()
+        if ASTRA_DB_BACKEND == "local":
+            from utils.local_data_api import AsyncLocalDataAPITransport, get_local_data_api
+            transport = AsyncLocalDataAPITransport(get_local_data_api())
+        else:
+            transport = None
+        async_astra_db_client = _SharedClientAsyncAstraDB(
+            http_client=get_async_http_client(primary_db_settings["api_endpoint"], transport=transport),
+            **primary_db_settings,
+        )
+    return async_astra_db_client
+
+
+async def close_async_astra_db_client():
+    global async_astra_db_client
+    async_astra_db_client = None
+    await aclose_async_http_clients()
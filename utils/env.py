@@ -0,0 +1,6 @@
+"""Loads the .env file, once, for whichever module first needs the settings"""
+from dotenv import find_dotenv, load_dotenv
+
+
+dotenv_file = find_dotenv(".env")
+load_dotenv(dotenv_file)
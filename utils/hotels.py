@@ -1,57 +1,115 @@
-from utils.db import get_astra_db_client
+import os
+
+from utils.db import get_astra_db_client, get_async_astra_db_client
 
 from common_constants import HOTELS_COLLECTION_NAME
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+from utils.caching import MISSING, TTLCache
 from utils.models import Hotel
+from utils.instrumentation import timed
 
 
-def find_hotels_by_location(city: str, country: str) -> List[Hotel]:
-    astra_db_client = get_astra_db_client()
-    hotels_col = astra_db_client.collection(HOTELS_COLLECTION_NAME)
+# The hotels collection is essentially static after setup, so lookups
+# by location and by id are served from an in-process cache.
+# The review counters change, hence these entries are invalidated
+# (in this process) whenever the counter is written; other API workers
+# may show a count which is stale by at most the TTL.
+HOTEL_CACHE_MAX_SIZE = int(os.environ.get("HOTEL_CACHE_MAX_SIZE", "1024"))
+HOTEL_CACHE_TTL_SECONDS = float(os.environ.get("HOTEL_CACHE_TTL_SECONDS", "600"))
 
-    hotel_docs = hotels_col.find(
-        filter={
+hotel_cache = TTLCache(max_size=HOTEL_CACHE_MAX_SIZE, ttl_seconds=HOTEL_CACHE_TTL_SECONDS)
+
+
+def _location_cache_key(city: str, country: str):
+    return ("location", city, country)
+
+
+def _id_cache_key(hotel_id: str):
+    return ("id", hotel_id)
+
+
+# Cached Hotel objects are handed out as copies, so callers can freely modify them
+def _copy_hotels(hotels: List[Hotel]) -> List[Hotel]:
+    return [hotel.copy() for hotel in hotels]
+
+
+def _copy_hotel(hotel: Optional[Hotel]) -> Optional[Hotel]:
+    return hotel.copy() if hotel is not None else None
+
+
+def invalidate_hotel(hotel_id: str):
+    hotel_cache.invalidate(_id_cache_key(hotel_id))
+    hotel_cache.invalidate_where(
+        lambda key, value: key[0] == "location" and any(hotel.id == hotel_id for hotel in value)
+    )
+
+
+def clear_hotel_cache():
+    hotel_cache.clear()
+
+
+def hotel_cache_stats() -> Dict[str, int]:
+    return hotel_cache.stats()
+
+
+def _hotels_by_location_query(city: str, country: str) -> Dict[str, Any]:
+    return {
+        "filter": {
             "city": city,
             "country": country,
         },
-        projection={
+        "projection": {
             "name": 1,
             "_id": 1,
+            "num_reviews": 1,
         },
-        options={
+        "options": {
             "limit": 15,
         },
-    )["data"]["documents"]
+    }
+
+
+def _hotel_by_id_query(hotel_id: str) -> Dict[str, Any]:
+    return {
+        "filter": {
+            "_id": hotel_id,
+        },
+        "projection": {
+            "city": 1,
+            "country": 1,
+            "name": 1,
+            "_id": 1,
+        },
+    }
+
+
+def _hotel_review_count_update(hotel_id: str, update_op: str, num_reviews: int) -> Dict[str, Any]:
+    return {
+        "filter": {
+            "_id": hotel_id,
+        },
+        "update": {
+            update_op: {
+                "num_reviews": num_reviews,
+            },
+        },
+    }
 
-    hotels = [
+
+def _hotel_docs_to_hotels(hotel_docs, city: str, country: str) -> List[Hotel]:
+    return [
         Hotel(
             city=city,
             country=country,
             name=hotel_doc["name"],
             id=hotel_doc["_id"],
+            num_reviews=hotel_doc.get("num_reviews"),
         )
         for hotel_doc in hotel_docs
     ]
 
-    return hotels
-
-
-def find_hotel_by_id(hotel_id: str) -> Optional[Hotel]:
-    astra_db_client = get_astra_db_client()
-    hotels_col = astra_db_client.collection(HOTELS_COLLECTION_NAME)
-
-    hotel_doc = hotels_col.find_one(
-        filter={
-            "_id": hotel_id,
-        },
-        projection={
-            "city": 1,
-            "country": 1,
-            "name": 1,
-            "_id": 1,
-        },
-    )["data"]["document"]
 
+def _hotel_doc_to_hotel(hotel_doc) -> Optional[Hotel]:
     if hotel_doc is not None:
         return Hotel(
             city=hotel_doc["city"],
@@ -61,3 +119,112 @@ def find_hotel_by_id(hotel_id: str) -> Optional[Hotel]:
         )
     else:
         return None
+
+
+@timed("hotels.find_by_location")
+def find_hotels_by_location(city: str, country: str) -> List[Hotel]:
+    cached_hotels = hotel_cache.get(_location_cache_key(city, country))
+    if cached_hotels is not MISSING:
+        return _copy_hotels(cached_hotels)
+
+    astra_db_client = get_astra_db_client()
+    hotels_col = astra_db_client.collection(HOTELS_COLLECTION_NAME)
+
+    hotel_docs = hotels_col.find(
+        **_hotels_by_location_query(city, country),
+    )["data"]["documents"]
+
+    hotels = _hotel_docs_to_hotels(hotel_docs, city, country)
+    hotel_cache.put(_location_cache_key(city, country), hotels)
+    return _copy_hotels(hotels)
+
+
+@timed("hotels.find_by_location")
+async def afind_hotels_by_location(city: str, country: str) -> List[Hotel]:
+    cached_hotels = hotel_cache.get(_location_cache_key(city, country))
+    if cached_hotels is not MISSING:
+        return _copy_hotels(cached_hotels)
+
+    astra_db_client = get_async_astra_db_client()
+    hotels_col = await astra_db_client.collection(HOTELS_COLLECTION_NAME)
+
+    hotel_docs = (await hotels_col.find(
+        **_hotels_by_location_query(city, country),
+    ))["data"]["documents"]
+
+    hotels = _hotel_docs_to_hotels(hotel_docs, city, country)
+    hotel_cache.put(_location_cache_key(city, country), hotels)
+    return _copy_hotels(hotels)
+
+
+@timed("hotels.find_by_id")
+def find_hotel_by_id(hotel_id: str) -> Optional[Hotel]:
+    cached_hotel = hotel_cache.get(_id_cache_key(hotel_id))
+    if cached_hotel is not MISSING:
+        return _copy_hotel(cached_hotel)
+
+    astra_db_client = get_astra_db_client()
+    hotels_col = astra_db_client.collection(HOTELS_COLLECTION_NAME)
+
+    hotel_doc = hotels_col.find_one(
+        **_hotel_by_id_query(hotel_id),
+    )["data"]["document"]
+
+    hotel = _hotel_doc_to_hotel(hotel_doc)
+    if hotel is not None:
+        hotel_cache.put(_id_cache_key(hotel_id), hotel)
+    return _copy_hotel(hotel)
+
+
+@timed("hotels.find_by_id")
+async def afind_hotel_by_id(hotel_id: str) -> Optional[Hotel]:
+    cached_hotel = hotel_cache.get(_id_cache_key(hotel_id))
+    if cached_hotel is not MISSING:
+        return _copy_hotel(cached_hotel)
+
+    astra_db_client = get_async_astra_db_client()
+    hotels_col = await astra_db_client.collection(HOTELS_COLLECTION_NAME)
+
+    hotel_doc = (await hotels_col.find_one(
+        **_hotel_by_id_query(hotel_id),
+    ))["data"]["document"]
+
+    hotel = _hotel_doc_to_hotel(hotel_doc)
+    if hotel is not None:
+        hotel_cache.put(_id_cache_key(hotel_id), hotel)
+    return _copy_hotel(hotel)
+
+
+# The review count is materialized on the hotel document ("num_reviews")
+# so that hotel searches need not scan the reviews collection.
+@timed("hotels.update_review_count")
+def increment_hotel_review_count(hotel_id: str, increment: int = 1):
+    astra_db_client = get_astra_db_client()
+    hotels_col = astra_db_client.collection(HOTELS_COLLECTION_NAME)
+
+    hotels_col.find_one_and_update(
+        **_hotel_review_count_update(hotel_id, "$inc", increment),
+    )
+    invalidate_hotel(hotel_id)
+
+
+@timed("hotels.update_review_count")
+async def aincrement_hotel_review_count(hotel_id: str, increment: int = 1):
+    astra_db_client = get_async_astra_db_client()
+    hotels_col = await astra_db_client.collection(HOTELS_COLLECTION_NAME)
+
+    await hotels_col.find_one_and_update(
+        **_hotel_review_count_update(hotel_id, "$inc", increment),
+    )
+    invalidate_hotel(hotel_id)
+
+
+@timed("hotels.update_review_count")
+def set_hotel_review_count(hotel_id: str, num_reviews: int):
+    astra_db_client = get_astra_db_client()
+    hotels_col = astra_db_client.collection(HOTELS_COLLECTION_NAME)
+
+    hotels_col.find_one_and_update(
+        **_hotel_review_count_update(hotel_id, "$set", num_reviews),
+    )
+    invalidate_hotel(hotel_id)
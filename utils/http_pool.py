@@ -0,0 +1,105 @@
+"""Shared, pooled (keep-alive) HTTP clients for the Data API"""
+import importlib.util
+import os
+from typing import Dict, Optional, Union
+
+import httpx
+
+import utils.env  # (loads the .env file)
+
+
+# All Data API traffic goes through a few long-lived httpx clients, so that connections
+# (and their TLS sessions) are reused across requests instead of being set up again:
+#   - one sync client, shared by every sync astrapy object (primary and alternate
+#     databases, hence also the LLM cache and the LangChain vector store),
+#   - one async client per API endpoint, shared by all async collection objects.
+# httpx keeps a separate pool per endpoint (origin) within each client.
+ASTRA_DB_HTTP_MAX_CONNECTIONS = int(os.environ.get("ASTRA_DB_HTTP_MAX_CONNECTIONS", "100"))
+ASTRA_DB_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("ASTRA_DB_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+ASTRA_DB_HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("ASTRA_DB_HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+# HTTP/2 (multiplexing many requests on a connection) needs the optional "h2" package
+ASTRA_DB_HTTP2 = os.environ.get("ASTRA_DB_HTTP2", "0") == "1"
+
+sync_http_client = None
+# API endpoint -> async client
+async_http_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _http2_available() -> bool:
+    if not ASTRA_DB_HTTP2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        print("[http_pool] ASTRA_DB_HTTP2 requires the 'h2' package (pip install 'httpx[http2]'): using HTTP/1.1")
+        return False
+    return True
+
+
+def _client_settings(transport) -> Dict:
+    if transport is not None:
+        # (in-process transports have no connection pool)
+        return {"transport": transport}
+    return {
+        "limits": httpx.Limits(
+            max_connections=ASTRA_DB_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=ASTRA_DB_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=ASTRA_DB_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        "http2": _http2_available(),
+    }
+
+
+def get_sync_http_client(transport: Optional[httpx.BaseTransport] = None) -> httpx.Client:
+    global sync_http_client
+    if sync_http_client is None:
+        sync_http_client = httpx.Client(**_client_settings(transport))
+    return sync_http_client
+
+
+# The async clients are bound to the running event loop: they are
+# meant to be created from within the app (and closed at shutdown).
+def get_async_http_client(
+    api_endpoint: str, transport: Optional[httpx.AsyncBaseTransport] = None
+) -> httpx.AsyncClient:
+    if api_endpoint not in async_http_clients:
+        async_http_clients[api_endpoint] = httpx.AsyncClient(**_client_settings(transport))
+    return async_http_clients[api_endpoint]
+
+
+async def aclose_async_http_clients():
+    for api_endpoint in list(async_http_clients):
+        await async_http_clients.pop(api_endpoint).aclose()
+
+
+# ### METRICS
+
+
+def _pool_stats(http_client: Union[httpx.Client, httpx.AsyncClient]) -> Dict[str, float]:
+    # (this looks into the httpcore pool behind the default httpx transport)
+    pool = getattr(http_client._transport, "_pool", None)
+    if pool is None:
+        return {}
+    connections = pool.connections
+    idle_connections = sum(1 for connection in connections if connection.is_idle())
+    requests = list(pool._requests)
+    queued_requests = sum(1 for request in requests if request.is_queued())
+    return {
+        "connections": len(connections),
+        "idle_connections": idle_connections,
+        "active_requests": len(requests) - queued_requests,
+        "queued_requests": queued_requests,
+        "max_connections": pool._max_connections,
+        "utilization": (len(connections) - idle_connections) / pool._max_connections,
+    }
+
+
+def http_pool_stats() -> Dict[str, float]:
+    http_clients = {}
+    if sync_http_client is not None:
+        http_clients["sync"] = sync_http_client
+    for api_endpoint, http_client in async_http_clients.items():
+        http_clients[f"async {httpx.URL(api_endpoint).host}"] = http_client
+    return {
+        f"{client_name} {stat}": value
+        for client_name, http_client in http_clients.items()
+        for stat, value in _pool_stats(http_client).items()
+    }
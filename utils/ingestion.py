@@ -0,0 +1,220 @@
+"""Write-behind ingestion of new reviews into the vector collection"""
+import asyncio
+import os
+import time
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional
+
+from utils.batching import batch_iterable
+from utils.hotels import aincrement_hotel_review_count
+from utils.reviews import (
+    generate_review_id,
+    ainsert_into_reviews_collection,
+    ainsert_batch_into_reviews_collection,
+    ainsert_batch_into_review_vector_collection,
+    aselect_reviews_pending_embedding,
+    aclear_reviews_embedding_pending,
+)
+
+
+# A new review is acknowledged as soon as it is stored in the (non-vector) reviews
+# collection, flagged as "embedding pending". A background worker then collects
+# pending reviews into batches (closed when full or when the time window since
+# their first entry has elapsed), computes their embeddings with a single call
+# and writes them with bulk insertions, finally clearing the flag.
+# Reviews still flagged at startup (e.g. after a crash) are enqueued again,
+# in the background (see arecover_pending): the startup does not wait for the database.
+REVIEW_INGESTION_BATCH_SIZE = int(os.environ.get("REVIEW_INGESTION_BATCH_SIZE", "20"))
+REVIEW_INGESTION_BATCH_WINDOW_SECONDS = float(os.environ.get("REVIEW_INGESTION_BATCH_WINDOW_SECONDS", "0.5"))
+REVIEW_INGESTION_MAX_ATTEMPTS = 4
+REVIEW_INGESTION_RETRY_BASE_DELAY_SECONDS = 0.5
+
+
+class ReviewIngestionQueue:
+
+    def __init__(self, batch_size: int, batch_window_seconds: float):
+        self.batch_size = batch_size
+        self.batch_window_seconds = batch_window_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # metrics
+        self.enqueued = 0
+        self.ingested = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        # enqueue times of the reviews not yet processed, oldest first
+        self._pending_since = deque()
+
+    # (to be called from the running event loop)
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    # Enqueues the reviews still flagged as "embedding pending" in the reviews collection.
+    # Failures are reported, not raised (the reviews stay flagged for the next startup).
+    # Returns the number of reviews enqueued.
+    async def arecover_pending(self) -> int:
+        try:
+            pending_review_entries = await aselect_reviews_pending_embedding()
+        except Exception as e:
+            print(f"[ReviewIngestionQueue] could not recover the pending reviews: {e}")
+            return 0
+        for review_entry in pending_review_entries:
+            await self.enqueue(review_entry)
+        return len(pending_review_entries)
+
+    # Waits for the pending reviews to be written, then stops the worker
+    async def stop(self):
+        if self._worker is not None:
+            await self._queue.join()
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+
+    async def enqueue(self, review_entry: Dict[str, Any]):
+        enqueued_at = time.monotonic()
+        self._pending_since.append(enqueued_at)
+        self.enqueued += 1
+        await self._queue.put((enqueued_at, review_entry))
+
+    async def _next_batch(self) -> List[Any]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_window_seconds
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._ingest(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _ingest(self, batch: List[Any]):
+        review_entries = [review_entry for _, review_entry in batch]
+        succeeded = False
+        for attempt in range(REVIEW_INGESTION_MAX_ATTEMPTS):
+            try:
+                review_ids = await ainsert_batch_into_review_vector_collection(review_entries)
+                await aclear_reviews_embedding_pending(review_ids)
+                succeeded = True
+                break
+            except Exception as e:
+                if attempt + 1 < REVIEW_INGESTION_MAX_ATTEMPTS:
+                    await asyncio.sleep(REVIEW_INGESTION_RETRY_BASE_DELAY_SECONDS * 2 ** attempt)
+                else:
+                    # still flagged in the reviews collection: will be retried at next startup
+                    print(f"[ReviewIngestionQueue] giving up on {len(batch)} reviews: {e}")
+
+        # the queue is FIFO and batches are processed in order
+        for _ in batch:
+            self._pending_since.popleft()
+        self.batches += 1
+        self.last_batch_size = len(batch)
+        if succeeded:
+            self.ingested += len(batch)
+            self.last_lag_seconds = time.monotonic() - batch[0][0]
+            self.max_lag_seconds = max(self.max_lag_seconds, self.last_lag_seconds)
+        else:
+            self.failed += len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        if self._pending_since:
+            current_lag_seconds = time.monotonic() - self._pending_since[0]
+        else:
+            current_lag_seconds = 0.0
+        return {
+            # (including the batch being processed)
+            "depth": len(self._pending_since),
+            "current_lag_seconds": current_lag_seconds,
+            "last_lag_seconds": self.last_lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+            "enqueued": self.enqueued,
+            "ingested": self.ingested,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_batch_size": self.last_batch_size,
+        }
+
+
+review_ingestion_queue = ReviewIngestionQueue(
+    batch_size=REVIEW_INGESTION_BATCH_SIZE,
+    batch_window_seconds=REVIEW_INGESTION_BATCH_WINDOW_SECONDS,
+)
+
+
+# Entry point for the API to add a review with write-behind of the vector:
+# - stores the review (flagged) in the non-vectorised collection, and bumps the hotel counter
+# - enqueues the review for the embedding + vector collection insertion
+async def asubmit_review_for_hotel(
+    hotel_id: str, review_title: str, review_body: str, review_rating: int
+) -> str:
+    review_id = generate_review_id()
+    await asyncio.gather(
+        ainsert_into_reviews_collection(
+            hotel_id, review_id, review_title, review_body, review_rating, embedding_pending=True
+        ),
+        aincrement_hotel_review_count(hotel_id),
+    )
+    await review_ingestion_queue.enqueue({
+        "hotel_id": hotel_id,
+        "review_id": review_id,
+        "title": review_title,
+        "body": review_body,
+        "rating": review_rating,
+    })
+    return review_id
+
+
+# Entry point for the API to add many reviews (across hotels) at once:
+# - stores the reviews (flagged) with bulk insertions, and bumps each hotel counter once
+# - embeds the stored reviews by batches of REVIEW_INGESTION_BATCH_SIZE and bulk-inserts their vectors
+#   (the reviews of a failing batch go through the ingestion queue, which retries)
+# Returns a result per entry (same order), with the id of the review if stored.
+async def asubmit_reviews_bulk(review_entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    review_entries = [
+        {**review_entry, "review_id": generate_review_id()}
+        for review_entry in review_entries
+    ]
+    insertion_errors = await ainsert_batch_into_reviews_collection(review_entries, embedding_pending=True)
+    stored_entries = [
+        review_entry
+        for review_entry, insertion_error in zip(review_entries, insertion_errors)
+        if insertion_error is None
+    ]
+
+    if stored_entries:
+        reviews_per_hotel = Counter(review_entry["hotel_id"] for review_entry in stored_entries)
+        await asyncio.gather(*(
+            aincrement_hotel_review_count(hotel_id, num_reviews)
+            for hotel_id, num_reviews in reviews_per_hotel.items()
+        ))
+        for entry_batch in batch_iterable(stored_entries, REVIEW_INGESTION_BATCH_SIZE):
+            try:
+                review_ids = await ainsert_batch_into_review_vector_collection(entry_batch)
+                await aclear_reviews_embedding_pending(review_ids)
+            except Exception:
+                for review_entry in entry_batch:
+                    await review_ingestion_queue.enqueue(review_entry)
+
+    return [
+        {
+            "hotel_id": review_entry["hotel_id"],
+            "review_id": review_entry["review_id"] if insertion_error is None else None,
+            "success": insertion_error is None,
+            "error": insertion_error,
+        }
+        for review_entry, insertion_error in zip(review_entries, insertion_errors)
+    ]
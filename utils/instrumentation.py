@@ -0,0 +1,246 @@
+"""Timing spans, per-request Server-Timing header and Prometheus-format metrics"""
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from starlette.routing import Match
+
+
+# Durations (in seconds) are recorded as "spans", each under a stage name:
+# - functions are instrumented with the @timed(stage) decorator (sync, async and async generators),
+#   blocks of code with the `span(stage)` context manager;
+# - within a request, spans are collected for the Server-Timing response header;
+# - all spans feed a histogram labeled by stage and endpoint ("background" outside requests),
+#   exported with the other metrics in Prometheus text format by `render_metrics`.
+# No dependency on a Prometheus client library: the few metric types needed are implemented here.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BACKGROUND_ENDPOINT = "background"
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [
+        f'{name}="{_escape_label_value(str(value))}"'
+        for name, value in zip(label_names, label_values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        # label values -> (bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values: Tuple[str, ...], value: float):
+        with self._lock:
+            series = self._series.setdefault(label_values, [[0] * len(self.buckets), 0.0, 0])
+            bucket_index = bisect_left(self.buckets, value)
+            if bucket_index < len(self.buckets):
+                series[0][bucket_index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (bucket_counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    bucket_labels = _format_labels(self.label_names, label_values, f'le="{upper_bound}"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                inf_labels = _format_labels(self.label_names, label_values, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf_labels} {count}")
+                labels = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values: Tuple[str, ...], amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, label_values: Tuple[str, ...]) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+STAGE_DURATION = Histogram(
+    "hotels_app_stage_duration_seconds",
+    "Duration of the instrumented stages.",
+    ("stage", "endpoint"),
+)
+REQUEST_DURATION = Histogram(
+    "hotels_app_request_duration_seconds",
+    "Duration of the requests (until the end of the response body).",
+    ("endpoint",),
+)
+LLM_CACHE_LOOKUPS = Counter(
+    "hotels_app_llm_cache_lookups_total",
+    "Lookups in the LLM cache, by result (hit/miss).",
+    ("result",),
+)
+
+# name -> function returning the current values {stat: number}, exported as gauges "<name>{stat=...}"
+_gauge_sources: Dict[str, Tuple[str, Callable[[], Dict[str, float]]]] = {}
+
+
+def register_gauges(name: str, description: str, source: Callable[[], Dict[str, float]]):
+    _gauge_sources[name] = (description, source)
+
+
+def render_metrics() -> str:
+    lines = STAGE_DURATION.render() + REQUEST_DURATION.render() + LLM_CACHE_LOOKUPS.render()
+    for name, (description, source) in sorted(_gauge_sources.items()):
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge"]
+        for key, value in sorted(source().items()):
+            if isinstance(value, (int, float)):
+                lines.append(f'{name}{{stat="{_escape_label_value(key)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+# ### SPANS
+
+
+class RequestTimings:
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.spans: List[Tuple[str, float]] = []
+
+    # Server-Timing header value: durations (in ms) summed by stage, in order of first occurrence
+    def server_timing_header(self, total_seconds: float) -> str:
+        durations: Dict[str, float] = {}
+        for stage, seconds in self.spans:
+            durations[stage] = durations.get(stage, 0.0) + seconds
+        metrics = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in durations.items()]
+        metrics.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(metrics)
+
+
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def record_span(stage: str, seconds: float):
+    request_timings = _request_timings.get()
+    if request_timings is not None:
+        request_timings.spans.append((stage, seconds))
+        STAGE_DURATION.observe((stage, request_timings.endpoint), seconds)
+    else:
+        STAGE_DURATION.observe((stage, BACKGROUND_ENDPOINT), seconds)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - start_time)
+
+
+def timed(stage: str):
+    def _decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def _async_gen_wrapper(*args, **kwargs):
+                with span(stage):
+                    async for item in func(*args, **kwargs):
+                        yield item
+            return _async_gen_wrapper
+        elif inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def _async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return _async_wrapper
+        else:
+            @functools.wraps(func)
+            def _wrapper(*args, **kwargs):
+                with span(stage):
+                    return func(*args, **kwargs)
+            return _wrapper
+    return _decorator
+
+
+# ### ASGI MIDDLEWARE
+
+
+def _route_path(app, scope) -> str:
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class TimingMiddleware:
+    """
+    Collects the spans of each request: they are sent in the Server-Timing
+    header (for streaming responses, only those done before the first byte)
+    and observed in the histograms, labeled with the route path.
+    """
+
+    def __init__(self, app, routed_app=None):
+        self.app = app
+        # the FastAPI app (whose routes give the endpoint labels)
+        self.routed_app = routed_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = _route_path(self.routed_app, scope)
+        request_timings = RequestTimings(endpoint)
+        context_token = _request_timings.set(request_timings)
+        start_time = time.perf_counter()
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                server_timing = request_timings.server_timing_header(time.perf_counter() - start_time)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", server_timing.encode("latin-1")),
+                ]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                REQUEST_DURATION.observe((endpoint,), time.perf_counter() - start_time)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _request_timings.reset(context_token)
@@ -0,0 +1,117 @@
+"""Two-tier LLM cache: in-process LRU in front of the (remote) Astra DB cache"""
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from langchain.schema import Generation
+from langchain.schema.cache import BaseCache
+
+from utils.caching import MISSING, TTLCache
+from utils.instrumentation import LLM_CACHE_LOOKUPS, span
+
+
+# Even a hit in the Astra DB cache costs a round trip to the alternate database,
+# while the same prompts (e.g. base summaries of popular hotels) come back constantly:
+# lookups go to a bounded in-process LRU first, then fall through to the remote tier
+# (a remote hit is copied into the local tier). New entries are written to both.
+LLM_CACHE_LOCAL_MAX_SIZE = int(os.environ.get("LLM_CACHE_LOCAL_MAX_SIZE", "1024"))
+LLM_CACHE_LOCAL_TTL_SECONDS = float(os.environ.get("LLM_CACHE_LOCAL_TTL_SECONDS", "3600"))
+
+
+def _hit_ratio(hits: int, misses: int) -> float:
+    lookups = hits + misses
+    return hits / lookups if lookups else 0.0
+
+
+class TwoTierLLMCache(BaseCache):
+    """
+    The remote tier is optional: without it (no alternate database),
+    the local tier alone still spares the repeated LLM calls within this process.
+    It is created by remote_cache_factory when first needed (setting it up
+    involves a network round trip, not to be paid at startup).
+    """
+
+    def __init__(
+        self,
+        remote_cache_factory: Optional[Callable[[], BaseCache]],
+        local_max_size: int = LLM_CACHE_LOCAL_MAX_SIZE,
+        local_ttl_seconds: float = LLM_CACHE_LOCAL_TTL_SECONDS,
+    ):
+        self.remote_cache_factory = remote_cache_factory
+        self._remote_cache: Optional[BaseCache] = None
+        self._remote_cache_lock = threading.Lock()
+        self.local_cache = TTLCache(max_size=local_max_size, ttl_seconds=local_ttl_seconds)
+        self.remote_hits = 0
+        self.remote_misses = 0
+
+    @property
+    def remote_cache(self) -> Optional[BaseCache]:
+        if self._remote_cache is None and self.remote_cache_factory is not None:
+            with self._remote_cache_lock:
+                if self._remote_cache is None:
+                    self._remote_cache = self.remote_cache_factory()
+        return self._remote_cache
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        cached = self.local_cache.get((prompt, llm_string))
+        if cached is not MISSING:
+            return cached
+        remote_cache = self.remote_cache
+        if remote_cache is None:
+            return None
+
+        cached = remote_cache.lookup(prompt, llm_string)
+        if cached is not None:
+            self.remote_hits += 1
+            self.local_cache.put((prompt, llm_string), cached)
+        else:
+            self.remote_misses += 1
+        return cached
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        self.local_cache.put((prompt, llm_string), return_val)
+        if self.remote_cache is not None:
+            self.remote_cache.update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.local_cache.clear()
+        if self.remote_cache is not None:
+            self.remote_cache.clear(**kwargs)
+
+    def stats(self) -> Dict[str, float]:
+        local_stats = self.local_cache.stats()
+        return {
+            "local_size": local_stats["size"],
+            "local_max_size": local_stats["max_size"],
+            "local_evictions": local_stats["evictions"],
+            "local_hits": local_stats["hits"],
+            "local_misses": local_stats["misses"],
+            "local_hit_ratio": _hit_ratio(local_stats["hits"], local_stats["misses"]),
+            # (only the local misses reach the remote tier)
+            "remote_hits": self.remote_hits,
+            "remote_misses": self.remote_misses,
+            "remote_hit_ratio": _hit_ratio(self.remote_hits, self.remote_misses),
+        }
+
+
+class InstrumentedLLMCache(BaseCache):
+    """Wraps an LLM cache to count the hits and misses of the lookups."""
+
+    def __init__(self, wrapped_cache: BaseCache):
+        self.wrapped_cache = wrapped_cache
+
+    def lookup(self, prompt: str, llm_string: str):
+        with span("llm_cache.lookup"):
+            cached = self.wrapped_cache.lookup(prompt, llm_string)
+        LLM_CACHE_LOOKUPS.inc(("hit" if cached is not None else "miss",))
+        return cached
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        with span("llm_cache.update"):
+            self.wrapped_cache.update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.wrapped_cache.clear(**kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self.wrapped_cache, name)
@@ -0,0 +1,202 @@
+"""Deterministic, offline stand-ins for the LLM and the embeddings, with simulated timings"""
+import asyncio
+import hashlib
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Mapping, Optional
+
+import numpy as np
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain.embeddings.base import Embeddings
+from langchain.llms.base import LLM
+from langchain.schema.output import GenerationChunk
+
+
+# Timing profiles (overridable one by one through the environment, see .env.template):
+#   llm_first_token_ms:       delay before the first token of a completion
+#   llm_tokens_per_second:    generation throughput after the first token (zero: no delay)
+#   embeddings_latency_ms:    delay of an embedding call, whatever the number of texts
+#   embeddings_ms_per_text:   additional delay for each text in the call
+# "openai" roughly reproduces the timings observed with the OpenAI models used in production.
+LOCAL_AI_PROFILES: Dict[str, Dict[str, float]] = {
+    "instant": {
+        "llm_first_token_ms": 0,
+        "llm_tokens_per_second": 0,
+        "embeddings_latency_ms": 0,
+        "embeddings_ms_per_text": 0,
+    },
+    "openai": {
+        "llm_first_token_ms": 500,
+        "llm_tokens_per_second": 60,
+        "embeddings_latency_ms": 150,
+        "embeddings_ms_per_text": 1,
+    },
+}
+
+
+def get_local_ai_profile() -> Dict[str, float]:
+    profile_name = os.environ.get("LOCAL_AI_PROFILE", "instant")
+    if profile_name not in LOCAL_AI_PROFILES:
+        raise ValueError(
+            f"Unknown LOCAL_AI_PROFILE '{profile_name}' (choose among: {', '.join(LOCAL_AI_PROFILES)})"
+        )
+    return {
+        setting: float(os.environ.get(f"LOCAL_{setting.upper()}", default_value))
+        for setting, default_value in LOCAL_AI_PROFILES[profile_name].items()
+    }
+
+
+def _text_seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+
+
+CANNED_BULLET_POINTS = [
+    "Guests consistently praise the friendly and helpful staff.",
+    "The rooms are described as clean and comfortable.",
+    "The location is convenient for sightseeing and public transport.",
+    "Breakfast gets mixed reviews, with limited choice mentioned by some.",
+    "Several reviewers found the rooms smaller than expected.",
+    "Street noise can be an issue in rooms facing the road.",
+    "The hotel is considered good value for money.",
+    "Check-in was quick and the reception is open around the clock.",
+    "Wi-Fi works well throughout the building.",
+    "Some guests noted that the decor is a bit dated.",
+    "The beds are comfortable and the bathrooms well equipped.",
+    "Parking nearby is limited and can be expensive.",
+]
+
+
+class LocalLLM(LLM):
+    """
+    Returns a few canned bullet points, chosen deterministically from the prompt
+    (so that LLM caching behaves as with a real model), emitted word by word
+    with the timings of the configured profile.
+    """
+
+    first_token_ms: float = 0
+    tokens_per_second: float = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "local"
+
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        return {"first_token_ms": self.first_token_ms, "tokens_per_second": self.tokens_per_second}
+
+    def _completion(self, prompt: str) -> str:
+        rng = random.Random(_text_seed(prompt))
+        bullet_points = rng.sample(CANNED_BULLET_POINTS, rng.randint(3, 5))
+        return "\n".join(f"- {bullet_point}" for bullet_point in bullet_points)
+
+    def _tokens(self, prompt: str) -> List[str]:
+        words = self._completion(prompt).split(" ")
+        return [words[0]] + [f" {word}" for word in words[1:]]
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _completion_delay(self, prompt: str) -> float:
+        return self.first_token_ms / 1000.0 + len(self._tokens(prompt)) * self._token_delay()
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        time.sleep(self._completion_delay(prompt))
+        return self._completion(prompt)
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        await asyncio.sleep(self._completion_delay(prompt))
+        return self._completion(prompt)
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        time.sleep(self.first_token_ms / 1000.0)
+        for token in self._tokens(prompt):
+            time.sleep(self._token_delay())
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield GenerationChunk(text=token)
+
+    async def _astream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
+        await asyncio.sleep(self.first_token_ms / 1000.0)
+        for token in self._tokens(prompt):
+            await asyncio.sleep(self._token_delay())
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            yield GenerationChunk(text=token)
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Unit-length pseudo-random vectors seeded by a hash of the text:
+    the same text always gets the same vector (but similarity carries no meaning).
+    """
+
+    def __init__(self, dimension: int, latency_ms: float = 0, ms_per_text: float = 0):
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+        self.ms_per_text = ms_per_text
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.random.default_rng(_text_seed(text)).standard_normal(self.dimension)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _call_delay(self, num_texts: int) -> float:
+        return (self.latency_ms + num_texts * self.ms_per_text) / 1000.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self._call_delay(len(texts)))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self._call_delay(len(texts)))
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+def create_local_llm() -> LocalLLM:
+    profile = get_local_ai_profile()
+    return LocalLLM(
+        first_token_ms=profile["llm_first_token_ms"],
+        tokens_per_second=profile["llm_tokens_per_second"],
+    )
+
+
+def create_local_embeddings(dimension: int) -> LocalEmbeddings:
+    profile = get_local_ai_profile()
+    return LocalEmbeddings(
+        dimension=dimension,
+        latency_ms=profile["embeddings_latency_ms"],
+        ms_per_text=profile["embeddings_ms_per_text"],
+    )
@@ -0,0 +1,502 @@
+"""An in-process emulation of the Astra DB Data API, for hermetic runs (tests, benchmarks)"""
+import atexit
+import asyncio
+import copy
+import json
+import os
+import pickle
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+import utils.env  # (loads the .env file)
+
+
+# The emulation sits below astrapy, as an httpx transport: every client
+# (the app's own, LangChain's vector store and LLM cache) runs unchanged.
+# It covers the commands used in this project:
+#   createCollection, findCollections, deleteCollection,
+#   find (also with vector sort), findOne, insertOne, insertMany,
+#   findOneAndUpdate, findOneAndReplace, updateOne, updateMany,
+#   deleteOne, deleteMany, countDocuments
+# with the subset of filter/update operators the project needs.
+# Collections live in memory, keyed by (host, namespace): optionally they are
+# loaded from / saved to a snapshot file, so that separate processes
+# (e.g. the setup scripts, then the API) can work on the same data.
+# Each request can be delayed, to mimic the network round-trip to Astra DB.
+LOCAL_DATA_API_LATENCY_MS = float(os.environ.get("LOCAL_DATA_API_LATENCY_MS", "0"))
+LOCAL_DATA_API_LATENCY_JITTER_MS = float(os.environ.get("LOCAL_DATA_API_LATENCY_JITTER_MS", "0"))
+LOCAL_DATA_API_SNAPSHOT_FILE = os.environ.get("LOCAL_DATA_API_SNAPSHOT_FILE")
+
+# same as the real API
+DEFAULT_PAGE_SIZE = 20
+MAX_VECTOR_SORT_LIMIT = 1000
+
+
+class DataAPIError(Exception):
+    def __init__(self, error_code: str, message: str):
+        super().__init__(message)
+        self.error_code = error_code
+
+    def to_json(self) -> Dict[str, str]:
+        return {"message": str(self), "errorCode": self.error_code}
+
+
+# ### FIELD ACCESS
+
+
+def _get_path(document: Dict[str, Any], path: str) -> Tuple[bool, Any]:
+    value: Any = document
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return False, None
+    return True, value
+
+
+def _set_path(document: Dict[str, Any], path: str, value: Any):
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+
+def _unset_path(document: Dict[str, Any], path: str) -> bool:
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return False
+    return document.pop(last, None) is not None
+
+
+# Dates travel as {"$date": <epoch millis>}: compare them as the number
+def _comparable(value: Any) -> Any:
+    if isinstance(value, dict) and set(value.keys()) == {"$date"}:
+        return value["$date"]
+    return value
+
+
+# ### FILTERING
+
+
+def _compare(found: bool, value: Any, operator: str, operand: Any) -> bool:
+    if operator == "$exists":
+        return found == bool(operand)
+    if operator == "$eq":
+        return found and (
+            value == operand
+            or (isinstance(value, list) and not isinstance(operand, list) and operand in value)
+        )
+    if operator == "$ne":
+        return not _compare(found, value, "$eq", operand)
+    if operator == "$in":
+        return any(_compare(found, value, "$eq", item) for item in operand)
+    if operator == "$nin":
+        return not _compare(found, value, "$in", operand)
+    if operator == "$size":
+        return found and isinstance(value, list) and len(value) == operand
+    if operator == "$all":
+        return found and isinstance(value, list) and all(item in value for item in operand)
+    if operator in {"$gt", "$gte", "$lt", "$lte"}:
+        if not found:
+            return False
+        left, right = _comparable(value), _comparable(operand)
+        try:
+            if operator == "$gt":
+                return left > right
+            if operator == "$gte":
+                return left >= right
+            if operator == "$lt":
+                return left < right
+            return left <= right
+        except TypeError:
+            return False
+    raise DataAPIError("UNSUPPORTED_FILTER_OPERATION", f"Unsupported filter operator: {operator}")
+
+
+def _matches(document: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    for key, condition in (filter or {}).items():
+        if key == "$and":
+            if not all(_matches(document, sub_filter) for sub_filter in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(document, sub_filter) for sub_filter in condition):
+                return False
+        elif key == "$not":
+            if _matches(document, condition):
+                return False
+        else:
+            found, value = _get_path(document, key)
+            if isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+                if not all(
+                    _compare(found, value, operator, operand)
+                    for operator, operand in condition.items()
+                ):
+                    return False
+            elif not _compare(found, value, "$eq", condition):
+                return False
+    return True
+
+
+# ### UPDATES
+
+
+def _apply_update(document: Dict[str, Any], update: Dict[str, Any], inserting: bool) -> bool:
+    original = json.dumps(document, sort_keys=True)
+    for operator, fields in update.items():
+        for path, operand in fields.items():
+            if operator == "$set":
+                _set_path(document, path, operand)
+            elif operator == "$setOnInsert":
+                if inserting:
+                    _set_path(document, path, operand)
+            elif operator == "$unset":
+                _unset_path(document, path)
+            elif operator == "$inc":
+                _, value = _get_path(document, path)
+                _set_path(document, path, (value or 0) + operand)
+            elif operator == "$push":
+                found, value = _get_path(document, path)
+                _set_path(document, path, (value if found else []) + [operand])
+            else:
+                raise DataAPIError("UNSUPPORTED_UPDATE_OPERATION", f"Unsupported update operator: {operator}")
+    return json.dumps(document, sort_keys=True) != original
+
+
+def _document_for_upsert(filter: Dict[str, Any]) -> Dict[str, Any]:
+    document = {
+        key: value
+        for key, value in (filter or {}).items()
+        if not key.startswith("$") and not (isinstance(value, dict) and any(k.startswith("$") for k in value))
+    }
+    document.setdefault("_id", str(uuid.uuid4()))
+    return document
+
+
+# ### PROJECTION
+
+
+def _project(
+    document: Dict[str, Any], projection: Optional[Dict[str, Any]], similarity: Optional[float]
+) -> Dict[str, Any]:
+    projection = dict(projection or {})
+    include_id = projection.pop("_id", 1)
+    if projection.get("*") == 1:
+        projected = dict(document)
+    elif projection.get("*") == 0:
+        projected = {}
+    elif any(projection.values()):
+        projected = {}
+        for path, included in projection.items():
+            if included:
+                found, value = _get_path(document, path)
+                if found:
+                    _set_path(projected, path, value)
+    else:
+        projected = {
+            key: value
+            for key, value in document.items()
+            if key != "$vector"
+        }
+        if projection:
+            # (nested values are shared with the stored document)
+            projected = copy.deepcopy(projected)
+        for path, included in projection.items():
+            if not included:
+                _unset_path(projected, path)
+    if include_id and "_id" in document:
+        projected["_id"] = document["_id"]
+    else:
+        projected.pop("_id", None)
+    if similarity is not None:
+        projected["$similarity"] = similarity
+    return projected
+
+
+# ### COLLECTIONS
+
+
+class LocalCollection:
+
+    def __init__(self, name: str, options: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.options = options or {}
+        self.documents: Dict[Any, Dict[str, Any]] = {}
+
+    def _similarities(self, documents: List[Dict[str, Any]], query_vector: List[float]) -> np.ndarray:
+        vectors = np.array([document["$vector"] for document in documents], dtype=np.float32)
+        query = np.array(query_vector, dtype=np.float32)
+        metric = self.options.get("vector", {}).get("metric", "cosine")
+        if metric == "euclidean":
+            return 1.0 / (1.0 + np.sum((vectors - query) ** 2, axis=1))
+        if metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+            return (1.0 + (vectors @ query) / np.where(norms == 0, 1.0, norms)) / 2.0
+        return (1.0 + vectors @ query) / 2.0
+
+    # Documents matching the filter in sort order, paired with their similarity (if vector search)
+    def select(
+        self, filter: Optional[Dict[str, Any]], sort: Optional[Dict[str, Any]]
+    ) -> List[Tuple[Dict[str, Any], Optional[float]]]:
+        matching = [
+            document
+            for document in self.documents.values()
+            if _matches(document, filter)
+        ]
+        if sort and "$vector" in sort:
+            with_vectors = [document for document in matching if "$vector" in document]
+            if not with_vectors:
+                return []
+            similarities = self._similarities(with_vectors, sort["$vector"])
+            order = np.argsort(-similarities, kind="stable")
+            return [(with_vectors[i], float(similarities[i])) for i in order]
+        for path, direction in reversed(list((sort or {}).items())):
+            # missing fields sort first (in ascending order), as in the real API
+            def _sort_key(document, _path=path):
+                found, value = _get_path(document, _path)
+                value = _comparable(value)
+                return (found, type(value).__name__, value) if found else (False, "", 0)
+            matching.sort(key=_sort_key, reverse=direction < 0)
+        return [(document, None) for document in matching]
+
+    def insert(self, document: Dict[str, Any]) -> Any:
+        document.setdefault("_id", str(uuid.uuid4()))
+        if document["_id"] in self.documents:
+            raise DataAPIError(
+                "DOCUMENT_ALREADY_EXISTS",
+                f"Failed to insert document with _id '{document['_id']}': "
+                "Document already exists with the given _id",
+            )
+        self.documents[document["_id"]] = document
+        return document["_id"]
+
+
+class LocalDataAPI:
+    """
+    The state of all emulated databases, and the interpreter of the commands.
+    Commands are executed one at a time (the sync astrapy clients may call from several threads).
+    """
+
+    def __init__(self, snapshot_file: Optional[str] = None):
+        self.snapshot_file = snapshot_file
+        self.namespaces: Dict[Tuple[str, str], Dict[str, LocalCollection]] = {}
+        self._lock = threading.Lock()
+        if snapshot_file and os.path.isfile(snapshot_file):
+            with open(snapshot_file, "rb") as f:
+                self.namespaces = pickle.load(f)
+
+    def save_snapshot(self):
+        if self.snapshot_file:
+            with self._lock:
+                temp_file = f"{self.snapshot_file}.tmp"
+                with open(temp_file, "wb") as f:
+                    pickle.dump(self.namespaces, f)
+                os.replace(temp_file, self.snapshot_file)
+
+    def _collection(self, host: str, namespace: str, collection_name: str) -> LocalCollection:
+        collections = self.namespaces.get((host, namespace), {})
+        if collection_name not in collections:
+            raise DataAPIError("COLLECTION_NOT_EXIST", f"Collection does not exist, collection name: {collection_name}")
+        return collections[collection_name]
+
+    # Entry point: the path is /api/json/v1/<namespace>[/<collection>]
+    def execute(self, host: str, path: str, command: Dict[str, Any]) -> Dict[str, Any]:
+        path_parts = path.strip("/").split("/")
+        namespace = path_parts[3]
+        collection_name = path_parts[4] if len(path_parts) > 4 else None
+        (command_name, payload), = command.items()
+        payload = payload or {}
+        try:
+            with self._lock:
+                if collection_name is None:
+                    return self._execute_namespace_command(host, namespace, command_name, payload)
+                else:
+                    collection = self._collection(host, namespace, collection_name)
+                    return self._execute_collection_command(collection, command_name, payload)
+        except DataAPIError as e:
+            return {"errors": [e.to_json()]}
+
+    def _execute_namespace_command(
+        self, host: str, namespace: str, command_name: str, payload: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        collections = self.namespaces.setdefault((host, namespace), {})
+        if command_name == "createCollection":
+            if payload["name"] not in collections:
+                collections[payload["name"]] = LocalCollection(payload["name"], payload.get("options"))
+            return {"status": {"ok": 1}}
+        if command_name == "findCollections":
+            if payload.get("options", {}).get("explain"):
+                return {"status": {"collections": [
+                    {"name": collection.name, "options": collection.options}
+                    for collection in collections.values()
+                ]}}
+            return {"status": {"collections": list(collections.keys())}}
+        if command_name == "deleteCollection":
+            collections.pop(payload["name"], None)
+            return {"status": {"ok": 1}}
+        raise DataAPIError("UNSUPPORTED_COMMAND", f"Unsupported command: {command_name}")
+
+    def _execute_collection_command(
+        self, collection: LocalCollection, command_name: str, payload: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        options = payload.get("options") or {}
+        filter = payload.get("filter")
+        sort = payload.get("sort")
+
+        if command_name == "find":
+            selected = collection.select(filter, sort)
+            if sort and "$vector" in sort:
+                limit = min(options.get("limit", MAX_VECTOR_SORT_LIMIT), MAX_VECTOR_SORT_LIMIT)
+                page, next_page_state = selected[:limit], None
+            else:
+                start = int(options.get("pageState") or 0) + options.get("skip", 0)
+                end = len(selected)
+                if "limit" in options:
+                    end = min(end, options.get("skip", 0) + options["limit"])
+                page_end = min(end, start + DEFAULT_PAGE_SIZE)
+                page = selected[start:page_end]
+                next_page_state = str(page_end - options.get("skip", 0)) if page_end < end else None
+            return {"data": {
+                "documents": [
+                    _project(document, payload.get("projection"), similarity if options.get("includeSimilarity") else None)
+                    for document, similarity in page
+                ],
+                "nextPageState": next_page_state,
+            }}
+
+        if command_name == "findOne":
+            selected = collection.select(filter, sort)
+            if selected:
+                document, similarity = selected[0]
+                return {"data": {"document": _project(
+                    document, payload.get("projection"), similarity if options.get("includeSimilarity") else None
+                )}}
+            return {"data": {"document": None}}
+
+        if command_name == "countDocuments":
+            return {"status": {"count": len(collection.select(filter, None))}}
+
+        if command_name == "insertOne":
+            return {"status": {"insertedIds": [collection.insert(payload["document"])]}}
+
+        if command_name == "insertMany":
+            inserted_ids, errors = [], []
+            for document in payload["documents"]:
+                try:
+                    inserted_ids.append(collection.insert(document))
+                except DataAPIError as e:
+                    errors.append(e.to_json())
+                    if options.get("ordered", False):
+                        break
+            response = {"status": {"insertedIds": inserted_ids}}
+            if errors:
+                response["errors"] = errors
+            return response
+
+        if command_name in {"findOneAndUpdate", "findOneAndReplace", "updateOne"}:
+            selected = collection.select(filter, sort)
+            upserted_id = None
+            if selected:
+                document, _ = selected[0]
+                before = json.loads(json.dumps(document))
+                if command_name == "findOneAndReplace":
+                    replacement = dict(payload["replacement"], _id=document["_id"])
+                    modified = replacement != document
+                    collection.documents[document["_id"]] = document = replacement
+                else:
+                    modified = _apply_update(document, payload["update"], inserting=False)
+                matched = 1
+            elif options.get("upsert"):
+                before = None
+                if command_name == "findOneAndReplace":
+                    document = dict(_document_for_upsert(filter), **payload["replacement"])
+                else:
+                    document = _document_for_upsert(filter)
+                    _apply_update(document, payload["update"], inserting=True)
+                upserted_id = collection.insert(document)
+                matched, modified = 0, 0
+            else:
+                before, document, matched, modified = None, None, 0, 0
+            status = {"matchedCount": matched, "modifiedCount": int(modified)}
+            if upserted_id is not None:
+                status["upsertedId"] = upserted_id
+            if command_name == "updateOne":
+                return {"status": status}
+            returned = document if options.get("returnDocument") == "after" else before
+            return {
+                "data": {"document": _project(returned, payload.get("projection"), None) if returned else None},
+                "status": status,
+            }
+
+        if command_name == "updateMany":
+            matched, modified = 0, 0
+            for document, _ in collection.select(filter, None):
+                matched += 1
+                modified += _apply_update(document, payload["update"], inserting=False)
+            if matched == 0 and options.get("upsert"):
+                document = _document_for_upsert(filter)
+                _apply_update(document, payload["update"], inserting=True)
+                return {"status": {"matchedCount": 0, "modifiedCount": 0, "upsertedId": collection.insert(document)}}
+            return {"status": {"matchedCount": matched, "modifiedCount": modified}}
+
+        if command_name in {"deleteOne", "deleteMany"}:
+            selected = collection.select(filter, sort)
+            if command_name == "deleteOne":
+                selected = selected[:1]
+            for document, _ in selected:
+                del collection.documents[document["_id"]]
+            return {"status": {"deletedCount": len(selected)}}
+
+        raise DataAPIError("UNSUPPORTED_COMMAND", f"Unsupported command: {command_name}")
+
+
+def _injected_latency_seconds() -> float:
+    latency_ms = LOCAL_DATA_API_LATENCY_MS + random.uniform(
+        -LOCAL_DATA_API_LATENCY_JITTER_MS, LOCAL_DATA_API_LATENCY_JITTER_MS
+    )
+    return max(latency_ms, 0.0) / 1000.0
+
+
+def _response_for(data_api: LocalDataAPI, request: httpx.Request) -> httpx.Response:
+    response_body = data_api.execute(
+        request.url.host, request.url.path, json.loads(request.content or b"{}")
+    )
+    return httpx.Response(200, json=response_body)
+
+
+class LocalDataAPITransport(httpx.BaseTransport):
+
+    def __init__(self, data_api: LocalDataAPI):
+        self.data_api = data_api
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        time.sleep(_injected_latency_seconds())
+        return _response_for(self.data_api, request)
+
+
+class AsyncLocalDataAPITransport(httpx.AsyncBaseTransport):
+
+    def __init__(self, data_api: LocalDataAPI):
+        self.data_api = data_api
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(_injected_latency_seconds())
+        return _response_for(self.data_api, request)
+
+
+local_data_api = None
+
+
+def get_local_data_api() -> LocalDataAPI:
+    global local_data_api
+    if local_data_api is None:
+        local_data_api = LocalDataAPI(snapshot_file=LOCAL_DATA_API_SNAPSHOT_FILE)
+        atexit.register(local_data_api.save_snapshot)
+    return local_data_api
@@ -1,3 +1,4 @@
+import os
 from typing import Dict, List, Optional
 
 from pydantic import BaseModel, Field, validator
@@ -73,3 +74,29 @@ class UserProfile(BaseModel):
 class UserProfileSubmitRequest(BaseModel):
     user_id: str
     user_profile: UserProfile
+
+
+class BulkReviewItem(BaseModel):
+    hotel_id: str
+    title: str
+    body: str
+    rating: int
+
+
+# Larger bulk submissions are rejected (422) instead of being embedded and written at once
+REVIEW_BULK_MAX_SIZE = int(os.environ.get("REVIEW_BULK_MAX_SIZE", "500"))
+
+
+class BulkReviewSubmitRequest(BaseModel):
+    reviews: List[BulkReviewItem] = Field(..., max_items=REVIEW_BULK_MAX_SIZE)
+
+
+class BulkReviewItemResult(BaseModel):
+    hotel_id: str
+    review_id: Optional[str]
+    success: bool
+    error: Optional[str]
+
+
+class BulkReviewSubmitResponse(BaseModel):
+    results: List[BulkReviewItemResult]
@@ -1,12 +1,12 @@
+import asyncio
 import os
 
-from typing import List
+from typing import AsyncIterator, List, Optional
 
-from langchain.prompts import PromptTemplate
-from langchain.docstore.document import Document
-from langchain.chains.summarize import load_summarize_chain
-from utils.ai import get_llm
+from utils.ai import get_llm, get_embeddings
 from utils.models import HotelReview
+from utils.instrumentation import span, timed
+from utils.semantic_cache import semantic_summary_cache
 
 
 _linestart = "- "
@@ -21,13 +21,96 @@ def _split_bulletpoints(text: str) -> List[str]:
     return bplines
 
 
-# Calls the LLM to generate a summary of the given reviews tailored to the user's travel profile preferences.
-# TODO improve the prompt. Also rename this function with a clearer name.
-def summarize_reviews_for_user(
-    reviews: List[HotelReview], travel_profile_summary: str
-) -> str:
+# (LangChain is imported by the functions using it, not at startup: see utils/ai.py)
+def _run_summarize_chain(populated_prompt: str) -> str:
+    from langchain.chains.summarize import load_summarize_chain
+    from langchain.docstore.document import Document
+    chain = load_summarize_chain(llm=get_llm(), chain_type="stuff")
+    docs = [Document(page_content=populated_prompt)]
+    return chain.run(docs)
+
+
+# The LLM cache is looked up and updated in the default executor: with the Astra DB
+# tier, both are blocking round trips, not to be made on the event loop
+# (which is what awaiting the chain would do, the LangChain cache being synchronous).
+async def _alookup_llm_cache(summarizing_llm, final_prompt: str):
+    from langchain.llms.base import get_prompts
+    llm_params = {**summarizing_llm.dict(), "stop": None}
+    cached_results, llm_string, _, _ = await asyncio.get_running_loop().run_in_executor(
+        None, get_prompts, llm_params, [final_prompt]
+    )
+    cached_text = cached_results[0][0].text if cached_results else None
+    return cached_text, llm_string
+
+
+async def _aupdate_llm_cache(final_prompt: str, llm_string: str, completion: str):
+    import langchain
+    from langchain.schema import Generation
+    if langchain.llm_cache is not None:
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            langchain.llm_cache.update,
+            final_prompt,
+            llm_string,
+            [Generation(text=completion)],
+        )
+
+
+# Same final prompt (hence same LLM cache entries) as the above, run asynchronously.
+# On a cache miss the LLM is called directly (its agenerate would look the cache up again).
+async def _arun_summarize_chain(populated_prompt: str) -> str:
+    from langchain.chains.summarize import load_summarize_chain
     summarizing_llm = get_llm()
+    chain = load_summarize_chain(llm=summarizing_llm, chain_type="stuff")
+    final_prompt = chain.llm_chain.prompt.format(text=populated_prompt)
 
+    cached_text, llm_string = await _alookup_llm_cache(summarizing_llm, final_prompt)
+    if cached_text is not None:
+        return cached_text
+
+    llm_result = await summarizing_llm._agenerate([final_prompt])
+    completion = llm_result.generations[0][0].text
+    await _aupdate_llm_cache(final_prompt, llm_string, completion)
+    return completion
+
+
+# Streaming counterpart of the above: yields the completion text in chunks, as they arrive.
+# A cached completion is yielded at once, in full, while a fresh one is stored in the cache when complete.
+async def _astream_summarize_chain(populated_prompt: str) -> AsyncIterator[str]:
+    from langchain.chains.summarize import load_summarize_chain
+    summarizing_llm = get_llm()
+    chain = load_summarize_chain(llm=summarizing_llm, chain_type="stuff")
+    final_prompt = chain.llm_chain.prompt.format(text=populated_prompt)
+
+    cached_text, llm_string = await _alookup_llm_cache(summarizing_llm, final_prompt)
+    if cached_text is not None:
+        yield cached_text
+        return
+
+    completion_chunks = []
+    async for chunk in summarizing_llm.astream(final_prompt):
+        completion_chunks.append(chunk)
+        yield chunk
+
+    await _aupdate_llm_cache(final_prompt, llm_string, "".join(completion_chunks))
+
+
+# Incremental version of _split_bulletpoints: yields each bullet point
+# as soon as its line is complete in the incoming text chunks.
+async def _aiter_bulletpoints(text_chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    pending_text = ""
+    async for chunk in text_chunks:
+        pending_text += chunk
+        *complete_lines, pending_text = pending_text.split("\n")
+        for bullet_point in _split_bulletpoints("\n".join(complete_lines)):
+            yield bullet_point
+    for bullet_point in _split_bulletpoints(pending_text):
+        yield bullet_point
+
+
+def _user_summary_prompt(
+    reviews: List[HotelReview], travel_profile_summary: str
+) -> str:
     concatenated_reviews = "\n".join(review.body for review in reviews)
 
     prompt_template = """ You are an assistant helping travelers choose hotels.
@@ -46,6 +129,7 @@ def summarize_reviews_for_user(
     
     CONCISE SUMMARY: """
 
+    from langchain.prompts import PromptTemplate
     query_prompt_template = PromptTemplate.from_template(prompt_template)
     populated_prompt = query_prompt_template.format(
         profile_summary=travel_profile_summary, hotel_reviews=concatenated_reviews
@@ -54,17 +138,10 @@ def summarize_reviews_for_user(
     if "TERSE_LOGGING" not in os.environ:
         print(populated_prompt)
 
-    chain = load_summarize_chain(llm=summarizing_llm, chain_type="stuff")
-    docs = [Document(page_content=populated_prompt)]
-    return _split_bulletpoints(chain.run(docs))
+    return populated_prompt
 
 
-# Calls the LLM to generate a concise summary of the given reviews for a hotel.
-# This is a general, base summary for the hotel and is not user-specific.
-# TODO improve the prompt. Also rename this function with a clearer name.
-def summarize_reviews_for_hotel(reviews: List[HotelReview]) -> str:
-    summarizing_llm = get_llm()
-
+def _hotel_summary_prompt(reviews: List[HotelReview]) -> str:
     concatenated_reviews = "\n".join(review.body for review in reviews)
 
     prompt_template = """ You are an assistant helping travelers choose hotels.
@@ -82,11 +159,126 @@ def summarize_reviews_for_hotel(reviews: List[HotelReview]) -> str:
 
         CONCISE SUMMARY: """
 
+    from langchain.prompts import PromptTemplate
     query_prompt_template = PromptTemplate.from_template(prompt_template)
     populated_prompt = query_prompt_template.format(hotel_reviews=concatenated_reviews)
     if "TERSE_LOGGING" not in os.environ:
         print(populated_prompt)
 
-    chain = load_summarize_chain(llm=summarizing_llm, chain_type="stuff")
-    docs = [Document(page_content=populated_prompt)]
-    return _split_bulletpoints(chain.run(docs))
+    return populated_prompt
+
+
+# With the semantic summary cache enabled, personalized summaries are first looked up
+# by review ids + travel profile vector (embedded here if not given by the caller).
+def _semantic_cache_lookup(
+    reviews: List[HotelReview], travel_profile_summary: str, travel_profile_vector: Optional[List[float]]
+):
+    with span("llm.semantic_cache.lookup"):
+        if travel_profile_vector is None:
+            travel_profile_vector = get_embeddings().embed_query(travel_profile_summary)
+        review_ids = [review.id for review in reviews]
+        return review_ids, travel_profile_vector, semantic_summary_cache.lookup(review_ids, travel_profile_vector)
+
+
+async def _asemantic_cache_lookup(
+    reviews: List[HotelReview], travel_profile_summary: str, travel_profile_vector: Optional[List[float]]
+):
+    with span("llm.semantic_cache.lookup"):
+        if travel_profile_vector is None:
+            travel_profile_vector = await get_embeddings().aembed_query(travel_profile_summary)
+        review_ids = [review.id for review in reviews]
+        return review_ids, travel_profile_vector, semantic_summary_cache.lookup(review_ids, travel_profile_vector)
+
+
+# Calls the LLM to generate a summary of the given reviews tailored to the user's travel profile preferences.
+# TODO improve the prompt. Also rename this function with a clearer name.
+@timed("llm.summarize_for_user")
+def summarize_reviews_for_user(
+    reviews: List[HotelReview],
+    travel_profile_summary: str,
+    travel_profile_vector: Optional[List[float]] = None,
+) -> str:
+    if semantic_summary_cache is not None:
+        review_ids, travel_profile_vector, cached_summary = _semantic_cache_lookup(
+            reviews, travel_profile_summary, travel_profile_vector
+        )
+        if cached_summary is not None:
+            return cached_summary
+
+    populated_prompt = _user_summary_prompt(reviews, travel_profile_summary)
+    summary = _split_bulletpoints(_run_summarize_chain(populated_prompt))
+
+    if semantic_summary_cache is not None:
+        semantic_summary_cache.update(review_ids, travel_profile_vector, summary)
+    return summary
+
+
+@timed("llm.summarize_for_user")
+async def asummarize_reviews_for_user(
+    reviews: List[HotelReview],
+    travel_profile_summary: str,
+    travel_profile_vector: Optional[List[float]] = None,
+) -> str:
+    if semantic_summary_cache is not None:
+        review_ids, travel_profile_vector, cached_summary = await _asemantic_cache_lookup(
+            reviews, travel_profile_summary, travel_profile_vector
+        )
+        if cached_summary is not None:
+            return cached_summary
+
+    populated_prompt = _user_summary_prompt(reviews, travel_profile_summary)
+    summary = _split_bulletpoints(await _arun_summarize_chain(populated_prompt))
+
+    if semantic_summary_cache is not None:
+        semantic_summary_cache.update(review_ids, travel_profile_vector, summary)
+    return summary
+
+
+# Streaming version of the above, yielding one bullet point at a time
+# (a semantic cache hit is replayed at once; a fresh summary is stored once complete)
+@timed("llm.summarize_for_user")
+async def astream_summarize_reviews_for_user(
+    reviews: List[HotelReview],
+    travel_profile_summary: str,
+    travel_profile_vector: Optional[List[float]] = None,
+) -> AsyncIterator[str]:
+    if semantic_summary_cache is not None:
+        review_ids, travel_profile_vector, cached_summary = await _asemantic_cache_lookup(
+            reviews, travel_profile_summary, travel_profile_vector
+        )
+        if cached_summary is not None:
+            for bullet_point in cached_summary:
+                yield bullet_point
+            return
+
+    populated_prompt = _user_summary_prompt(reviews, travel_profile_summary)
+    summary = []
+    async for bullet_point in _aiter_bulletpoints(_astream_summarize_chain(populated_prompt)):
+        summary.append(bullet_point)
+        yield bullet_point
+
+    if semantic_summary_cache is not None:
+        semantic_summary_cache.update(review_ids, travel_profile_vector, summary)
+
+
+# Calls the LLM to generate a concise summary of the given reviews for a hotel.
+# This is a general, base summary for the hotel and is not user-specific.
+# TODO improve the prompt. Also rename this function with a clearer name.
+@timed("llm.summarize_for_hotel")
+def summarize_reviews_for_hotel(reviews: List[HotelReview]) -> str:
+    populated_prompt = _hotel_summary_prompt(reviews)
+    return _split_bulletpoints(_run_summarize_chain(populated_prompt))
+
+
+@timed("llm.summarize_for_hotel")
+async def asummarize_reviews_for_hotel(reviews: List[HotelReview]) -> str:
+    populated_prompt = _hotel_summary_prompt(reviews)
+    return _split_bulletpoints(await _arun_summarize_chain(populated_prompt))
+
+
+# Streaming version of the above, yielding one bullet point at a time
+@timed("llm.summarize_for_hotel")
+async def astream_summarize_reviews_for_hotel(reviews: List[HotelReview]) -> AsyncIterator[str]:
+    populated_prompt = _hotel_summary_prompt(reviews)
+    async for bullet_point in _aiter_bulletpoints(_astream_summarize_chain(populated_prompt)):
+        yield bullet_point
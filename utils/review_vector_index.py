@@ -0,0 +1,237 @@
+"""Opt-in in-process vector index of the reviews, by hotel"""
+import asyncio
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from common_constants import REVIEW_VECTOR_COLLECTION_NAME
+from utils.caching import MISSING, TTLCache
+from utils.db import get_astra_db_client, get_async_astra_db_client
+
+
+# A personalized request looks for the few reviews of a single hotel closest to the
+# travel profile, with a remote ANN query, while a hotel has at most a few hundred reviews.
+# When enabled, the review vectors of the hotels recently asked for are kept in memory
+# (one matrix of unit vectors per hotel, LRU-evicted by hotel) and searched exactly:
+# the cosine similarity of the vector collection, as a dot product.
+# A hotel not in the index is searched remotely while its reviews are loaded in the background.
+# Reviews added through this process are added to the index as well; those added through
+# other API workers show up when the hotel entry expires (TTL).
+REVIEW_VECTOR_INDEX_ENABLED = os.environ.get("REVIEW_VECTOR_INDEX", "0") == "1"
+REVIEW_VECTOR_INDEX_MAX_HOTELS = int(os.environ.get("REVIEW_VECTOR_INDEX_MAX_HOTELS", "512"))
+# hotels with more reviews than this are always searched remotely
+REVIEW_VECTOR_INDEX_MAX_REVIEWS_PER_HOTEL = int(os.environ.get("REVIEW_VECTOR_INDEX_MAX_REVIEWS_PER_HOTEL", "2000"))
+REVIEW_VECTOR_INDEX_TTL_SECONDS = float(os.environ.get("REVIEW_VECTOR_INDEX_TTL_SECONDS", "600"))
+
+# (stored in place of the reviews of a hotel having too many of them,
+# and returned by the searches of such a hotel: not to be loaded again)
+TOO_MANY_REVIEWS = object()
+
+# (review content, review metadata, review id), as in the vector collection
+ReviewMatch = Tuple[str, Dict[str, Any], str]
+
+
+# (NumPy is imported on first use: the index is disabled by default)
+def _unit_vectors(vectors):
+    import numpy as np
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, len(vectors[0]) if len(vectors) else 0)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+class HotelReviewVectors:
+    """The reviews of a hotel. Never modified (adding a review makes a new one)."""
+
+    def __init__(self, review_ids: List[str], contents: List[str], metadatas: List[Dict[str, Any]], unit_vectors):
+        self.review_ids = review_ids
+        self.contents = contents
+        self.metadatas = metadatas
+        self.unit_vectors = unit_vectors
+
+    @classmethod
+    def from_documents(cls, review_vector_docs: List[Dict[str, Any]]) -> "HotelReviewVectors":
+        return cls(
+            [review_doc["_id"] for review_doc in review_vector_docs],
+            [review_doc["content"] for review_doc in review_vector_docs],
+            [review_doc["metadata"] for review_doc in review_vector_docs],
+            _unit_vectors([review_doc["$vector"] for review_doc in review_vector_docs]),
+        )
+
+    def with_reviews(self, review_vector_docs: List[Dict[str, Any]]) -> "HotelReviewVectors":
+        import numpy as np
+        known_review_ids = set(self.review_ids)
+        new_docs = [
+            review_doc
+            for review_doc in review_vector_docs
+            if review_doc["_id"] not in known_review_ids
+        ]
+        if not new_docs:
+            return self
+        added = HotelReviewVectors.from_documents(new_docs)
+        return HotelReviewVectors(
+            self.review_ids + added.review_ids,
+            self.contents + added.contents,
+            self.metadatas + added.metadatas,
+            np.vstack([self.unit_vectors, added.unit_vectors]) if len(self.review_ids) else added.unit_vectors,
+        )
+
+    def top_k(self, query_vector: List[float], k: int) -> List[ReviewMatch]:
+        import numpy as np
+        if not self.review_ids:
+            return []
+        similarities = self.unit_vectors @ _unit_vectors([query_vector])[0]
+        if k < len(similarities):
+            best_indices = np.argpartition(-similarities, k - 1)[:k]
+        else:
+            best_indices = np.arange(len(similarities))
+        best_indices = best_indices[np.argsort(-similarities[best_indices], kind="stable")]
+        return [
+            (self.contents[index], self.metadatas[index], self.review_ids[index])
+            for index in best_indices
+        ]
+
+
+def _hotel_reviews_query(hotel_id: str) -> Dict[str, Any]:
+    return {
+        "filter": {
+            "metadata.hotel_id": hotel_id,
+        },
+        "projection": {
+            "_id": 1,
+            "content": 1,
+            "metadata": 1,
+            "$vector": 1,
+        },
+    }
+
+
+class ReviewVectorIndex:
+
+    def __init__(
+        self,
+        max_hotels: int = REVIEW_VECTOR_INDEX_MAX_HOTELS,
+        max_reviews_per_hotel: int = REVIEW_VECTOR_INDEX_MAX_REVIEWS_PER_HOTEL,
+        ttl_seconds: float = REVIEW_VECTOR_INDEX_TTL_SECONDS,
+    ):
+        self.max_reviews_per_hotel = max_reviews_per_hotel
+        # hotel_id -> HotelReviewVectors (or TOO_MANY_REVIEWS)
+        self._hotels = TTLCache(max_size=max_hotels, ttl_seconds=ttl_seconds)
+        # hotel_id -> review documents added while the hotel is being loaded
+        self._loading: Dict[str, List[Dict[str, Any]]] = {}
+        self._load_tasks = set()
+        self._lock = threading.Lock()
+        self.local_searches = 0
+        self.remote_fallbacks = 0
+        self.loads = 0
+        self.load_failures = 0
+
+    # None if the hotel is not in the index: the search is then to be made remotely,
+    # and the hotel loaded (see schedule_load / aschedule_load).
+    # TOO_MANY_REVIEWS if the hotel is known to be too large: the search is to be made
+    # remotely, without loading the hotel (until the entry expires).
+    def search(self, hotel_id: str, query_vector: List[float], k: int) -> Union[List[ReviewMatch], object, None]:
+        hotel_reviews = self._hotels.get(hotel_id)
+        if hotel_reviews is MISSING or hotel_reviews is TOO_MANY_REVIEWS:
+            with self._lock:
+                self.remote_fallbacks += 1
+            return None if hotel_reviews is MISSING else TOO_MANY_REVIEWS
+        with self._lock:
+            self.local_searches += 1
+        return hotel_reviews.top_k(query_vector, k)
+
+    def add_review(self, hotel_id: str, review_vector_doc: Dict[str, Any]):
+        with self._lock:
+            if hotel_id in self._loading:
+                self._loading[hotel_id].append(review_vector_doc)
+                return
+            hotel_reviews = self._hotels.get(hotel_id)
+            if isinstance(hotel_reviews, HotelReviewVectors):
+                self._hotels.put(hotel_id, hotel_reviews.with_reviews([review_vector_doc]))
+
+    def _claim_load(self, hotel_id: str) -> bool:
+        with self._lock:
+            if hotel_id in self._loading:
+                return False
+            self._loading[hotel_id] = []
+            return True
+
+    def _complete_load(self, hotel_id: str, review_vector_docs: Optional[List[Dict[str, Any]]]):
+        with self._lock:
+            added_docs = self._loading.pop(hotel_id)
+            if review_vector_docs is None:
+                self.load_failures += 1
+                return
+            self.loads += 1
+            if len(review_vector_docs) > self.max_reviews_per_hotel:
+                self._hotels.put(hotel_id, TOO_MANY_REVIEWS)
+            else:
+                self._hotels.put(hotel_id, HotelReviewVectors.from_documents(review_vector_docs).with_reviews(added_docs))
+
+    def _load(self, hotel_id: str):
+        review_vector_docs = None
+        try:
+            review_vector_col = get_astra_db_client().collection(REVIEW_VECTOR_COLLECTION_NAME)
+            review_vector_docs = []
+            for review_doc in review_vector_col.paginated_find(**_hotel_reviews_query(hotel_id)):
+                review_vector_docs.append(review_doc)
+                if len(review_vector_docs) > self.max_reviews_per_hotel:
+                    break
+        except Exception as e:
+            print(f"[review_vector_index] Loading the reviews of hotel {hotel_id} failed: {e}")
+            review_vector_docs = None
+        finally:
+            self._complete_load(hotel_id, review_vector_docs)
+
+    async def _aload(self, hotel_id: str):
+        review_vector_docs = None
+        try:
+            astra_db_client = get_async_astra_db_client()
+            review_vector_col = await astra_db_client.collection(REVIEW_VECTOR_COLLECTION_NAME)
+            review_vector_docs = []
+            async for review_doc in review_vector_col.paginated_find(**_hotel_reviews_query(hotel_id)):
+                review_vector_docs.append(review_doc)
+                if len(review_vector_docs) > self.max_reviews_per_hotel:
+                    break
+        except Exception as e:
+            print(f"[review_vector_index] Loading the reviews of hotel {hotel_id} failed: {e}")
+            review_vector_docs = None
+        finally:
+            self._complete_load(hotel_id, review_vector_docs)
+
+    # Loads the hotel in a background thread (unless being loaded already)
+    def schedule_load(self, hotel_id: str):
+        if self._claim_load(hotel_id):
+            threading.Thread(target=self._load, args=(hotel_id,), daemon=True).start()
+
+    # Async version of the above: loads the hotel in a task of the running event loop
+    def aschedule_load(self, hotel_id: str):
+        if self._claim_load(hotel_id):
+            load_task = asyncio.get_running_loop().create_task(self._aload(hotel_id))
+            # (a reference is kept until done, see asyncio.create_task)
+            self._load_tasks.add(load_task)
+            load_task.add_done_callback(self._load_tasks.discard)
+
+    def stats(self) -> Dict[str, float]:
+        hotels_stats = self._hotels.stats()
+        with self._lock:
+            searches = self.local_searches + self.remote_fallbacks
+            return {
+                "enabled": 1,
+                "hotels": hotels_stats["size"],
+                "evictions": hotels_stats["evictions"],
+                "loading": len(self._loading),
+                "loads": self.loads,
+                "load_failures": self.load_failures,
+                "local_searches": self.local_searches,
+                "remote_fallbacks": self.remote_fallbacks,
+                "local_ratio": self.local_searches / searches if searches else 0.0,
+            }
+
+
+review_vector_index = ReviewVectorIndex() if REVIEW_VECTOR_INDEX_ENABLED else None
+
+
+def review_vector_index_stats() -> Dict[str, float]:
+    if review_vector_index is None:
+        return {"enabled": 0}
+    return review_vector_index.stats()
@@ -1,19 +1,25 @@
 """Utilities to manipulate reviews"""
+import asyncio
+import os
 import random
 import uuid, datetime
-from langchain.vectorstores import AstraDB as LCAstraDB
 
 from common_constants import (
     FEATURED_VOTE_THRESHOLD,
+    INSERTION_BATCH_SIZE,
     REVIEWS_COLLECTION_NAME,
     REVIEW_VECTOR_COLLECTION_NAME,
 )
 from utils.models import HotelReview, UserProfile
 from utils.dates import datetime_to_json_block, restore_doc_dates
 from utils.ai import get_embeddings
-from utils.db import get_astra_db_client
+from utils.db import get_astra_db_client, get_async_astra_db_client
+from utils.hotels import increment_hotel_review_count, aincrement_hotel_review_count
+from utils.batching import batch_iterable
+from utils.instrumentation import span, timed
+from utils.review_vector_index import TOO_MANY_REVIEWS, review_vector_index
 
-from typing import List
+from typing import Any, Dict, List, Optional
 
 # LangChain VectorStore abstraction to interact with the vector database
 review_vectorstore = None
@@ -22,6 +28,7 @@ review_vectorstore = None
 def get_review_vectorstore(embeddings, astra_db_client):
     global review_vectorstore
     if review_vectorstore is None:
+        from langchain.vectorstores import AstraDB as LCAstraDB
         review_vectorstore = LCAstraDB(
             embedding=embeddings,
             collection_name=REVIEW_VECTOR_COLLECTION_NAME,
@@ -32,75 +39,99 @@ def get_review_vectorstore(embeddings, astra_db_client):
 
 # ### SELECTING REVIEWS
 
-# Entry point to select reviews for the general (base) hotel summary
-def select_general_hotel_reviews(hotel_id: str) -> List[HotelReview]:
-    astra_db_client = get_astra_db_client()
-    review_col = astra_db_client.collection(REVIEWS_COLLECTION_NAME)
-
-    review_dict = {}
-
-    _recent_review_docs = review_col.find(
-        filter={
-            "hotel_id": hotel_id,
-        },
-        sort={
+def _general_hotel_reviews_query(hotel_id: str, featured_only: bool) -> Dict[str, Any]:
+    review_filter = {
+        "hotel_id": hotel_id,
+    }
+    if featured_only:
+        review_filter["featured"] = 1
+    return {
+        "filter": review_filter,
+        "sort": {
             "date_added": -1,
         },
-        projection={
+        "projection": {
             "_id": 1,
             "title": 1,
             "body": 1,
             "rating": 1,
             "date_added": 1,
         },
-        options={
+        "options": {
             "limit": 3,
         },
-    )["data"]["documents"]
+    }
+
+
+def _merge_general_hotel_reviews(_recent_review_docs, _featured_review_docs) -> List[HotelReview]:
+    review_dict = {}
+
     recent_review_docs = [restore_doc_dates(doc) for doc in _recent_review_docs]
+    featured_review_docs = [restore_doc_dates(doc) for doc in _featured_review_docs]
+
+    for review_doc in recent_review_docs + featured_review_docs:
+        review_dict[review_doc["_id"]] = HotelReview(
+            id=review_doc["_id"],
+            title=review_doc["title"],
+            body=review_doc["body"],
+            rating=review_doc["rating"],
+        )
+
+    return list(review_dict.values())
 
-    for recent_review_doc in recent_review_docs:
-        review_dict[recent_review_doc["_id"]] = HotelReview(
-            id=recent_review_doc["_id"],
-            title=recent_review_doc["title"],
-            body=recent_review_doc["body"],
-            rating=recent_review_doc["rating"],
-       )
+
+# Entry point to select reviews for the general (base) hotel summary
+@timed("reviews.select_general")
+def select_general_hotel_reviews(hotel_id: str) -> List[HotelReview]:
+    astra_db_client = get_astra_db_client()
+    review_col = astra_db_client.collection(REVIEWS_COLLECTION_NAME)
+
+    _recent_review_docs = review_col.find(
+        **_general_hotel_reviews_query(hotel_id, featured_only=False),
+    )["data"]["documents"]
 
     _featured_review_docs = review_col.find(
-        filter={
-            "hotel_id": hotel_id,
-            "featured": 1,
-        },
-        sort={
-            "date_added": -1,
-        },
-        projection={
-            "_id": 1,
-            "title": 1,
-            "body": 1,
-            "rating": 1,
-            "date_added": 1,
-        },
-        options={
-            "limit": 3,
-        },
+        **_general_hotel_reviews_query(hotel_id, featured_only=True),
     )["data"]["documents"]
-    featured_review_docs = [restore_doc_dates(doc) for doc in _featured_review_docs]
 
-    for featured_review_doc in featured_review_docs:
-        review_dict[featured_review_doc["_id"]] = HotelReview(
-            id=featured_review_doc["_id"],
-            title=featured_review_doc["title"],
-            body=featured_review_doc["body"],
-            rating=featured_review_doc["rating"],
-       )
+    return _merge_general_hotel_reviews(_recent_review_docs, _featured_review_docs)
 
-    return list(review_dict.values())
+
+# Async version of the above: the two queries run concurrently
+@timed("reviews.select_general")
+async def aselect_general_hotel_reviews(hotel_id: str) -> List[HotelReview]:
+    astra_db_client = get_async_astra_db_client()
+    review_col = await astra_db_client.collection(REVIEWS_COLLECTION_NAME)
+
+    recent_response, featured_response = await asyncio.gather(
+        review_col.find(**_general_hotel_reviews_query(hotel_id, featured_only=False)),
+        review_col.find(**_general_hotel_reviews_query(hotel_id, featured_only=True)),
+    )
+
+    return _merge_general_hotel_reviews(
+        recent_response["data"]["documents"],
+        featured_response["data"]["documents"],
+    )
+
+
+def _review_from_vector_doc(review_text: str, review_metadata: Dict[str, Any], review_id: str) -> HotelReview:
+    return HotelReview(
+        title=review_metadata["title"].strip(),
+        body=extract_review_body_from_doc_text(
+            review_text, review_metadata["title"]
+        ),
+        rating=float(review_metadata["rating"]),
+        id=review_id,
+    )
 
 
+# The travel profile vector, if available (i.e. stored with the user profile),
+# spares the embedding computation of the travel profile summary.
+@timed("reviews.select_for_user")
 def select_hotel_reviews_for_user(
-    hotel_id: str, user_travel_profile_summary: str
+    hotel_id: str,
+    user_travel_profile_summary: str,
+    user_travel_profile_vector: Optional[List[float]] = None,
 ) -> List[HotelReview]:
     astra_db_client = get_astra_db_client()
     review_store = get_review_vectorstore(
@@ -108,27 +139,93 @@ def select_hotel_reviews_for_user(
         astra_db_client=astra_db_client,
     )
 
-    review_data = review_store.similarity_search_with_score_id(
-        query=user_travel_profile_summary,
+    if user_travel_profile_vector is None:
+        user_travel_profile_vector = get_embeddings().embed_query(user_travel_profile_summary)
+
+    # (hotels in the in-process index, if enabled, are searched locally)
+    if review_vector_index is not None:
+        with span("reviews.local_vector_search"):
+            review_matches = review_vector_index.search(hotel_id, user_travel_profile_vector, k=3)
+        if review_matches is None:
+            review_vector_index.schedule_load(hotel_id)
+        elif review_matches is not TOO_MANY_REVIEWS:
+            return [
+                _review_from_vector_doc(review_content, review_metadata, review_id)
+                for review_content, review_metadata, review_id in review_matches
+            ]
+
+    review_data = review_store.similarity_search_with_score_id_by_vector(
+        embedding=user_travel_profile_vector,
         k=3,
         filter={"hotel_id": hotel_id},
     )
 
     reviews = [
-        HotelReview(
-            title=review_doc.metadata["title"].strip(),
-            body=extract_review_body_from_doc_text(
-                review_doc.page_content, review_doc.metadata["title"]
-            ),
-            rating=float(review_doc.metadata["rating"]),
-            id=review_id,
-        )
+        _review_from_vector_doc(review_doc.page_content, review_doc.metadata, review_id)
         for review_doc, _, review_id in review_data
     ]
 
     return reviews
 
 
+# Async version of the above. The LangChain vector store has no async search,
+# so this reproduces its query (same document layout) on the async client.
+@timed("reviews.select_for_user")
+async def aselect_hotel_reviews_for_user(
+    hotel_id: str,
+    user_travel_profile_summary: str,
+    user_travel_profile_vector: Optional[List[float]] = None,
+) -> List[HotelReview]:
+    if user_travel_profile_vector is None:
+        with span("reviews.embed_profile"):
+            query_vector = await get_embeddings().aembed_query(user_travel_profile_summary)
+    else:
+        query_vector = user_travel_profile_vector
+
+    if review_vector_index is not None:
+        with span("reviews.local_vector_search"):
+            review_matches = review_vector_index.search(hotel_id, query_vector, k=3)
+        if review_matches is None:
+            review_vector_index.aschedule_load(hotel_id)
+        elif review_matches is not TOO_MANY_REVIEWS:
+            return [
+                _review_from_vector_doc(review_content, review_metadata, review_id)
+                for review_content, review_metadata, review_id in review_matches
+            ]
+
+    astra_db_client = get_async_astra_db_client()
+    review_vector_col = await astra_db_client.collection(REVIEW_VECTOR_COLLECTION_NAME)
+
+    with span("reviews.vector_search"):
+        review_docs = (await review_vector_col.find(
+            filter={
+                "metadata.hotel_id": hotel_id,
+            },
+            sort={
+                "$vector": query_vector,
+            },
+            projection={
+                "_id": 1,
+                "content": 1,
+                "metadata": 1,
+            },
+            options={
+                "limit": 3,
+            },
+        ))["data"]["documents"]
+
+    reviews = [
+        _review_from_vector_doc(review_doc["content"], review_doc["metadata"], review_doc["_id"])
+        for review_doc in review_docs
+    ]
+
+    return reviews
+
+
+# Full scan of a hotel's reviews. Not used on the request path:
+# the API reads the counter stored on the hotel document instead
+# (see setup/6-backfill-hotel-review-counts.py to rebuild those counters).
+@timed("reviews.count")
 def select_review_count_by_hotel(hotel_id: str) -> int:
     astra_db_client = get_astra_db_client()
     review_col = astra_db_client.collection(REVIEWS_COLLECTION_NAME)
@@ -157,6 +254,8 @@ def extract_review_body_from_doc_text(review_doc_text: str, review_title: str) -
 # - Generates an id for the new review
 # - Stores the review in the non-vectorised collection
 # - Embeds the review and then stores it in the vectorised collection
+# - Bumps the review counter stored on the hotel document
+@timed("reviews.insert")
 def insert_review_for_hotel(
     hotel_id: str, review_title: str, review_body: str, review_rating: int
 ):
@@ -167,12 +266,40 @@ def insert_review_for_hotel(
     insert_into_review_vector_collection(
         hotel_id, review_id, review_title, review_body, review_rating
     )
+    increment_hotel_review_count(hotel_id)
+
+
+# Async version of the above: the three writes are independent and run concurrently
+@timed("reviews.insert")
+async def ainsert_review_for_hotel(
+    hotel_id: str, review_title: str, review_body: str, review_rating: int
+):
+    review_id = generate_review_id()
+    await asyncio.gather(
+        ainsert_into_reviews_collection(
+            hotel_id, review_id, review_title, review_body, review_rating
+        ),
+        ainsert_into_review_vector_collection(
+            hotel_id, review_id, review_title, review_body, review_rating
+        ),
+        aincrement_hotel_review_count(hotel_id),
+    )
 
 
 def generate_review_id():
     return uuid.uuid4().hex
 
 
+# Many ids at once, in the same format (random UUID4 as 32 hex digits), for bulk data preparation
+def generate_review_ids(num_ids: int) -> List[str]:
+    import numpy as np
+    id_bytes = np.frombuffer(os.urandom(16 * num_ids), dtype=np.uint8).reshape(num_ids, 16).copy()
+    id_bytes[:, 6] = (id_bytes[:, 6] & 0x0F) | 0x40  # version 4
+    id_bytes[:, 8] = (id_bytes[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    hex_digits = id_bytes.tobytes().hex().encode()
+    return np.frombuffer(hex_digits, dtype="S32").astype(str).tolist()
+
+
 def format_review_content_for_embedding(title: str, body: str) -> str:
     return f"{title}: {body}"
 
@@ -184,21 +311,22 @@ def choose_featured(num_upvotes: int) -> int:
         return 0
 
 
-# Inserts a new review into the non-vectorised reviews collection
-def insert_into_reviews_collection(
+# Reviews whose vector is yet to be written (see utils/ingestion.py) carry this flag
+EMBEDDING_PENDING_FIELD = "embedding_pending"
+
+
+def _new_review_document(
     hotel_id: str,
     review_id: str,
     review_title: str,
     review_body: str,
     review_rating: int,
-):
-    astra_db_client = get_astra_db_client()
-    review_col = astra_db_client.collection(REVIEWS_COLLECTION_NAME)
-
+    embedding_pending: bool = False,
+) -> Dict[str, Any]:
     date_added = datetime.datetime.now()
     featured = choose_featured(random.randint(1, 21))
 
-    review_col.insert_one({
+    review_document = {
         "_id": review_id,
         "hotel_id": hotel_id,
         "date_added": datetime_to_json_block(date_added),
@@ -206,12 +334,172 @@ def insert_into_reviews_collection(
         "body": review_body,
         "rating": review_rating,
         "featured": featured,
-    })
+    }
+    if embedding_pending:
+        review_document[EMBEDDING_PENDING_FIELD] = 1
+    return review_document
+
+
+def _review_vector_metadata(hotel_id: str, review_title: str, review_rating: int) -> Dict[str, Any]:
+    return {
+        "hotel_id": hotel_id,
+        "rating": review_rating,
+        "title": review_title,
+    }
+
+
+# Same layout as the documents written by the LangChain vector store
+def _review_vector_document(
+    hotel_id: str,
+    review_id: str,
+    review_title: str,
+    review_body: str,
+    review_rating: int,
+    review_vector: List[float],
+) -> Dict[str, Any]:
+    return {
+        "_id": review_id,
+        "content": format_review_content_for_embedding(review_title, review_body),
+        "$vector": review_vector,
+        "metadata": _review_vector_metadata(hotel_id, review_title, review_rating),
+    }
+
+
+# Inserts a new review into the non-vectorised reviews collection
+@timed("reviews.insert_primary")
+def insert_into_reviews_collection(
+    hotel_id: str,
+    review_id: str,
+    review_title: str,
+    review_body: str,
+    review_rating: int,
+):
+    astra_db_client = get_astra_db_client()
+    review_col = astra_db_client.collection(REVIEWS_COLLECTION_NAME)
+
+    review_col.insert_one(_new_review_document(
+        hotel_id, review_id, review_title, review_body, review_rating
+    ))
+
+
+@timed("reviews.insert_primary")
+async def ainsert_into_reviews_collection(
+    hotel_id: str,
+    review_id: str,
+    review_title: str,
+    review_body: str,
+    review_rating: int,
+    embedding_pending: bool = False,
+):
+    astra_db_client = get_async_astra_db_client()
+    review_col = await astra_db_client.collection(REVIEWS_COLLECTION_NAME)
+
+    await review_col.insert_one(_new_review_document(
+        hotel_id, review_id, review_title, review_body, review_rating, embedding_pending
+    ))
+
+
+# Bulk version of the above, for entries shaped as in ainsert_batch_into_review_vector_collection.
+# The chunks of INSERTION_BATCH_SIZE documents are written concurrently, and a failure
+# does not affect the other documents: returns the error (None for success) of each entry.
+@timed("reviews.insert_primary_batch")
+async def ainsert_batch_into_reviews_collection(
+    review_entries: List[Dict[str, Any]],
+    embedding_pending: bool = False,
+) -> List[Optional[str]]:
+    astra_db_client = get_async_astra_db_client()
+    review_col = await astra_db_client.collection(REVIEWS_COLLECTION_NAME)
+
+    async def _insert_chunk(entry_chunk: List[Dict[str, Any]]) -> List[Optional[str]]:
+        review_docs = [
+            _new_review_document(
+                entry["hotel_id"], entry["review_id"], entry["title"], entry["body"], entry["rating"],
+                embedding_pending,
+            )
+            for entry in entry_chunk
+        ]
+        try:
+            im_result = await review_col.insert_many(
+                documents=review_docs,
+                options={"ordered": False},
+                partial_failures_allowed=True,
+            )
+        except Exception as e:
+            return [str(e)] * len(entry_chunk)
+        inserted_ids = set(im_result.get("status", {}).get("insertedIds", []))
+        error_messages = [
+            error.get("message", str(error))
+            for error in im_result.get("errors", [])
+        ]
+
+        # (the errors naming the document, if any, else all those of the chunk)
+        def _entry_error(review_id: str) -> str:
+            own_error_messages = [message for message in error_messages if review_id in message]
+            return "; ".join(own_error_messages or error_messages) or "Document not inserted"
+
+        return [
+            None if entry["review_id"] in inserted_ids else _entry_error(entry["review_id"])
+            for entry in entry_chunk
+        ]
+
+    chunk_errors = await asyncio.gather(*(
+        _insert_chunk(entry_chunk)
+        for entry_chunk in batch_iterable(review_entries, INSERTION_BATCH_SIZE)
+    ))
+    return [error for errors in chunk_errors for error in errors]
+
+
+# Reviews still waiting for their vector to be written, in the same
+# shape as the entries of ainsert_batch_into_review_vector_collection
+@timed("reviews.select_pending_embedding")
+async def aselect_reviews_pending_embedding() -> List[Dict[str, Any]]:
+    astra_db_client = get_async_astra_db_client()
+    review_col = await astra_db_client.collection(REVIEWS_COLLECTION_NAME)
+
+    return [
+        {
+            "hotel_id": review_doc["hotel_id"],
+            "review_id": review_doc["_id"],
+            "title": review_doc["title"],
+            "body": review_doc["body"],
+            "rating": review_doc["rating"],
+        }
+        async for review_doc in review_col.paginated_find(
+            filter={
+                EMBEDDING_PENDING_FIELD: 1,
+            },
+            projection={
+                "_id": 1,
+                "hotel_id": 1,
+                "title": 1,
+                "body": 1,
+                "rating": 1,
+            },
+        )
+    ]
+
+
+@timed("reviews.clear_pending_embedding")
+async def aclear_reviews_embedding_pending(review_ids: List[str]):
+    astra_db_client = get_async_astra_db_client()
+    review_col = await astra_db_client.collection(REVIEWS_COLLECTION_NAME)
+
+    await review_col.update_many(
+        filter={
+            "_id": {"$in": review_ids},
+        },
+        update={
+            "$unset": {
+                EMBEDDING_PENDING_FIELD: "",
+            },
+        },
+    )
 
 
-# Inserts a new review into the vectorised reviews collection,
-# using a VectorStore of type AstraDB from LangChain
-# (class imported as 'LCAstraDB' to avoid collision with AstraPy's class)
+# Inserts a new review into the vectorised reviews collection.
+# The document has the layout of the LangChain vector store used for the searches,
+# and is written directly (so that it can be added to the in-process index as well).
+@timed("reviews.insert_vector")
 def insert_into_review_vector_collection(
     hotel_id: str,
     review_id: str,
@@ -219,19 +507,78 @@ def insert_into_review_vector_collection(
     review_body: str,
     review_rating: int,
 ):
-    review_store = get_review_vectorstore(
-        embeddings=get_embeddings(),
-        astra_db_client=get_astra_db_client(),
+    review_text = format_review_content_for_embedding(review_title, review_body)
+    review_vector = get_embeddings().embed_query(review_text)
+
+    review_vector_col = get_astra_db_client().collection(REVIEW_VECTOR_COLLECTION_NAME)
+
+    review_vector_doc = _review_vector_document(
+        hotel_id, review_id, review_title, review_body, review_rating, review_vector
     )
+    review_vector_col.insert_one(review_vector_doc)
+    if review_vector_index is not None:
+        review_vector_index.add_review(hotel_id, review_vector_doc)
 
-    review_metadata = {
-        "hotel_id": hotel_id,
-        "rating": review_rating,
-        "title": review_title,
-    }
 
-    review_store.add_texts(
-        texts=[format_review_content_for_embedding(review_title, review_body)],
-        metadatas=[review_metadata],
-        ids=[review_id],
+# Async version of the above.
+@timed("reviews.insert_vector")
+async def ainsert_into_review_vector_collection(
+    hotel_id: str,
+    review_id: str,
+    review_title: str,
+    review_body: str,
+    review_rating: int,
+):
+    review_text = format_review_content_for_embedding(review_title, review_body)
+    review_vector = await get_embeddings().aembed_query(review_text)
+
+    astra_db_client = get_async_astra_db_client()
+    review_vector_col = await astra_db_client.collection(REVIEW_VECTOR_COLLECTION_NAME)
+
+    review_vector_doc = _review_vector_document(
+        hotel_id, review_id, review_title, review_body, review_rating, review_vector
     )
+    await review_vector_col.insert_one(review_vector_doc)
+    if review_vector_index is not None:
+        review_vector_index.add_review(hotel_id, review_vector_doc)
+
+
+# Embeds a batch of reviews with a single call and writes them with bulk insertions.
+# Each entry is a dict with keys "hotel_id", "review_id", "title", "body", "rating".
+# Already-existing ids are not an error (the write is idempotent);
+# returns the ids of the reviews whose vector is now stored.
+@timed("reviews.insert_vector_batch")
+async def ainsert_batch_into_review_vector_collection(review_entries: List[Dict[str, Any]]) -> List[str]:
+    review_vectors = await get_embeddings().aembed_documents([
+        format_review_content_for_embedding(entry["title"], entry["body"])
+        for entry in review_entries
+    ])
+
+    astra_db_client = get_async_astra_db_client()
+    review_vector_col = await astra_db_client.collection(REVIEW_VECTOR_COLLECTION_NAME)
+
+    review_vector_docs = [
+        _review_vector_document(
+            entry["hotel_id"], entry["review_id"], entry["title"], entry["body"], entry["rating"], review_vector
+        )
+        for entry, review_vector in zip(review_entries, review_vectors)
+    ]
+    for doc_batch in batch_iterable(review_vector_docs, INSERTION_BATCH_SIZE):
+        im_result = await review_vector_col.insert_many(
+            documents=doc_batch,
+            options={"ordered": False},
+            partial_failures_allowed=True,
+        )
+        unexpected_errors = [
+            error
+            for error in im_result.get("errors", [])
+            if error.get("errorCode") != "DOCUMENT_ALREADY_EXISTS"
+        ]
+        if unexpected_errors:
+            raise ValueError(f"API Exception while running bulk insertion: {str(unexpected_errors)}")
+
+    if review_vector_index is not None:
+        for review_vector_doc in review_vector_docs:
+            review_vector_index.add_review(review_vector_doc["metadata"]["hotel_id"], review_vector_doc)
+
+    return [entry["review_id"] for entry in review_entries]
@@ -0,0 +1,102 @@
+"""Opt-in semantic cache for the personalized (user-tailored) review summaries"""
+import os
+import threading
+from typing import Dict, List, Optional
+
+from utils.caching import MISSING, TTLCache
+
+
+# The prompt of a personalized summary contains the free-text travel profile summary,
+# so users with nearly identical profiles never share an (exact-prompt) LLM cache entry.
+# When enabled, a personalized summary is also looked up by:
+#   - the exact set of review ids being summarized, and
+#   - the embedding of the travel profile, within a cosine similarity threshold;
+# a match is served without calling the LLM.
+# The similarity threshold trades LLM calls for tailoring: keep it high.
+SEMANTIC_SUMMARY_CACHE_ENABLED = os.environ.get("SEMANTIC_SUMMARY_CACHE", "0") == "1"
+SEMANTIC_SUMMARY_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_SUMMARY_CACHE_THRESHOLD", "0.97"))
+# max distinct review sets, and max profiles remembered for each of them
+SEMANTIC_SUMMARY_CACHE_MAX_SIZE = int(os.environ.get("SEMANTIC_SUMMARY_CACHE_MAX_SIZE", "4096"))
+SEMANTIC_SUMMARY_CACHE_PROFILES_PER_KEY = int(os.environ.get("SEMANTIC_SUMMARY_CACHE_PROFILES_PER_KEY", "16"))
+SEMANTIC_SUMMARY_CACHE_TTL_SECONDS = float(os.environ.get("SEMANTIC_SUMMARY_CACHE_TTL_SECONDS", "86400"))
+
+
+# (NumPy is imported on first use: the cache is disabled by default)
+def _unit_vector(vector: List[float]):
+    import numpy as np
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm > 0 else array
+
+
+class SemanticSummaryCache:
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_SUMMARY_CACHE_THRESHOLD,
+        max_size: int = SEMANTIC_SUMMARY_CACHE_MAX_SIZE,
+        profiles_per_key: int = SEMANTIC_SUMMARY_CACHE_PROFILES_PER_KEY,
+        ttl_seconds: float = SEMANTIC_SUMMARY_CACHE_TTL_SECONDS,
+    ):
+        self.threshold = threshold
+        self.profiles_per_key = profiles_per_key
+        # review-id set -> (profile vectors matrix, summaries), most recent last
+        self._entries = TTLCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(review_ids: List[str]):
+        return frozenset(review_ids)
+
+    def lookup(self, review_ids: List[str], profile_vector: List[float]) -> Optional[List[str]]:
+        import numpy as np
+        entry = self._entries.get(self._key(review_ids))
+        if entry is not MISSING:
+            profile_matrix, summaries = entry
+            similarities = profile_matrix @ _unit_vector(profile_vector)
+            best_index = int(np.argmax(similarities))
+            if similarities[best_index] >= self.threshold:
+                with self._lock:
+                    self.hits += 1
+                return list(summaries[best_index])
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def update(self, review_ids: List[str], profile_vector: List[float], summary: List[str]):
+        import numpy as np
+        key = self._key(review_ids)
+        with self._lock:
+            # (not a lookup: only the lookups count as hits or misses)
+            entry = self._entries.peek(key)
+            if entry is MISSING:
+                profile_matrix, summaries = np.empty((0, len(profile_vector)), dtype=np.float32), []
+            else:
+                profile_matrix, summaries = entry
+            # (arrays are replaced, not modified, so concurrent lookups see a consistent entry)
+            profile_matrix = np.vstack([profile_matrix, _unit_vector(profile_vector)])[-self.profiles_per_key:]
+            summaries = (summaries + [list(summary)])[-self.profiles_per_key:]
+            self._entries.put(key, (profile_matrix, summaries))
+
+    def stats(self) -> Dict[str, float]:
+        entries_stats = self._entries.stats()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": 1,
+                "review_sets": entries_stats["size"],
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+semantic_summary_cache = SemanticSummaryCache() if SEMANTIC_SUMMARY_CACHE_ENABLED else None
+
+
+def semantic_summary_cache_stats() -> Dict[str, float]:
+    if semantic_summary_cache is None:
+        return {"enabled": 0}
+    return semantic_summary_cache.stats()
@@ -0,0 +1,61 @@
+"""A minimal executor for the stages of an endpoint, expressed as a dependency graph"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class StageGraph:
+    """
+    Each stage is an async function, receiving as keyword arguments the results
+    of the stages it depends on. Stages can only depend on stages added before
+    them (so the graph is acyclic by construction).
+    Running the graph starts every stage as soon as its dependencies are done,
+    hence independent stages run concurrently.
+    The wall-clock duration of each stage (in seconds) is recorded in `timings`.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Callable[..., Awaitable[Any]]] = {}
+        self.dependencies: Dict[str, List[str]] = {}
+        self.timings: Dict[str, float] = {}
+
+    def add(self, name: str, stage_func: Callable[..., Awaitable[Any]], depends_on: Optional[List[str]] = None):
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' already defined")
+        missing = [dep for dep in (depends_on or []) if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on undefined stage(s): {', '.join(missing)}")
+        self.stages[name] = stage_func
+        self.dependencies[name] = list(depends_on or [])
+
+    async def _run_stage(self, name: str, tasks: Dict[str, asyncio.Task]) -> Any:
+        dependency_results = {
+            dep: await tasks[dep]
+            for dep in self.dependencies[name]
+        }
+        stage_start = time.perf_counter()
+        try:
+            return await self.stages[name](**dependency_results)
+        finally:
+            self.timings[name] = time.perf_counter() - stage_start
+
+    async def run(self) -> Dict[str, Any]:
+        tasks: Dict[str, asyncio.Task] = {}
+        # insertion order is a valid topological order
+        for name in self.stages:
+            tasks[name] = asyncio.ensure_future(self._run_stage(name, tasks))
+        try:
+            results = await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            # let the other stages finish (or cancel), consuming their errors
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return dict(zip(tasks.keys(), results))
+
+    def format_timings(self) -> str:
+        return ", ".join(
+            f"{name}={duration * 1000:.1f}ms"
+            for name, duration in self.timings.items()
+        )
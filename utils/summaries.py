@@ -0,0 +1,170 @@
+"""Utilities to manage the precomputed base (i.e. non-user-specific) hotel summaries"""
+import hashlib
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from common_constants import HOTELS_COLLECTION_NAME
+from utils.db import get_astra_db_client, get_async_astra_db_client
+from utils.models import HotelReview
+from utils.review_llm import (
+    summarize_reviews_for_hotel,
+    asummarize_reviews_for_hotel,
+    astream_summarize_reviews_for_hotel,
+)
+from utils.reviews import select_general_hotel_reviews, aselect_general_hotel_reviews
+
+
+# The summary is stored on the hotel document itself (the primary database
+# has no room for a further collection), in a "base_summary" field shaped as:
+#   {
+#       "fingerprint": <hash of the ids of the reviews it was generated from>,
+#       "reviews": [<HotelReview as dict>, ...],
+#       "summary": [<bullet point>, ...],
+#   }
+# The fingerprint tells whether the stored summary is still up to date.
+BASE_SUMMARY_FIELD = "base_summary"
+
+
+def compute_review_fingerprint(reviews: List[HotelReview]) -> str:
+    # Order matters, as it determines the prompt given to the LLM
+    review_ids = "\n".join(review.id for review in reviews)
+    return hashlib.sha256(review_ids.encode()).hexdigest()
+
+
+def _base_summary_query(hotel_id: str) -> Dict[str, Any]:
+    return {
+        "filter": {
+            "_id": hotel_id,
+        },
+        "projection": {
+            BASE_SUMMARY_FIELD: 1,
+        },
+    }
+
+
+def _base_summary_update(
+    hotel_id: str, fingerprint: str, reviews: List[HotelReview], summary: List[str]
+) -> Dict[str, Any]:
+    return {
+        "filter": {
+            "_id": hotel_id,
+        },
+        "update": {
+            "$set": {
+                BASE_SUMMARY_FIELD: {
+                    "fingerprint": fingerprint,
+                    "reviews": [review.dict() for review in reviews],
+                    "summary": summary,
+                },
+            },
+        },
+    }
+
+
+def _hotel_doc_to_base_summary(hotel_doc) -> Optional[Dict[str, Any]]:
+    if hotel_doc is not None and BASE_SUMMARY_FIELD in hotel_doc:
+        stored = hotel_doc[BASE_SUMMARY_FIELD]
+        return {
+            "fingerprint": stored["fingerprint"],
+            "reviews": [HotelReview(**review) for review in stored["reviews"]],
+            "summary": stored["summary"],
+        }
+    else:
+        return None
+
+
+def read_base_hotel_summary(hotel_id: str) -> Optional[Dict[str, Any]]:
+    astra_db_client = get_astra_db_client()
+    hotels_col = astra_db_client.collection(HOTELS_COLLECTION_NAME)
+
+    hotel_doc = hotels_col.find_one(
+        **_base_summary_query(hotel_id),
+    )["data"]["document"]
+
+    return _hotel_doc_to_base_summary(hotel_doc)
+
+
+async def aread_base_hotel_summary(hotel_id: str) -> Optional[Dict[str, Any]]:
+    astra_db_client = get_async_astra_db_client()
+    hotels_col = await astra_db_client.collection(HOTELS_COLLECTION_NAME)
+
+    hotel_doc = (await hotels_col.find_one(
+        **_base_summary_query(hotel_id),
+    ))["data"]["document"]
+
+    return _hotel_doc_to_base_summary(hotel_doc)
+
+
+def write_base_hotel_summary(
+    hotel_id: str, fingerprint: str, reviews: List[HotelReview], summary: List[str]
+):
+    astra_db_client = get_astra_db_client()
+    hotels_col = astra_db_client.collection(HOTELS_COLLECTION_NAME)
+
+    hotels_col.find_one_and_update(
+        **_base_summary_update(hotel_id, fingerprint, reviews, summary),
+    )
+
+
+async def awrite_base_hotel_summary(
+    hotel_id: str, fingerprint: str, reviews: List[HotelReview], summary: List[str]
+):
+    astra_db_client = get_async_astra_db_client()
+    hotels_col = await astra_db_client.collection(HOTELS_COLLECTION_NAME)
+
+    await hotels_col.find_one_and_update(
+        **_base_summary_update(hotel_id, fingerprint, reviews, summary),
+    )
+
+
+# Regenerates the stored summary if the selected reviews have changed
+# (or unconditionally if forced). Returns whether the LLM was called.
+# Used by the batch precompute script.
+def refresh_base_hotel_summary(hotel_id: str, force: bool = False) -> bool:
+    hotel_reviews = select_general_hotel_reviews(hotel_id)
+    fingerprint = compute_review_fingerprint(hotel_reviews)
+
+    if not force:
+        stored = read_base_hotel_summary(hotel_id)
+        if stored is not None and stored["fingerprint"] == fingerprint:
+            return False
+
+    summary = summarize_reviews_for_hotel(hotel_reviews)
+    write_base_hotel_summary(hotel_id, fingerprint, hotel_reviews, summary)
+    return True
+
+
+# Async version of the above, run as a background task after a review is added
+async def arefresh_base_hotel_summary(hotel_id: str, force: bool = False) -> bool:
+    hotel_reviews = await aselect_general_hotel_reviews(hotel_id)
+    fingerprint = compute_review_fingerprint(hotel_reviews)
+
+    if not force:
+        stored = await aread_base_hotel_summary(hotel_id)
+        if stored is not None and stored["fingerprint"] == fingerprint:
+            return False
+
+    summary = await asummarize_reviews_for_hotel(hotel_reviews)
+    await awrite_base_hotel_summary(hotel_id, fingerprint, hotel_reviews, summary)
+    return True
+
+
+# Generates (and stores) the summary for the given reviews: used by the base summary endpoint
+# when nothing is stored yet for the hotel (subsequent requests are then served from the store).
+async def agenerate_base_hotel_summary(hotel_id: str, hotel_reviews: List[HotelReview]) -> List[str]:
+    summary = await asummarize_reviews_for_hotel(hotel_reviews)
+    await awrite_base_hotel_summary(
+        hotel_id, compute_review_fingerprint(hotel_reviews), hotel_reviews, summary
+    )
+    return summary
+
+
+# Streaming version of the above, yielding one bullet point at a time
+# (the summary is stored once complete)
+async def astream_generate_base_hotel_summary(hotel_id: str, hotel_reviews: List[HotelReview]) -> AsyncIterator[str]:
+    summary = []
+    async for bullet_point in astream_summarize_reviews_for_hotel(hotel_reviews):
+        summary.append(bullet_point)
+        yield bullet_point
+    await awrite_base_hotel_summary(
+        hotel_id, compute_review_fingerprint(hotel_reviews), hotel_reviews, summary
+    )
@@ -1,32 +1,40 @@
 import json
-from typing import Union
+from typing import List, Optional, Tuple, Union
 
-from langchain.prompts import PromptTemplate
-from langchain.chains.summarize import load_summarize_chain
-from langchain.docstore.document import Document
-
-from utils.db import get_astra_db_client
+from utils.db import get_astra_db_client, get_async_astra_db_client
 from common_constants import USERS_COLLECTION_NAME
 
 from utils.models import UserProfile
-from utils.ai import get_llm
+from utils.ai import get_llm, get_embeddings
+from utils.review_llm import _arun_summarize_chain
+from utils.strings import DEFAULT_TRAVEL_PROFILE_SUMMARY
+from utils.vector_codec import encode_vector, decode_vector
+from utils.instrumentation import timed
 
 
-def read_user_profile(user_id) -> Union[UserProfile, None]:
-    astra_db_client = get_astra_db_client()
-    users_col = astra_db_client.collection(USERS_COLLECTION_NAME)
+_user_profile_projection = {
+    "base_preferences": 1,
+    "additional_preferences": 1,
+    "travel_profile_summary": 1,
+}
+
+# The embedding vector of the travel profile summary is computed once, when the
+# summary is generated, and stored alongside it for use in the review ANN search.
+# It is stored as a compact (float16) string since this non-vector collection
+# would not accept a 1536-element array.
+TRAVEL_PROFILE_VECTOR_FIELD = "travel_profile_vector"
+_TRAVEL_PROFILE_VECTOR_FORMAT = "e"
+
+_user_profile_with_vector_projection = {
+    **_user_profile_projection,
+    TRAVEL_PROFILE_VECTOR_FIELD: 1,
+}
+
+# vector for DEFAULT_TRAVEL_PROFILE_SUMMARY, computed once per process
+default_travel_profile_vector = None
 
-    user_doc = users_col.find_one(
-        filter={
-            "_id": user_id,
-        },
-        projection={
-            "base_preferences": 1,
-            "additional_preferences": 1,
-            "travel_profile_summary": 1,
-        },
-    )["data"]["document"]
 
+def _user_doc_to_profile(user_doc) -> Union[UserProfile, None]:
     if user_doc:
         profile = UserProfile(
             base_preferences=json.loads(user_doc["base_preferences"]),
@@ -38,25 +46,113 @@ def read_user_profile(user_id) -> Union[UserProfile, None]:
         return None
 
 
-def write_user_profile(user_id, user_profile):
+def _user_doc_to_profile_vector(user_doc) -> Optional[List[float]]:
+    if user_doc and user_doc.get(TRAVEL_PROFILE_VECTOR_FIELD):
+        return decode_vector(user_doc[TRAVEL_PROFILE_VECTOR_FIELD], _TRAVEL_PROFILE_VECTOR_FORMAT)
+    else:
+        return None
+
+
+def _user_profile_document(user_id, user_profile):
+    return {
+        "_id": user_id,
+        "base_preferences": json.dumps(user_profile.base_preferences),
+        "additional_preferences": user_profile.additional_preferences,
+    }
+
+
+@timed("users.read_profile")
+def read_user_profile(user_id) -> Union[UserProfile, None]:
     astra_db_client = get_astra_db_client()
     users_col = astra_db_client.collection(USERS_COLLECTION_NAME)
 
-    users_col.upsert(
-        {
+    user_doc = users_col.find_one(
+        filter={
             "_id": user_id,
-            "base_preferences": json.dumps(user_profile.base_preferences),
-            "additional_preferences": user_profile.additional_preferences,
-        }
-    )
+        },
+        projection=_user_profile_projection,
+    )["data"]["document"]
 
+    return _user_doc_to_profile(user_doc)
 
-# def update_user_desc(user_id, base_preferences, additional_preferences):
-def update_user_travel_profile_summary(user_id, user_profile):
-    print("Updating automated travel preferences for user ", user_id)
 
-    summarizing_llm = get_llm()
+@timed("users.read_profile")
+async def aread_user_profile(user_id) -> Union[UserProfile, None]:
+    astra_db_client = get_async_astra_db_client()
+    users_col = await astra_db_client.collection(USERS_COLLECTION_NAME)
+
+    user_doc = (await users_col.find_one(
+        filter={
+            "_id": user_id,
+        },
+        projection=_user_profile_projection,
+    ))["data"]["document"]
+
+    return _user_doc_to_profile(user_doc)
+
+
+# As read_user_profile, but also returning the stored travel profile vector (None if not available)
+@timed("users.read_profile")
+def read_user_profile_with_vector(user_id) -> Tuple[Union[UserProfile, None], Optional[List[float]]]:
+    astra_db_client = get_astra_db_client()
+    users_col = astra_db_client.collection(USERS_COLLECTION_NAME)
 
+    user_doc = users_col.find_one(
+        filter={
+            "_id": user_id,
+        },
+        projection=_user_profile_with_vector_projection,
+    )["data"]["document"]
+
+    return _user_doc_to_profile(user_doc), _user_doc_to_profile_vector(user_doc)
+
+
+@timed("users.read_profile")
+async def aread_user_profile_with_vector(user_id) -> Tuple[Union[UserProfile, None], Optional[List[float]]]:
+    astra_db_client = get_async_astra_db_client()
+    users_col = await astra_db_client.collection(USERS_COLLECTION_NAME)
+
+    user_doc = (await users_col.find_one(
+        filter={
+            "_id": user_id,
+        },
+        projection=_user_profile_with_vector_projection,
+    ))["data"]["document"]
+
+    return _user_doc_to_profile(user_doc), _user_doc_to_profile_vector(user_doc)
+
+
+@timed("users.default_profile_vector")
+async def aget_default_travel_profile_vector() -> List[float]:
+    global default_travel_profile_vector
+    if default_travel_profile_vector is None:
+        default_travel_profile_vector = await get_embeddings().aembed_query(DEFAULT_TRAVEL_PROFILE_SUMMARY)
+    return default_travel_profile_vector
+
+
+# For the profiles stored without a vector (written before vectors were stored)
+@timed("users.embed_profile")
+async def aembed_travel_profile_summary(travel_profile_summary: str) -> List[float]:
+    return await get_embeddings().aembed_query(travel_profile_summary)
+
+
+@timed("users.write_profile")
+def write_user_profile(user_id, user_profile):
+    astra_db_client = get_astra_db_client()
+    users_col = astra_db_client.collection(USERS_COLLECTION_NAME)
+
+    users_col.upsert(_user_profile_document(user_id, user_profile))
+
+
+@timed("users.write_profile")
+async def awrite_user_profile(user_id, user_profile):
+    astra_db_client = get_async_astra_db_client()
+    users_col = await astra_db_client.collection(USERS_COLLECTION_NAME)
+
+    await users_col.upsert(_user_profile_document(user_id, user_profile))
+
+
+def _travel_profile_summary_prompt(user_profile) -> str:
     # leave out the prefs that are false, instead of having them as no
     #     base_profile = ", ".join(
     #         "%s=%s" % (k.upper(), "yes" if v else "no") for k, v in base_preferences.items()
@@ -92,13 +188,42 @@ def update_user_travel_profile_summary(user_id, user_profile):
     CONCISE SUMMARY:
     """
 
+    from langchain.prompts import PromptTemplate
     query_prompt_template = PromptTemplate.from_template(prompt_template)
     populated_prompt = query_prompt_template.format(travel_prefs=travel_preferences)
     print("Travel profile summary prompt:\n", populated_prompt)
 
+    return populated_prompt
+
+
+def _travel_profile_summary_update(user_id, travel_profile_summary, travel_profile_vector):
+    return {
+        "filter": {
+            "_id": user_id
+        },
+        "update": {
+            "$set": {
+                "travel_profile_summary": travel_profile_summary,
+                TRAVEL_PROFILE_VECTOR_FIELD: encode_vector(travel_profile_vector, _TRAVEL_PROFILE_VECTOR_FORMAT),
+            },
+        },
+    }
+
+
+# def update_user_desc(user_id, base_preferences, additional_preferences):
+@timed("users.update_travel_profile_summary")
+def update_user_travel_profile_summary(user_id, user_profile):
+    print("Updating automated travel preferences for user ", user_id)
+
+    summarizing_llm = get_llm()
+    populated_prompt = _travel_profile_summary_prompt(user_profile)
+
+    from langchain.chains.summarize import load_summarize_chain
+    from langchain.docstore.document import Document
     chain = load_summarize_chain(llm=summarizing_llm, chain_type="stuff")
     docs = [Document(page_content=populated_prompt)]
     travel_profile_summary = chain.run(docs)
+    travel_profile_vector = get_embeddings().embed_query(travel_profile_summary)
 
     print("Travel profile summary:\n", travel_profile_summary)
 
@@ -107,12 +232,26 @@ def update_user_travel_profile_summary(user_id, user_profile):
     users_col = astra_db_client.collection(USERS_COLLECTION_NAME)
 
     users_col.find_one_and_update(
-        filter={
-            "_id": user_id
-        },
-        update={
-            "$set": {
-                "travel_profile_summary": travel_profile_summary,
-            },
-        },
+        **_travel_profile_summary_update(user_id, travel_profile_summary, travel_profile_vector),
+    )
+
+
+@timed("users.update_travel_profile_summary")
+async def aupdate_user_travel_profile_summary(user_id, user_profile):
+    print("Updating automated travel preferences for user ", user_id)
+
+    populated_prompt = _travel_profile_summary_prompt(user_profile)
+
+    # (same chain as above, with the LLM cache looked up and updated off the event loop)
+    travel_profile_summary = await _arun_summarize_chain(populated_prompt)
+    travel_profile_vector = await get_embeddings().aembed_query(travel_profile_summary)
+
+    print("Travel profile summary:\n", travel_profile_summary)
+
+    # write:
+    astra_db_client = get_async_astra_db_client()
+    users_col = await astra_db_client.collection(USERS_COLLECTION_NAME)
+
+    await users_col.find_one_and_update(
+        **_travel_profile_summary_update(user_id, travel_profile_summary, travel_profile_vector),
     )
@@ -0,0 +1,26 @@
+import struct
+import base64
+from typing import List, Sequence
+
+
+# Compact string encoding of embedding vectors: packed floats, base64-encoded.
+# "f" is float32; "e" (float16) halves the size again, at a precision
+# still more than adequate for similarity search.
+
+def encode_vector(vector: Sequence[float], float_format: str = "f") -> str:
+    byte_buf = struct.pack("%i%s" % (len(vector), float_format), *vector)
+    return base64.b64encode(byte_buf).decode()
+
+
+def decode_vector(encoded_vector: str, float_format: str = "f") -> List[float]:
+    byte_buf = base64.b64decode(encoded_vector)
+    num_floats = len(byte_buf) // struct.calcsize(float_format)
+    return list(struct.unpack("%i%s" % (num_floats, float_format), byte_buf))
+
+
+# Same decoding, as a read-only NumPy array (no Python float object is created)
+# (NumPy is imported on first use: the API decodes vectors with the above)
+def decode_vector_array(encoded_vector: str, float_format: str = "f"):
+    import numpy as np
+    dtype = np.float16 if float_format == "e" else np.float32
+    return np.frombuffer(base64.b64decode(encoded_vector), dtype=dtype)
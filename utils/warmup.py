@@ -0,0 +1,89 @@
+"""Warm-up of the API process: what the first requests would otherwise pay for"""
+import asyncio
+import time
+from typing import Dict
+
+import utils.ai as ai
+from utils.ai import get_embeddings, get_llm
+from utils.db import get_astra_db_client, get_async_astra_db_client
+from utils.instrumentation import span
+from utils.users import aget_default_travel_profile_vector
+
+
+# Each step is timed (duration in seconds in the returned dict, also recorded
+# as a "warmup.<step>" span). The sync steps run in a worker thread.
+
+def _preload_langchain():
+    # the modules imported on the request path (see utils/review_llm.py)
+    from langchain.chains.summarize import load_summarize_chain  # noqa: F401
+    from langchain.docstore.document import Document  # noqa: F401
+    from langchain.llms.base import get_prompts  # noqa: F401
+    from langchain.prompts import PromptTemplate  # noqa: F401
+
+
+def _connect_primary_db():
+    get_astra_db_client().get_collections()
+
+
+def _set_up_remote_llm_cache():
+    if ai.two_tier_llm_cache is not None:
+        # (creating it sets up the cache collection on the alternate database)
+        _ = ai.two_tier_llm_cache.remote_cache
+
+
+async def _aconnect_primary_db():
+    await get_async_astra_db_client().get_collections()
+
+
+SYNC_WARMUP_STEPS = {
+    "langchain": _preload_langchain,
+    "llm": get_llm,
+    "embeddings": get_embeddings,
+    "db": _connect_primary_db,
+    "llm_cache": _set_up_remote_llm_cache,
+}
+
+ASYNC_WARMUP_STEPS = {
+    "async_db": _aconnect_primary_db,
+    "default_profile_vector": aget_default_travel_profile_vector,
+}
+
+
+def _run_sync_steps(raise_errors: bool) -> Dict[str, float]:
+    step_timings = {}
+    for step_name, step_func in SYNC_WARMUP_STEPS.items():
+        step_start = time.perf_counter()
+        try:
+            with span(f"warmup.{step_name}"):
+                step_func()
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"[warmup] Step '{step_name}' failed: {e}")
+        step_timings[step_name] = time.perf_counter() - step_start
+    return step_timings
+
+
+# With raise_errors False, a failing step is reported and skipped
+# (whatever it should have prepared is then set up on first use instead).
+async def awarm_up(raise_errors: bool = False) -> Dict[str, float]:
+    loop = asyncio.get_running_loop()
+    step_timings = await loop.run_in_executor(None, _run_sync_steps, raise_errors)
+    for step_name, step_func in ASYNC_WARMUP_STEPS.items():
+        step_start = time.perf_counter()
+        try:
+            with span(f"warmup.{step_name}"):
+                await step_func()
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"[warmup] Step '{step_name}' failed: {e}")
+        step_timings[step_name] = time.perf_counter() - step_start
+    return step_timings
+
+
+def format_step_timings(step_timings: Dict[str, float]) -> str:
+    return ", ".join(
+        f"{step_name}={duration * 1000:.1f}ms"
+        for step_name, duration in step_timings.items()
+    )